@@ -4,16 +4,28 @@ import streamlit as st
 import database as db
 import time
 import cv2
+import numpy as np
 import os
-import tempfile
+import uuid
 
 # Import functions from modules
-from audio_utils import play_audio, listen_for_voice, match_command
-from voice_auth import (
-    welcome_state, reg_name_state, reg_email_state, reg_user_state, reg_pass_state,
-    login_user_state, login_pass_state
+from audio_utils import play_audio, poll_command
+from intents import route, state_phrases
+from voice_flow import FLOW, register_states, run_state
+import voice_auth  # registers the welcome, registration and login states
+from vision_core import load_model, extract_yolov8_data, feedback_cue
+from earcons import EarconPlayer
+from video_export import AnalysisExporter
+from resolution_scheduler import ResolutionScheduler
+from scene_index import SceneIndex, remove_index
+from profiling import AnalysisProfiler, profile_mode
+from roi_inference import CorridorDetector
+from hazard_stats import HazardStats
+from memory_budget import (
+    save_upload, cleanup_stale_videos, touch_video, UploadTooLarge, RssTracker,
+    ANALYSIS_RUN_FRAMES, RSS_SAMPLE_FRAMES
 )
-from vision_core import load_model, extract_yolov8_data, generate_feedback
+import tracing
 
 # --- Streamlit Setup and Styling ---
 st.set_page_config(
@@ -49,6 +61,19 @@ if 'tmp' not in st.session_state:
     st.session_state.tmp = {}
 if 'audio_enabled' not in st.session_state:
     st.session_state.audio_enabled = True
+if 'earcon_mode' not in st.session_state:
+    st.session_state.earcon_mode = False
+if 'export_enabled' not in st.session_state:
+    st.session_state.export_enabled = False
+if 'exporter' not in st.session_state:
+    st.session_state.exporter = None  # kept across reruns until the analysis ends
+if 'roi_enabled' not in st.session_state:
+    # Experimental: off until roi_inference.py compare output shows it is faster without losing hazards
+    st.session_state.roi_enabled = False
+if 'profile_enabled' not in st.session_state:
+    st.session_state.profile_enabled = False
+if 'trace_session' not in st.session_state:
+    st.session_state.trace_session = uuid.uuid4().hex[:8]  # tags tracing spans
    
 # --- NEW VARIABLES FOR PAUSE/RESUME ---
 if 'is_paused' not in st.session_state:
@@ -59,49 +84,81 @@ if 'last_frame_index' not in st.session_state:
 
 db.init_db()
 
+# --- Resume a previous login from the signed token kept in the URL ---
+if st.session_state.state == "welcome" and not st.session_state.get("resume_checked"):
+    st.session_state.resume_checked = True
+    resumed = db.resume_session(st.query_params.get("session"))
+    if resumed:
+        st.query_params["session"] = resumed["token"]  # the old token was revoked (see db.SESSION_TTL_HOURS)
+        st.session_state.tmp = {"username": resumed["username"], "name": resumed["name"]}
+        st.session_state.state = "home"
+
 # ==================== HOME STATE (Final Voice Flow) ====================
 
+def end_session():
+    db.revoke_session(st.query_params.get("session"))
+    st.query_params.pop("session", None)
+
+register_states({
+    "home": {
+        "ui": [
+            ("title-box", "Welcome Home, {name_title}"),
+            ("success-box", " Logged in as: {name_title}"),
+            ("instruction-box", 'Say "Analyze Video" to process a file.<br>Say "Logout" to sign out.'),
+        ],
+        "prompt": "Welcome {name}. Say Analyze Video to process a file, or say Logout to sign out.",
+        "listen": "command",
+        "intents": {
+            "analyze_video": {"say": "Proceeding to video analysis.", "next": "upload_video", "pause": 2},
+            "logout": {"say": "Logging out. Shutting down Visionmate. See you next time!",
+                       "run": end_session, "next": "welcome", "tmp": "reset", "pause": 2},
+        },
+        "no_match": {"say": "Sorry, I couldn't understand. Please say Analyze Video or Logout.", "pause": 4},
+        # Rerun to keep listening if no command was received
+        "no_input": {},
+    },
+})
+
 def home_state():
-    name = st.session_state.tmp.get("name", "User")
-    st.markdown(f'<div class="title-box">Welcome Home, {name.title()}</div>', unsafe_allow_html=True)
-    st.markdown(f'<div class="success-box"> Logged in as: {name.title()}</div>', unsafe_allow_html=True)
-   
-    # Visual instruction
-    st.markdown('<div class="instruction-box">Say "Analyze Video" to process a file.<br>Say "Logout" to sign out.</div>', unsafe_allow_html=True)
+    st.session_state.tmp.setdefault("name", "User")
+    run_state("home")
 
-    # Audio instruction (Complete and clear)
-    play_audio(f"Welcome {name}. Say Analyze Video to process a file, or say Logout to sign out.")
+# ==================== SCENE NAVIGATION ====================
 
-    # Listen for voice command
-    cmd = listen_for_voice(wait_before_listen=4)
-   
-    if cmd:
-        cmd_lower = cmd.lower()
-       
-        # --- FIX: Added "analyse video" for robust command matching ---
-        if match_command(cmd_lower, [
-            "analyze video",
-            "analyse video",
-            "upload video",
-            "process file"
-        ]):
-            play_audio("Proceeding to video analysis.")
-            st.session_state.state = "upload_video"
-           
-        elif match_command(cmd_lower, ["logout", "sign out", "log out", "stop"]):
-            play_audio("Logging out. Shutting down Visionmate. See you next time!")
-            st.session_state.state = "welcome"
-            st.session_state.tmp = {}
-           
-        else:
-            play_audio("Sorry, I couldn't understand. Please say Analyze Video or Logout.")
-            time.sleep(2)
-       
-        time.sleep(2)
-        st.rerun()
+VOICE_POLL_FRAMES = 5  # check for a spoken command every few frames
+SCENE_REPLIES = {
+    "next_scene": ("Next scene.", "This is the last scene."),
+    "previous_scene": ("Going back.", "Going back."),
+    "skip_to_crossing": ("Skipping to the crossing.", "No crossing found in this video."),
+}
+
+# Per-video state in tmp, dropped when an analysis completes or is stopped so the
+# next upload starts with its own scene index and resolution scheduler
+VIDEO_STATE_KEYS = ("video_to_process", "video_name", "analysis_session_id", "analysis_seconds",
+                    "scene_index", "scheduler", "hazard_stats",
+                    "feedback_last", "logged_last", "situation_last")
+
+def clear_video_state():
+    for key in VIDEO_STATE_KEYS:
+        st.session_state.tmp.pop(key, None)
+
+def handle_scene_command(scene_index, frame_index):
+    """Seek target for a spoken navigation command, or None"""
+    result = poll_command(commands=state_phrases("video"))
+    if not result:
+        return None
+    intent, _ = route("video", result)
+    if intent == "next_scene":
+        target = scene_index.next_scene(frame_index)
+    elif intent == "previous_scene":
+        target = scene_index.previous_scene(frame_index)
+    elif intent == "skip_to_crossing":
+        target = scene_index.find("crossing", frame_index)
     else:
-        # Rerun to keep listening if no command was received
-        st.rerun()
+        return None
+    found, missing = SCENE_REPLIES[intent]
+    play_audio(found if target is not None else missing)
+    return target
 
 # ==================== UPLOAD VIDEO STATE (Manual Upload and Stable Flow) ====================
 
@@ -123,6 +180,12 @@ def upload_video_state():
     
     # 1. Audio Toggle
     st.session_state.audio_enabled = col1.checkbox("🔊 Audio Feedback", value=st.session_state.audio_enabled)
+    st.session_state.earcon_mode = col1.checkbox("🎵 Earcon Alerts", value=st.session_state.earcon_mode)
+    st.session_state.export_enabled = col1.checkbox("💾 Export Video & Subtitles", value=st.session_state.export_enabled)
+    st.session_state.roi_enabled = col1.checkbox("🎯 Corridor Focus (experimental)", value=st.session_state.roi_enabled,
+                                                 help="Detect at higher resolution in the walking path, lower at the edges. "
+                                                      "Speed and recall against full-frame inference are not measured yet.")
+    st.session_state.profile_enabled = col1.checkbox("🔬 Profile Analysis", value=st.session_state.profile_enabled)
 
     # 2. Stop Button (Sets a flag, cleanup happens outside the locked process)
     if col3.button("🔴 Stop & Home"):
@@ -147,16 +210,30 @@ def upload_video_state():
     if st.session_state.tmp['video_to_process'] is None:
         uploaded_file = st.file_uploader("Upload Video", type=['mp4', 'avi', 'mov'])
         if uploaded_file:
-            tfile = tempfile.NamedTemporaryFile(delete=False, suffix=uploaded_file.name)
-            tfile.write(uploaded_file.read())
-            tfile.close()
-            st.session_state.tmp['video_to_process'] = tfile.name
+            cleanup_stale_videos()
+            try:
+                video_path = save_upload(uploaded_file)
+            except UploadTooLarge as e:
+                st.markdown(f'<div class="error-box">{e}</div>', unsafe_allow_html=True)
+                play_audio("This video is too large. Please upload a shorter video.")
+                return
+            st.session_state.tmp['video_to_process'] = video_path
+            st.session_state.tmp['video_name'] = uploaded_file.name
             st.session_state.last_frame_index = 0
             st.rerun()
         return
 
     # --- PHASE 2: PROCESSING LOOP ---
     video_path = st.session_state.tmp['video_to_process']
+    
+    # Scene boundaries for voice navigation (built once, stored next to the video)
+    if st.session_state.tmp.get('scene_index') is None:
+        with st.spinner("Indexing scenes..."):
+            started = time.perf_counter()
+            st.session_state.tmp['scene_index'] = SceneIndex.load_or_build(video_path, model)
+        print(f"🎞️ {len(st.session_state.tmp['scene_index'].starts)} scenes indexed in {time.perf_counter() - started:.1f}s")
+    scene_index = st.session_state.tmp['scene_index']
+    st.markdown('<div class="instruction-box">Say "Next scene", "Go back" or "Skip to crossing".</div>', unsafe_allow_html=True)
     cap = cv2.VideoCapture(video_path)
     
     # CRITICAL: Jump to the last saved frame index
@@ -166,55 +243,195 @@ def upload_video_state():
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    
+    # One analysis_sessions row per uploaded video, kept across pause/resume reruns
+    if st.session_state.tmp.get('analysis_session_id') is None:
+        st.session_state.tmp['analysis_session_id'] = db.start_analysis_session(
+            st.session_state.tmp.get("username"),
+            st.session_state.tmp.get('video_name', os.path.basename(video_path)),
+            fps, total_frames
+        )
+        st.session_state.tmp['analysis_seconds'] = 0.0
+    session_id = st.session_state.tmp['analysis_session_id']
+    tracing.set_context(analysis_session=session_id)
+    event_log = db.FeedbackEventLog(session_id)
+    timing_log = db.FrameTimingLog(session_id)
+    run_started = time.perf_counter()
+    
+    # Input size per frame, adapted to the fps deadline (kept across reruns of this video)
+    if st.session_state.tmp.get('scheduler') is None:
+        st.session_state.tmp['scheduler'] = ResolutionScheduler()
+    scheduler = st.session_state.tmp['scheduler']
+    
+    # Per-class hazard statistics, updated every frame for the end-of-run summary
+    if st.session_state.tmp.get('hazard_stats') is None:
+        st.session_state.tmp['hazard_stats'] = HazardStats(model.names, fps, frame_height)
+    hazard_stats = st.session_state.tmp['hazard_stats']
+    
+    # Corridor focus (experimental): the walking path at higher resolution plus the full frame
+    # at half size, in two model calls per frame
+    detector = CorridorDetector(model) if st.session_state.roi_enabled else model
     
     FRAME_WINDOW = st.empty()
     feedback_placeholder = st.empty()
     progress_bar = st.progress(0)
     
-    feedback_last = ""
+    # Last spoken/logged situation, kept across the bounded runs of one video so
+    # a new run does not repeat the current message or log it again
+    feedback_last = st.session_state.tmp.get('feedback_last', "")
+    logged_last = st.session_state.tmp.get('logged_last', "")
+    situation_last = st.session_state.tmp.get('situation_last')
+    earcons = EarconPlayer()
+    
+    # Annotated video + subtitles are written by a background thread
+    if st.session_state.export_enabled and st.session_state.exporter is None:
+        st.session_state.exporter = AnalysisExporter(
+            st.session_state.tmp.get('video_name', video_path), fps, (frame_width, frame_height)
+        )
+    exporter = st.session_state.exporter
+    
+    # Streamlit keeps every image/audio element sent during a script run until
+    # the run ends, so analysis is split into bounded runs that resume from
+    # last_frame_index
+    rss = RssTracker()
+    frames_this_run = 0
+    # Slow frames are snapshotted to profiles/; a whole-run profile only when switched on
+    profiler = AnalysisProfiler(profile_mode(st.session_state.profile_enabled))
+    continue_in_new_run = False
     
     # Only run the loop if not paused and not stopped
-    if not st.session_state.is_paused and not st.session_state.stop_triggered:
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret: 
-                break # Video ended
+    # (Streamlit interrupts it on reruns, so buffered events are flushed in finally)
+    try:
+        if not st.session_state.is_paused and not st.session_state.stop_triggered:
+            profiler.start()
+            while cap.isOpened():
+                frame_started = time.perf_counter()
+                ret, frame = cap.read()
+                if not ret: 
+                    break # Video ended
+            
+                # Update current frame index
+                current_idx = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+                st.session_state.last_frame_index = current_idx
+                
+                # Voice navigation: seek straight to an indexed scene
+                if current_idx % VOICE_POLL_FRAMES == 0:
+                    target = handle_scene_command(scene_index, current_idx)
+                    if target is not None:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+                        st.session_state.last_frame_index = target
+                        if exporter is not None:
+                            exporter.seek()  # new segment in the export, not a frozen gap
+                        feedback_last = logged_last = ""  # announce and log the new scene's situation
+                        situation_last = None
+                        continue
+
+                # UI Interruption Check (Streamlit reruns on interaction)
+                if st.session_state.is_paused or st.session_state.stop_triggered:
+                    break
+
+                # AI Detection Logic
+                imgsz, forced = scheduler.next_size()
+                with tracing.span("yolo.inference", "vision", frame=current_idx, imgsz=imgsz, roi=st.session_state.roi_enabled):
+                    img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    inference_started = time.perf_counter()
+                    results = detector(img, imgsz=imgsz)[0]
+                    inference_ms = (time.perf_counter() - inference_started) * 1000
+                    results_object, detections_array = extract_yolov8_data(results)
             
-            # Update current frame index
-            current_idx = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-            st.session_state.last_frame_index = current_idx
-
-            # UI Interruption Check (Streamlit reruns on interaction)
-            if st.session_state.is_paused or st.session_state.stop_triggered:
-                break
-
-            # AI Detection Logic
-            img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = model(img)[0]
-            results_object, detections_array = extract_yolov8_data(results)
+                # Display (JPEG keeps the per-frame media a fraction of PNG size)
+                annotated = results_object.plot()
+                FRAME_WINDOW.image(annotated, width=640, output_format="JPEG")
             
-            # Display
-            FRAME_WINDOW.image(results_object.plot(), width=640)
+                # Feedback
+                with tracing.span("feedback_cue", "vision", frame=current_idx):
+                    cue = feedback_cue(results_object, detections_array, frame_width, frame_height)
+                msg = cue["message"]
+                if detections_array is not None:
+                    for cls in np.unique(detections_array[:, 5]):
+                        scene_index.tag(current_idx, results_object.names[int(cls)])
+                if exporter is not None:
+                    exporter.add(current_idx, annotated, msg)
+                feedback_placeholder.markdown(f'<div class="status-box">🤖 {msg}</div>', unsafe_allow_html=True)
             
-            # Feedback
-            msg = generate_feedback(results_object, detections_array, frame_width, frame_height)
-            feedback_placeholder.markdown(f'<div class="status-box">🤖 {msg}</div>', unsafe_allow_html=True)
+                # Deadline accounting stops here: spoken announcements block the loop by design
+                frame_ms = (time.perf_counter() - frame_started) * 1000
+                missed = scheduler.observe(imgsz, inference_ms, frame_ms, cue)
+                timing_log.record(current_idx, imgsz, inference_ms, frame_ms, missed, forced)
+                profiler.frame_done(current_idx, frame_started, frame_ms, annotated, detections_array,
+                                    results_object.names, imgsz=imgsz, inference_ms=round(inference_ms, 1),
+                                    message=msg)
             
-            if msg != feedback_last and st.session_state.audio_enabled:
-                play_audio(msg)
-                feedback_last = msg
+                announced = False
+                if st.session_state.audio_enabled and st.session_state.earcon_mode:
+                    # Earcon every frame (rate-limited by proximity); speak only new situations
+                    earcons.update(cue)
+                    situation = (cue["category"], cue["label"])
+                    if situation != situation_last:
+                        play_audio(msg)
+                        announced = True
+                        situation_last = situation
+                    feedback_last = msg
+                elif msg != feedback_last and st.session_state.audio_enabled:
+                    play_audio(msg)
+                    announced = True
+                    feedback_last = msg
             
-            progress_bar.progress(current_idx / total_frames)
-            time.sleep(0.01)
+                # Log every change of feedback (buffered, written in the background)
+                hazard_stats.update(current_idx, detections_array, cue,
+                                    new_alert=msg != logged_last and cue["category"] in db.HAZARD_CATEGORIES)
+                if msg != logged_last:
+                    event_log.record(current_idx, current_idx / fps, cue, announced)
+                    logged_last = msg
+            
+                progress_bar.progress(current_idx / total_frames)
+                time.sleep(0.01)
+            
+                frames_this_run += 1
+                if frames_this_run % RSS_SAMPLE_FRAMES == 0:
+                    rss.sample()
+                    touch_video(video_path)
+                    if frames_this_run >= ANALYSIS_RUN_FRAMES or rss.over_budget():
+                        continue_in_new_run = True
+                        break
+    finally:
+        st.session_state.tmp.update(feedback_last=feedback_last, logged_last=logged_last,
+                                    situation_last=situation_last)
+        profiler.stop()
+        event_log.close()
+        timing_log.close()
+        scene_index.save_if_changed()
+        st.session_state.tmp['analysis_seconds'] += time.perf_counter() - run_started
+        if frames_this_run:
+            print(f"🧠 Analysis run of {frames_this_run} frames: {rss.summary()}")
+            print(f"📐 Input sizes: {scheduler.summary()}")
 
     # --- PHASE 3: CLEANUP & STATE TRANSITION ---
     cap.release() # RELEASE THE LOCK FIRST (Fixes WinError 32)
 
+    # Persist this run's progress
+    finished = st.session_state.last_frame_index >= total_frames - 1
+    status = "stopped" if st.session_state.stop_triggered else "completed" if finished else "running"
+    if session_id is not None:
+        db.update_analysis_session(session_id, st.session_state.last_frame_index,
+                                   st.session_state.tmp['analysis_seconds'], status)
+        if st.session_state.stop_triggered or finished:
+            db.save_hazard_stats(session_id, hazard_stats.rows())
+
+    # Finish the export when the analysis ends either way (a stopped run keeps what it has)
+    if exporter is not None and (st.session_state.stop_triggered or finished):
+        exported = exporter.close()
+        st.session_state.exporter = None
+    else:
+        exported = None
+
     # Handle Stop/Home Action
     if st.session_state.stop_triggered:
         if os.path.exists(video_path):
             os.remove(video_path)
-        st.session_state.tmp = {}
+        remove_index(video_path)
+        clear_video_state()
         st.session_state.state = "home"
         st.session_state.stop_triggered = False
         st.rerun()
@@ -223,46 +440,43 @@ def upload_video_state():
     if st.session_state.last_frame_index >= total_frames - 1:
         if os.path.exists(video_path):
             os.remove(video_path)
-        st.session_state.tmp['video_to_process'] = None
+        remove_index(video_path)
+        clear_video_state()
+        spoken, written = hazard_stats.summary()
         st.success("Analysis Complete!")
-        play_audio("Analysis complete.")
-        time.sleep(2)
+        st.markdown(written)
+        if exported:
+            st.markdown(f'<div class="success-box">💾 Saved {exported["video"]} with subtitles '
+                        f'({os.path.basename(exported["vtt"])}, {os.path.basename(exported["srt"])})</div>',
+                        unsafe_allow_html=True)
+            play_audio(spoken + " The annotated video and subtitles have been saved.")
+        else:
+            play_audio(spoken)
+        tracing.pause(2, "transition")
         st.session_state.state = "home"
         st.rerun()
 
+    # Budgeted run ended: start a fresh run, which resumes at last_frame_index
+    if continue_in_new_run:
+        st.rerun()
+
     # If paused, the script ends here and waits for the user to click "Resume"
 # ==================== MAIN APPLICATION RUNNER ====================
 def main():
     state = st.session_state.state
-   
-    # ----------------------------------------------------
-    # Check the state and run the corresponding function
-    # ----------------------------------------------------
-    if state == "welcome":
-        welcome_state()
-       
-    # --- Registration Flow ---
-    elif state == "reg_name":
-        reg_name_state()
-    elif state == "reg_email":
-        reg_email_state()
-    elif state == "reg_user":
-        reg_user_state()
-    elif state == "reg_pass":
-        reg_pass_state()
-       
-    # --- Login Flow ---
-    elif state == "login_user":
-        login_user_state()
-    elif state == "login_pass":
-        login_pass_state()
-       
+    tracing.set_context(state=state, session_id=st.session_state.trace_session)
+
+    # Voice states are declared as data (voice_auth.AUTH_FLOW and home above)
+    if state in FLOW:
+        if state == "home":
+            home_state()
+        else:
+            run_state(state)
+
     # --- Main Application Flow ---
-    elif state == "home":
-        home_state()
     elif state == "upload_video":
         upload_video_state()
-       
+
     # --- Fallback ---
     else:
         st.session_state.state = "welcome"
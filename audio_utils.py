@@ -8,6 +8,14 @@ import time
 import speech_recognition as sr
 import atexit
 import glob
+import difflib
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from voice_listener import BackgroundListener
+from speech_backends import recognize
+import tracing
 
 # Cleanup logic for temp files
 def cleanup_temp_files():
@@ -17,23 +25,83 @@ def cleanup_temp_files():
         except: pass
 atexit.register(cleanup_temp_files)
 
-# --- Reusable Audio Functions ---
+# --- Speech Synthesis Cache ---
+
+# Synthesized prompts are shared by every session in the process. Likely next
+# prompts are synthesized in the background so transitions play immediately.
+TTS_CACHE_SIZE = 256
+_tts_cache = OrderedDict()
+_tts_inflight = {}
+_tts_lock = threading.Lock()
+_tts_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="visionmate-tts")
+
+def _synthesize(text):
+    with tracing.span("tts.gtts", "tts", chars=len(text)):
+        buffer = io.BytesIO()
+        gTTS(text=text, lang='en', slow=False).write_to_fp(buffer)
+        return buffer.getvalue()
 
-def play_audio(text):
+def _synthesize_into_cache(text):
     try:
-        tts = gTTS(text=text, lang='en', slow=False)
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.mp3', prefix='tmpz')
-        file_path = temp_file.name
-        temp_file.close()
-        tts.save(file_path)
-        with open(file_path, 'rb') as f:
-            audio_bytes = f.read()
-        st.audio(audio_bytes, format='audio/mp3', autoplay=True)
-        words = len(text.split())
-        wait_time = max(3, words * 0.5)
-        time.sleep(wait_time)
-    except Exception as e:
-        print(f"Audio error: {e}")
+        audio_bytes = _synthesize(text)
+        with _tts_lock:
+            _tts_cache[text] = audio_bytes
+            while len(_tts_cache) > TTS_CACHE_SIZE:
+                _tts_cache.popitem(last=False)
+        return audio_bytes
+    finally:
+        with _tts_lock:
+            _tts_inflight.pop(text, None)
+
+def synthesize_speech(text):
+    """MP3 bytes for text: from the cache, a running prefetch, or gTTS now"""
+    with _tts_lock:
+        if text in _tts_cache:
+            _tts_cache.move_to_end(text)
+            return _tts_cache[text]
+        pending = _tts_inflight.get(text)
+    if pending is not None:
+        return pending.result()
+    return _synthesize_into_cache(text)
+
+def prefetch_speech(texts):
+    """Start background synthesis of prompts that are likely to be played next"""
+    with _tts_lock:
+        for text in texts:
+            if text and text not in _tts_cache and text not in _tts_inflight:
+                _tts_inflight[text] = _tts_executor.submit(_synthesize_into_cache, text)
+
+# --- Reusable Audio Functions ---
+
+def play_audio(text, interruptible=False):
+    """
+    Speak text in the browser. Interruptible prompts stop as soon as the user
+    starts talking (barge-in) and return True; the speech stays queued for the
+    next listen_for_voice call.
+    """
+    with tracing.span("play_audio", "voice", chars=len(text), interruptible=interruptible) as sp:
+        try:
+            audio_bytes = synthesize_speech(text)
+            player = st.empty()
+            player.audio(audio_bytes, format='audio/mp3', autoplay=True)
+            words = len(text.split())
+            wait_time = max(3, words * 0.5)
+            if not interruptible:
+                tracing.pause(wait_time, "playback")
+                return False
+            
+            listener = get_listener()
+            listener.begin_prompt(text, wait_time)
+            with tracing.span("playback", "sleep", seconds=wait_time):
+                barged_in = listener.wait_for_speech(wait_time)
+            if barged_in:
+                sp.tag(barge_in=True)
+                listener.end_prompt()
+                player.empty()  # removing the player stops playback
+                return True
+        except Exception as e:
+            print(f"Audio error: {e}")
+        return False
 
 def show_countdown(seconds):
     cd = st.empty()
@@ -42,69 +110,117 @@ def show_countdown(seconds):
         time.sleep(1)
     cd.empty()
 
-def listen_for_voice(wait_before_listen=3):
-    st.markdown('<div class="waiting-box">Preparing to record...</div>', unsafe_allow_html=True)
-    show_countdown(wait_before_listen)
-    
+# One listener per server process: the microphone is opened and calibrated once,
+# then every state reads utterances from its queue.
+@st.cache_resource
+def get_listener():
+    return BackgroundListener().start()
+
+def is_prompt_echo(text, prompt_text):
+    """
+    True when a transcript captured during a prompt is just the prompt coming
+    back through the microphone. Short commands are never treated as echo,
+    even though prompts mention them ("Say Register or Login").
+    """
+    if not prompt_text:
+        return False
+    heard = text.lower().split()
+    if len(heard) < 3:
+        return False
+    spoken = prompt_text.lower().replace(".", " ").replace(",", " ").split()
+    matcher = difflib.SequenceMatcher(None, heard, spoken)
+    overlap = sum(block.size for block in matcher.get_matching_blocks())
+    return overlap / len(heard) >= 0.8
+
+def listen_for_voice(timeout=25, commands=None):
+    """Listen for one utterance and return its best transcript ("" on failure)"""
+    result = listen_for_command(commands, timeout=timeout)
+    return result["text"] if result else ""
+
+@tracing.traced("listen", "voice")
+def listen_for_command(commands=None, timeout=25):
+    """
+    Listen for one utterance and return the full recognition result
+    (text, confidence, n-best alternatives), or None on failure.
+    Passing the accepted command phrases enables offline grammar decoding.
+    """
     listening_msg = st.empty()
-    listening_msg.markdown('<div class="listening-box">🎤 LISTENING NOW... SPEAK CLEARLY AND LOUDLY</div>', unsafe_allow_html=True)
+    listening_msg.markdown('<div class="listening-box">🔴 LISTENING... SPEAK NOW!</div>', unsafe_allow_html=True)
     
     try:
-        recognizer = sr.Recognizer()
+        listener = get_listener()
+        if not listener.is_running():
+            raise RuntimeError(f"Microphone unavailable: {listener.error}")
         
-        recognizer.energy_threshold = 300
-        recognizer.dynamic_energy_threshold = True
-        recognizer.pause_threshold = 0.8
+        # Speech from before the current prompt answered an earlier question;
+        # anything said over the prompt itself (barge-in) is kept
+        listener.discard_before(listener.prompt_started_at)
+        deadline = time.monotonic() + timeout
         
-        with sr.Microphone() as source:
-            st.info("🎧 Calibrating microphone... Please wait (3 seconds)...")
-            recognizer.adjust_for_ambient_noise(source, duration=3)
-            st.success(f" Ready! Energy level: {recognizer.energy_threshold}")
-            
-            listening_msg.markdown('<div class="listening-box">🔴 RECORDING... SPEAK NOW!</div>', unsafe_allow_html=True)
-            
-            try:
-                audio = recognizer.listen(source, timeout=25, phrase_time_limit=20)
+        try:
+            while True:
+                with tracing.span("listen.wait", "voice"):
+                    audio = listener.get_utterance(timeout=max(0, deadline - time.monotonic()))
+                if audio is None:
+                    raise sr.WaitTimeoutError("listening timed out while waiting for phrase to start")
                 listening_msg.markdown('<div class="waiting-box"> Processing speech...</div>', unsafe_allow_html=True)
                 
-                text = recognizer.recognize_google(audio)
-                listening_msg.empty()
-                st.markdown(f'<div class="success-box"> You said: {text}</div>', unsafe_allow_html=True)
-                play_audio(f"You said {text}")
-                time.sleep(1)
-                return text.strip()
-                
-            except sr.WaitTimeoutError:
-                listening_msg.empty()
-                st.markdown('<div class="error-box"> No speech detected within time limit</div>', unsafe_allow_html=True)
-                play_audio("I did not hear any speech. Please speak louder and closer to your microphone.")
-                time.sleep(3)
-                return ""
-                
-            except sr.UnknownValueError:
-                listening_msg.empty()
-                st.markdown('<div class="error-box"> Could not understand your voice</div>', unsafe_allow_html=True)
-                play_audio("Sorry, I could not understand what you said. Please speak more clearly, slowly, and loudly.")
-                time.sleep(3)
-                return ""
-                
-            except (sr.RequestError, OSError, Exception) as e:
-                listening_msg.empty()
-                st.markdown(f'<div class="error-box"> Error: {str(e)}</div>', unsafe_allow_html=True)
-                play_audio(f"An error occurred. {str(e)}")
-                time.sleep(3)
-                return ""
+                result = recognize(audio, commands)
+                if not is_prompt_echo(result["text"], audio.prompt_text):
+                    break
+                print(f"🔇 Ignored prompt echo: '{result['text']}'")
+            text = result["text"]
+            print(f"🎤 [{result['backend']}] '{text}' ({result['confidence']:.2f}, {result['latency_ms']:.0f} ms)")
+            listening_msg.empty()
+            st.markdown(f'<div class="success-box"> You said: {text}</div>', unsafe_allow_html=True)
+            play_audio(f"You said {text}")
+            tracing.pause(1, "confirmation")
+            return result
+            
+        except sr.WaitTimeoutError:
+            listening_msg.empty()
+            st.markdown('<div class="error-box"> No speech detected within time limit</div>', unsafe_allow_html=True)
+            play_audio("I did not hear any speech. Please speak louder and closer to your microphone.")
+            tracing.pause(3, "error")
+            return None
+            
+        except sr.UnknownValueError:
+            listening_msg.empty()
+            st.markdown('<div class="error-box"> Could not understand your voice</div>', unsafe_allow_html=True)
+            play_audio("Sorry, I could not understand what you said. Please speak more clearly, slowly, and loudly.")
+            tracing.pause(3, "error")
+            return None
+            
+        except (sr.RequestError, OSError, Exception) as e:
+            listening_msg.empty()
+            st.markdown(f'<div class="error-box"> Error: {str(e)}</div>', unsafe_allow_html=True)
+            play_audio(f"An error occurred. {str(e)}")
+            tracing.pause(3, "error")
+            return None
                 
     except Exception as e:
         listening_msg.empty()
         st.markdown(f'<div class="error-box"> Fatal Error: {str(e)}</div>', unsafe_allow_html=True)
         play_audio(f"A fatal error occurred. {str(e)}")
-        time.sleep(3)
-        return ""
-
-def match_command(text, keywords):
-    if not text: return False
-    text_lower = text.lower()
-    if isinstance(keywords, list):
-        return any(keyword.lower() in text_lower for keyword in keywords)
-    return keywords.lower() in text_lower
\ No newline at end of file
+        tracing.pause(3, "error")
+        return None
+
+def poll_command(commands=None):
+    """
+    Non-blocking: recognise the oldest utterance already captured by the
+    background listener, or return None if nothing has been said. Lets the
+    analysis loop accept voice commands without stopping to listen.
+    """
+    listener = get_listener()
+    if not listener.is_running():
+        return None
+    audio = listener.get_utterance(timeout=0)
+    if audio is None:
+        return None
+    try:
+        result = recognize(audio, commands)
+    except (sr.UnknownValueError, sr.RequestError, OSError) as e:
+        print(f"🎤 Command not recognised: {e}")
+        return None
+    print(f"🎤 [{result['backend']}] '{result['text']}' ({result['confidence']:.2f})")
+    return result
@@ -0,0 +1,345 @@
+# batch_daemon.py - WATCH-FOLDER BATCH ANALYSIS
+#
+# Usage:
+#   python batch_daemon.py watch /srv/walks [--jobs 2] [--cpus 4] [--nice 10] [--out batch_results]
+#   python batch_daemon.py status
+#   python batch_daemon.py retry 12
+#
+# Videos dropped into the watched folder are queued in visionmate_jobs.db (next
+# to visionmate.db) once their size has stopped changing, then analysed without
+# the UI: YOLO, feedback_cue and the feedback event log, exactly as the app
+# does. Each video gets an analysis_sessions row and <out>/<video>_<job>.json with
+# its summary and hazard timeline. Progress is checkpointed every
+# CHECKPOINT_FRAMES frames; after a restart interrupted jobs continue from
+# their last checkpoint.
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import datetime
+import importlib
+import multiprocessing as mp
+import database as db
+
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+POLL_SECONDS = 5.0          # how often the folder is scanned
+SETTLE_SECONDS = 10.0       # a file must be unchanged this long before it is queued (still copying)
+CHECKPOINT_FRAMES = 300     # frames between progress checkpoints
+MAX_ATTEMPTS = 3            # a job that crashes its worker this often is marked failed (daemon restarts don't count)
+RESULTS_DIR = "batch_results"
+BATCH_USERNAME = "batch"    # analysis_sessions.username of batch analyses
+DEFAULT_MODEL = "vision_core:load_model"
+
+def jobs_db_path():
+    return os.path.join(os.path.dirname(os.path.abspath(db.DB_FILE)), "visionmate_jobs.db")
+
+# --- Job Queue ---
+
+JOBS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        path TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        analysis_session_id INTEGER,
+        checkpoint_frame INTEGER NOT NULL DEFAULT 0,
+        total_frames INTEGER,
+        processing_seconds REAL NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        error TEXT,
+        result_path TEXT,
+        queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP,
+        UNIQUE (path, size, mtime)
+    )
+'''
+
+class JobQueue:
+    """Persistent job table; status is queued -> running -> done | failed"""
+
+    def __init__(self, path=None):
+        self.pool = db.ConnectionPool(path or jobs_db_path(), size=2)
+        with self.pool.connection() as conn:
+            conn.execute(JOBS_SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)")
+
+    def enqueue(self, path, size, mtime):
+        """Queue a video; False if this exact file (path, size, mtime) was seen before"""
+        with self.pool.connection() as conn:
+            c = conn.execute("INSERT OR IGNORE INTO jobs (path, size, mtime) VALUES (?, ?, ?)", (path, size, mtime))
+        return c.rowcount == 1
+
+    def requeue_interrupted(self):
+        """Jobs left 'running' by a previous daemon go back to the queue, keeping their checkpoint"""
+        with self.pool.connection() as conn:
+            return conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'").rowcount
+
+    def claim(self):
+        """Mark the oldest queued job running and return it (None if the queue is empty)"""
+        # SELECT + UPDATE under a write lock (UPDATE ... RETURNING needs SQLite 3.35)
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """SELECT id, path, checkpoint_frame, analysis_session_id, processing_seconds, attempts
+                   FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"""
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE jobs SET status = 'running' WHERE id = ?", (row[0],))
+        if row is None:
+            return None
+        keys = ["id", "path", "checkpoint_frame", "analysis_session_id", "processing_seconds", "attempts"]
+        return dict(zip(keys, row))
+
+    def update(self, job_id, **fields):
+        if fields.get("status") in ("done", "failed"):
+            fields["finished_at"] = datetime.datetime.now().isoformat(sep=" ", timespec="seconds")
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self.pool.connection() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT status, attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return {"status": row[0], "attempts": row[1]} if row else None
+
+    def list(self, limit=50):
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                """SELECT id, path, status, checkpoint_frame, total_frames, processing_seconds, attempts, error, result_path
+                   FROM jobs ORDER BY id DESC LIMIT ?""", (limit,)
+            ).fetchall()
+        keys = ["id", "path", "status", "checkpoint_frame", "total_frames", "processing_seconds",
+                "attempts", "error", "result_path"]
+        return [dict(zip(keys, row)) for row in rows]
+
+# --- Folder Watching ---
+
+class FolderWatcher:
+    """Polls a folder; a video is ready once its size and mtime stop changing"""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._seen = {}  # path -> (size, mtime, first time this size/mtime was seen)
+
+    def ready_files(self):
+        now = time.monotonic()
+        ready = []
+        for entry in os.scandir(self.folder):
+            if not entry.is_file() or not entry.name.lower().endswith(VIDEO_EXTENSIONS):
+                continue
+            stat = entry.stat()
+            previous = self._seen.get(entry.path)
+            if previous is None or previous[:2] != (stat.st_size, stat.st_mtime):
+                self._seen[entry.path] = (stat.st_size, stat.st_mtime, now)
+            elif now - previous[2] >= SETTLE_SECONDS:
+                ready.append((os.path.abspath(entry.path), stat.st_size, stat.st_mtime))
+        return ready
+
+# --- Job Worker (one process per job) ---
+
+def _apply_limits(threads, cpus, nice):
+    """Keep batch work off the cores and priority the interactive app needs"""
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    if nice:
+        os.nice(nice)
+    import cv2
+    cv2.setNumThreads(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+def _load_function(spec):
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+def process_job(job, main_db, jobs_db, model_spec, out_dir, threads, cpus, nice):
+    _apply_limits(threads, cpus, nice)
+    db.configure(main_db)
+    jobs = JobQueue(jobs_db)
+    try:
+        result_path = analyze_video(job, jobs, _load_function(model_spec)(), out_dir)
+        jobs.update(job["id"], status="done", result_path=result_path, error=None)
+    except Exception as e:
+        print(f"❌ Job {job['id']} failed: {e}")
+        jobs.update(job["id"], status="failed", error=str(e), attempts=job["attempts"] + 1)
+
+def analyze_video(job, jobs, model, out_dir):
+    import cv2
+    from vision_core import extract_yolov8_data, feedback_cue
+
+    path = job["path"]
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise OSError(f"cannot open {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frame_width, frame_height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    session_id = job["analysis_session_id"]
+    if session_id is None:
+        session_id = db.start_analysis_session(BATCH_USERNAME, os.path.basename(path), fps, total_frames)
+        jobs.update(job["id"], analysis_session_id=session_id, total_frames=total_frames)
+    checkpoint = job["checkpoint_frame"]
+    logged_last = ""
+    if checkpoint:
+        # Events logged after the last checkpoint are written again from there
+        db.truncate_analysis_log(session_id, checkpoint + 1)
+        # ...and a situation that was already logged before it is not logged again
+        logged_last = db.last_feedback_message(session_id, checkpoint)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, checkpoint)
+        print(f"⏯️ Job {job['id']}: resuming {os.path.basename(path)} at frame {checkpoint}")
+    else:
+        print(f"🎬 Job {job['id']}: analysing {os.path.basename(path)} ({total_frames} frames)")
+
+    event_log = db.FeedbackEventLog(session_id)
+    processing_seconds = job["processing_seconds"]
+    run_started = time.perf_counter()
+    frame_index = checkpoint
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frame_index += 1  # same numbering as the app (frame position after the read)
+            results = model(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), verbose=False)[0]
+            results_object, detections = extract_yolov8_data(results)
+            cue = feedback_cue(results_object, detections, frame_width, frame_height)
+            if cue["message"] != logged_last:
+                event_log.record(frame_index, frame_index / fps, cue)
+                logged_last = cue["message"]
+
+            if frame_index % CHECKPOINT_FRAMES == 0:
+                # Events up to the checkpoint must be on disk before it is recorded
+                event_log.close()
+                seconds = processing_seconds + time.perf_counter() - run_started
+                db.update_analysis_session(session_id, frame_index, seconds)
+                jobs.update(job["id"], checkpoint_frame=frame_index, processing_seconds=seconds)
+    finally:
+        cap.release()
+        event_log.close()
+
+    processing_seconds += time.perf_counter() - run_started
+    db.update_analysis_session(session_id, frame_index, processing_seconds, "completed")
+    jobs.update(job["id"], checkpoint_frame=frame_index, processing_seconds=processing_seconds)
+    return write_result(job, session_id, fps, frame_index, processing_seconds, getattr(model, "version", None), out_dir)
+
+def write_result(job, session_id, fps, frames, processing_seconds, model_version, out_dir):
+    timeline = db.get_hazard_timeline(session_id)
+    counts = {}
+    for event in timeline:
+        counts[event["category"]] = counts.get(event["category"], 0) + 1
+    os.makedirs(out_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(job["path"]))[0]
+    result_path = os.path.join(out_dir, f"{stem}_{job['id']}.json")
+    with open(result_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "video": job["path"],
+            "analysis_session_id": session_id,
+            "model_version": model_version,
+            "fps": fps,
+            "frames": frames,
+            "processing_seconds": round(processing_seconds, 1),
+            "hazard_counts": counts,
+            "hazard_timeline": timeline,
+        }, f, indent=1, ensure_ascii=False)
+    print(f"✅ Job {job['id']}: {frames} frames in {processing_seconds:.0f}s -> {result_path}")
+    return result_path
+
+# --- Daemon ---
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt  # service managers stop the daemon with SIGTERM
+
+def watch(folder, jobs_count, cpus, nice, out_dir, model_spec=DEFAULT_MODEL):
+    db.init_db()
+    main_db = os.path.abspath(db.DB_FILE)
+    jobs = JobQueue()
+    watcher = FolderWatcher(folder)
+    requeued = jobs.requeue_interrupted()
+    if requeued:
+        print(f"⏯️ {requeued} interrupted jobs will resume from their checkpoints")
+
+    allowed = sorted(os.sched_getaffinity(0))[:cpus] if cpus and hasattr(os, "sched_getaffinity") else None
+    threads = max(1, (len(allowed) if allowed else os.cpu_count() or 1) // jobs_count)
+    print(f"👀 Watching {folder}: {jobs_count} concurrent jobs, {threads} threads each"
+          + (f", CPUs {allowed}" if allowed else "") + (f", nice {nice}" if nice else ""))
+
+    # Spawned workers start clean (no inherited torch threads or SQLite handles)
+    ctx = mp.get_context("spawn")
+    running = {}
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        while True:
+            for path, size, mtime in watcher.ready_files():
+                if jobs.enqueue(path, size, mtime):
+                    print(f"📥 Queued {path}")
+
+            for job_id, process in list(running.items()):
+                if process.is_alive():
+                    continue
+                del running[job_id]
+                job = jobs.get(job_id)
+                if job["status"] == "running":
+                    # The worker died without recording an outcome (crash, OOM kill)
+                    attempts = job["attempts"] + 1
+                    retry = attempts < MAX_ATTEMPTS
+                    jobs.update(job_id, status="queued" if retry else "failed", attempts=attempts,
+                                error=f"worker exited with code {process.exitcode}")
+                    print(f"⚠️ Job {job_id} worker exited with code {process.exitcode}"
+                          + ("; retrying from its checkpoint" if retry else "; giving up"))
+
+            while len(running) < jobs_count:
+                job = jobs.claim()
+                if job is None:
+                    break
+                process = ctx.Process(target=process_job, name=f"visionmate-batch-{job['id']}",
+                                      args=(job, main_db, jobs.pool.db_file, model_spec, out_dir, threads, allowed, nice))
+                process.start()
+                running[job["id"]] = process
+
+            time.sleep(POLL_SECONDS)
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping; running jobs will resume from their last checkpoint")
+        for process in running.values():
+            process.terminate()
+            process.join()
+        jobs.requeue_interrupted()
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch a folder and analyse new videos in the background")
+    sub = parser.add_subparsers(dest="command", required=True)
+    w = sub.add_parser("watch")
+    w.add_argument("folder")
+    w.add_argument("--jobs", type=int, default=1, help="videos analysed at the same time")
+    w.add_argument("--cpus", type=int, default=None, help="use at most this many cores (Linux)")
+    w.add_argument("--nice", type=int, default=10, help="priority increment for job processes")
+    w.add_argument("--out", default=RESULTS_DIR, help="folder for the per-video result JSON")
+    w.add_argument("--model", default=DEFAULT_MODEL, help="module:function returning a YOLO-like model")
+    sub.add_parser("status")
+    r = sub.add_parser("retry")
+    r.add_argument("job_id", type=int)
+    args = parser.parse_args()
+
+    if args.command == "watch":
+        if not os.path.isdir(args.folder):
+            print(f"❌ {args.folder} is not a folder")
+            sys.exit(1)
+        watch(args.folder, max(1, args.jobs), args.cpus, args.nice, args.out, args.model)
+    elif args.command == "retry":
+        JobQueue().update(args.job_id, status="queued", attempts=0, error=None)
+        print(f"✅ Job {args.job_id} queued again (resumes from its checkpoint)")
+    else:
+        print(f"{'id':>4}  {'status':<8}{'progress':>16}{'seconds':>9}  video")
+        for job in JobQueue().list():
+            progress = f"{job['checkpoint_frame']}/{job['total_frames'] or '?'}"
+            print(f"{job['id']:>4}  {job['status']:<8}{progress:>16}{job['processing_seconds']:>9.0f}  "
+                  f"{os.path.basename(job['path'])}" + (f"  ({job['error']})" if job["error"] else ""))
+
+if __name__ == "__main__":
+    main()
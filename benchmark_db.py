@@ -0,0 +1,59 @@
+# benchmark_db.py - DATABASE CONCURRENCY BENCHMARK
+#
+# Usage: python benchmark_db.py [threads] [users_per_thread]
+#
+# Runs the same registration + login workload against a temporary database
+# twice: once opening a new connection per call with the default rollback
+# journal (the old behaviour) and once through the WAL connection pool.
+import io
+import os
+import sys
+import time
+import tempfile
+import threading
+import contextlib
+import database as db
+
+def run_workload(threads, users_per_thread):
+    errors = []
+
+    def worker(worker_id):
+        for i in range(users_per_thread):
+            username = f"bench{worker_id}x{i}"
+            result = db.add_user("Bench User", f"{username}@example.com", username, "benchpass1")
+            if result is not True:
+                errors.append(result)
+            ok, _ = db.check_user(username, "benchpass1")
+            if not ok:
+                errors.append(f"login failed for {username}")
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+    return time.perf_counter() - started, errors
+
+def benchmark(label, threads, users_per_thread, pool_size, wal):
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(os.path.join(tmp, "bench.db"), pool_size=pool_size, wal=wal)
+        db.init_db()
+        elapsed, errors = run_workload(threads, users_per_thread)
+        db.get_pool().close_all()
+
+    operations = threads * users_per_thread * 2
+    print(f"\n📊 {label}")
+    print(f"   {operations} operations in {elapsed:.2f}s -> {operations / elapsed:.0f} ops/s")
+    print(f"   Errors: {len(errors)}" + (f" (first: {errors[0]})" if errors else ""))
+    return operations / elapsed
+
+if __name__ == "__main__":
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    users_per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    print(f"🔧 {threads} threads x {users_per_thread} registrations + logins")
+
+    legacy = benchmark("Connection per call, rollback journal", threads, users_per_thread, pool_size=0, wal=False)
+    pooled = benchmark("Pooled connections, WAL", threads, users_per_thread, pool_size=db.POOL_SIZE, wal=True)
+    print(f"\n✅ Speed-up: {pooled / legacy:.2f}x")
@@ -0,0 +1,258 @@
+# benchmark_memory.py - LONG-VIDEO MEMORY BENCHMARK
+#
+# Usage: python benchmark_memory.py [--hours 3] [--fps 10] [--max-growth-mb 25] [--single-run]
+#
+# Writes a synthetic multi-hour video, uploads it through save_upload() and
+# analyses it with the real app.upload_video_state() loop, rerun after rerun,
+# under the headless Streamlit from simulate_voice_flow.py. Only the detector
+# is synthetic. Like Streamlit, the headless session keeps every image sent
+# during a script run until that run ends, so memory stays flat only if the
+# app ends its runs. RSS is sampled throughout; fails (exit 1) if it grows by
+# more than --max-growth-mb after warm-up. --single-run disables the bounded
+# analysis runs to show the growth they prevent.
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import contextlib
+import cv2
+import numpy as np
+import simulate_voice_flow as sim  # installs the headless streamlit module
+import database as db
+import memory_budget as mb
+
+WIDTH, HEIGHT = 320, 180
+NAMES = {0: "person", 1: "car", 2: "pole", 3: "sidewalk", 4: "crosswalk",
+         5: "green_light", 6: "red_light", 7: "tree"}
+MAX_SCRIPT_RUNS = 10_000
+
+# --- Synthetic Detector ---
+
+class _Tensor:
+    def __init__(self, array):
+        self.array = array
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+    def __len__(self):
+        return len(self.array)
+
+class _Boxes:
+    def __init__(self, detections):
+        self.xyxy = _Tensor(detections[:, :4])
+        self.conf = _Tensor(detections[:, 4])
+        self.cls = _Tensor(detections[:, 5])
+
+    def __len__(self):
+        return len(self.xyxy)
+
+class SyntheticResults:
+    """The parts of an ultralytics Results object the analysis loop uses"""
+
+    def __init__(self, frame, detections):
+        self.names = NAMES
+        self.frame = frame
+        self.detections = detections
+        self.boxes = _Boxes(detections)
+
+    def plot(self):
+        annotated = self.frame.copy()
+        for x_min, y_min, x_max, y_max, _, _ in self.detections:
+            cv2.rectangle(annotated, (int(x_min), int(y_min)), (int(x_max), int(y_max)), (0, 255, 0), 2)
+        return annotated
+
+class SyntheticModel:
+    """Called like the YOLO model; boxes follow the frame the app has just read"""
+    names = NAMES
+
+    def __call__(self, img, **kwargs):
+        frame_index = max(0, sim.st.session_state.last_frame_index - 1)
+        return [SyntheticResults(img, synthetic_detections(frame_index))]
+
+def synthetic_detections(frame_index):
+    """A few objects sweeping across the frame on different periods"""
+    rows = [[0, HEIGHT * 0.55, WIDTH, HEIGHT, 0.9, 3]]  # sidewalk
+    for cls, period in ((0, 300), (1, 450), (2, 700), (4, 1100), (5, 1300)):
+        phase = (frame_index % period) / period
+        x = phase * (WIDTH - 40)
+        bottom = HEIGHT * (0.4 + 0.55 * phase)
+        rows.append([x, bottom - 60, x + 40, bottom, 0.8, cls])
+    return np.array(rows, dtype=np.float32)
+
+def write_video(path, frames, fps):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (WIDTH, HEIGHT))
+    frame = np.empty((HEIGHT, WIDTH, 3), np.uint8)
+    for i in range(frames):
+        frame[:] = (40, 40, 40)
+        for x_min, y_min, x_max, y_max, _, cls in synthetic_detections(i):
+            color = (int(cls) * 30, 200, 255 - int(cls) * 30)
+            cv2.rectangle(frame, (int(x_min), int(y_min)), (int(x_max), int(y_max)), color, -1)
+        writer.write(frame)
+    writer.release()
+
+# --- Headless Media ---
+
+class MediaSession:
+    """
+    Media sent during the current script run (Streamlit's media file manager
+    holds it until the run ends) plus RSS samples every report_every images.
+    """
+
+    def __init__(self, report_every):
+        self.report_every = report_every
+        self.run_media = []
+        self.images = 0
+        self.samples = []
+        self.peak_after_warmup = 0.0
+
+    def image(self, img, output_format="PNG", **kwargs):
+        ext = ".jpg" if str(output_format).upper() in ("JPEG", "JPG") else ".png"
+        self.run_media.append(cv2.imencode(ext, img)[1].tobytes())
+        self.images += 1
+        if self.images % mb.RSS_SAMPLE_FRAMES == 0 and self.samples:
+            self.peak_after_warmup = max(self.peak_after_warmup, mb.rss_mb())
+        if self.images % self.report_every == 0:
+            self.samples.append((self.images, mb.rss_mb()))
+
+    def end_run(self):
+        self.run_media.clear()
+
+class _Widget(sim._Element):
+    """Columns, placeholders and controls of the analysis page"""
+
+    def __init__(self, media):
+        self.media = media
+
+    def checkbox(self, label, value=False, **kwargs):
+        return value
+
+    def button(self, label, **kwargs):
+        return False
+
+    def image(self, img, **kwargs):
+        self.media.image(img, **kwargs)
+
+class MediaStreamlit(sim.HeadlessStreamlit):
+    media = None
+
+    def columns(self, spec, **kwargs):
+        return [_Widget(self.media) for _ in (spec if isinstance(spec, (list, tuple)) else range(spec))]
+
+    def empty(self):
+        return _Widget(self.media)
+
+    def checkbox(self, label, value=False, **kwargs):
+        return value
+
+    def button(self, label, **kwargs):
+        return False
+
+# database and the other modules already hold the headless instance; give it the media hooks
+sim.st.__class__ = MediaStreamlit
+
+# --- Analysis ---
+
+def analyze(video_path, fps, single_run, report_every):
+    """
+    Runs app.upload_video_state() until the video is complete.
+    Returns ([(frame, rss_mb)] every report_every frames, peak RSS after the first report, script runs).
+    """
+    import app
+
+    sim.install_stand_ins()
+    sim.clock.start()
+    app.time = sim.clock  # the per-frame UI sleep costs no wall time
+    app.load_model = SyntheticModel
+    app.play_audio = lambda text, interruptible=False: False
+    app.poll_command = lambda commands=None: None
+    if single_run:
+        app.ANALYSIS_RUN_FRAMES = float("inf")
+        mb.ANALYSIS_RSS_GROWTH_MB = float("inf")
+
+    media = MediaSession(report_every)
+    sim.st.media = media
+    sim.st.new_session(state="upload_video", trace_session="benchmark", last_frame_index=0,
+                       is_paused=False, stop_triggered=False, audio_enabled=False, earcon_mode=False,
+                       export_enabled=False, exporter=None, roi_enabled=False, profile_enabled=False,
+                       tmp={"username": "benchmark", "video_to_process": video_path,
+                            "video_name": os.path.basename(video_path)})
+    runs = 0
+    while sim.st.session_state.state == "upload_video" and runs < MAX_SCRIPT_RUNS:
+        runs += 1
+        try:
+            app.main()
+        except sim.RerunRequested:
+            pass
+        media.end_run()  # script run ends; media is released
+    if sim.st.session_state.state == "upload_video":
+        raise RuntimeError(f"analysis did not finish in {MAX_SCRIPT_RUNS} script runs")
+
+    media.samples.append((media.images, mb.rss_mb()))
+    return media.samples, max(media.peak_after_warmup, media.samples[-1][1]), runs
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory benchmark for long video analysis")
+    parser.add_argument("--hours", type=float, default=3)
+    parser.add_argument("--fps", type=int, default=10)
+    parser.add_argument("--max-growth-mb", type=float, default=25)
+    parser.add_argument("--single-run", action="store_true",
+                        help="never end the analysis run (shows unbounded media growth)")
+    args = parser.parse_args()
+    frames = int(args.hours * 3600 * args.fps)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        mb.VIDEO_DIR = os.path.join(tmp, "uploads")
+        db.configure(os.path.join(tmp, "memory.db"))
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.init_db()
+
+        source = os.path.join(tmp, "synthetic.mp4")
+        print(f"🎬 Writing {args.hours:g} h synthetic video ({frames} frames at {args.fps} fps)...")
+        started = time.perf_counter()
+        write_video(source, frames, args.fps)
+        size_mb = os.path.getsize(source) / (1024 * 1024)
+        print(f"   {size_mb:.0f} MB in {time.perf_counter() - started:.0f}s")
+
+        before = mb.rss_mb()
+        with open(source, "rb") as upload:
+            video_path = mb.save_upload(upload)
+        print(f"📥 Upload copied in chunks: RSS {before:.0f} -> {mb.rss_mb():.0f} MB for a {size_mb:.0f} MB file")
+
+        print("🔍 Analysing" + (" in a single run" if args.single_run else f" in runs of {mb.ANALYSIS_RUN_FRAMES} frames") + "...")
+        started = time.perf_counter()
+        # The app may write profiles/ or exports/ relative to the working directory
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                samples, peak, runs = analyze(video_path, args.fps, args.single_run,
+                                              report_every=max(1, frames // 10))
+        finally:
+            os.chdir(cwd)
+        elapsed = time.perf_counter() - started
+        db.get_pool().close_all()
+
+    print("\n" + "=" * 40)
+    print(f"{'frame':>10}{'video time':>14}{'RSS MB':>12}")
+    print("=" * 40)
+    for frame_index, rss_value in samples:
+        hours, rest = divmod(frame_index / args.fps, 3600)
+        print(f"{frame_index:>10}{int(hours):>8}h{int(rest // 60):02d}m{rest % 60:02.0f}s{rss_value:>10.1f}")
+
+    # The first sample is after warm-up (imports, codec and SQLite caches)
+    growth = peak - samples[0][1]
+    print(f"\n⏱️ {samples[-1][0]} frames in {elapsed:.0f}s ({samples[-1][0] / elapsed:.0f} fps), {runs} script runs")
+    print(f"🧠 Peak RSS growth after warm-up: {growth:.1f} MB (limit {args.max_growth_mb:g} MB)")
+    if growth > args.max_growth_mb:
+        print("❌ Memory is not flat")
+        sys.exit(1)
+    print("✅ Peak memory stays flat")
+
+if __name__ == "__main__":
+    main()
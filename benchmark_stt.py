@@ -0,0 +1,96 @@
+# benchmark_stt.py - SPEECH RECOGNITION LATENCY BENCHMARK
+#
+# Usage: python benchmark_stt.py <wav_dir> [--online] [--phrases "register,login,..."]
+#
+# <wav_dir> holds recorded utterances (*.wav). An optional transcripts.json in the
+# same folder maps file names to the expected text and enables accuracy reporting.
+import os
+import sys
+import json
+import glob
+import argparse
+import statistics
+import speech_recognition as sr
+import speech_backends
+from intents import STATE_INTENTS, state_phrases
+
+DEFAULT_PHRASES = list(dict.fromkeys(
+    phrase for state in STATE_INTENTS for phrase in state_phrases(state)
+))
+
+def load_corpus(wav_dir):
+    files = sorted(glob.glob(os.path.join(wav_dir, "*.wav")))
+    transcripts = {}
+    transcripts_path = os.path.join(wav_dir, "transcripts.json")
+    if os.path.exists(transcripts_path):
+        with open(transcripts_path) as f:
+            transcripts = json.load(f)
+    corpus = []
+    for path in files:
+        with sr.AudioFile(path) as source:
+            audio = sr.Recognizer().record(source)
+        corpus.append((os.path.basename(path), audio, transcripts.get(os.path.basename(path))))
+    return corpus
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def run_backend(name, corpus, recognize_fn):
+    latencies = []
+    correct = 0
+    scored = 0
+    failures = 0
+    for file_name, audio, expected in corpus:
+        try:
+            result = recognize_fn(audio)
+        except (sr.UnknownValueError, sr.RequestError) as e:
+            failures += 1
+            print(f"   ❌ {file_name}: {type(e).__name__}")
+            continue
+        latencies.append(result["latency_ms"])
+        if expected is not None:
+            scored += 1
+            correct += result["text"].lower() == expected.lower()
+
+    print(f"\n📊 {name}")
+    if not latencies:
+        print("   ⚠️ No utterances recognized")
+        return
+    print(f"   Utterances: {len(latencies)} ok, {failures} failed")
+    print(f"   Latency ms: mean {statistics.mean(latencies):.1f} | "
+          f"p50 {percentile(latencies, 50):.1f} | p95 {percentile(latencies, 95):.1f}")
+    if scored:
+        print(f"   Accuracy:   {correct}/{scored} ({100 * correct / scored:.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark VisionMate speech backends on a WAV corpus")
+    parser.add_argument("wav_dir")
+    parser.add_argument("--phrases", default=",".join(DEFAULT_PHRASES),
+                        help="comma-separated command grammar for the offline backend")
+    parser.add_argument("--online", action="store_true", help="also benchmark Google dictation (network)")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.wav_dir)
+    if not corpus:
+        print(f"❌ No WAV files found in {args.wav_dir}")
+        sys.exit(1)
+    phrases = [p.strip() for p in args.phrases.split(",") if p.strip()]
+    print(f"🔧 {len(corpus)} utterances, {len(phrases)} grammar phrases")
+
+    if speech_backends.offline_available():
+        # Warm-up: model load and grammar compilation happen once per process
+        try:
+            speech_backends.recognize_offline(corpus[0][1], phrases)
+        except sr.UnknownValueError:
+            pass
+        run_backend("Offline grammar (vosk)", corpus,
+                    lambda audio: speech_backends.recognize_offline(audio, phrases))
+    else:
+        print(f"⚠️ Offline backend unavailable (install vosk and a model at {speech_backends.VOSK_MODEL_PATH})")
+
+    if args.online:
+        run_backend("Online dictation (google)", corpus, speech_backends.recognize_online)
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,14 @@ import sqlite3
 import hashlib
 import streamlit as st
 import datetime
+import threading
+import queue
+import os
+import hmac
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import tracing
 
 # Get database file from secrets or use default
 try:
@@ -11,56 +19,306 @@ except:
     DB_FILE = "visionmate.db"
     print("⚠️ Using default database file: visionmate.db")
 
+# --- Connection Pool ---
+
+POOL_SIZE = 8              # idle connections kept open per database file
+BUSY_TIMEOUT_MS = 5000     # how long a writer waits for a lock before failing
+STATEMENT_CACHE_SIZE = 128 # prepared statements kept per connection
+
+class ConnectionPool:
+    """
+    Reusable SQLite connections shared by all Streamlit session threads.
+    Connections are opened in WAL mode so readers never block the writer,
+    and each keeps its own prepared-statement cache.
+    """
+
+    def __init__(self, db_file, size=POOL_SIZE, wal=True):
+        self.db_file = db_file
+        self.size = size
+        self.wal = wal
+        self._idle = queue.LifoQueue(maxsize=max(size, 1))
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=False,  # a connection is only ever used by one thread at a time
+        )
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA foreign_keys = ON")
+        if self.wal:
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commits on success, rolls back on error"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            if self.size > 0:
+                try:
+                    self._idle.put_nowait(conn)
+                    conn = None
+                except queue.Full:
+                    pass
+            if conn is not None:
+                conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+_pool = None
+_pool_lock = threading.Lock()
+_schema_lock = threading.Lock()
+_schema_ready = set()  # database files whose tables already exist
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.db_file != DB_FILE:
+            if _pool is not None:
+                _pool.close_all()
+            _pool = ConnectionPool(DB_FILE)
+        return _pool
+
+def configure(db_file=None, pool_size=POOL_SIZE, wal=True):
+    """Point the module at another database file and/or change pooling (tests, benchmarks)"""
+    global DB_FILE, _pool
+    with _pool_lock:
+        if db_file is not None:
+            DB_FILE = db_file
+        if _pool is not None:
+            _pool.close_all()
+        _pool = ConnectionPool(DB_FILE, size=pool_size, wal=wal)
+
+def get_connection():
+    """Context manager yielding a pooled connection to DB_FILE"""
+    return get_pool().connection()
+
+# --- Schema ---
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        email TEXT NOT NULL UNIQUE,
+        username TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        last_login TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS analysis_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT,
+        video_name TEXT NOT NULL,
+        fps REAL,
+        total_frames INTEGER,
+        frames_processed INTEGER DEFAULT 0,
+        processing_seconds REAL DEFAULT 0,
+        status TEXT DEFAULT 'running',
+        started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_sessions_user ON analysis_sessions (username, started_at)",
+    "CREATE INDEX IF NOT EXISTS idx_sessions_video ON analysis_sessions (video_name, started_at)",
+    '''
+    CREATE TABLE IF NOT EXISTS feedback_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        session_id INTEGER NOT NULL REFERENCES analysis_sessions (id) ON DELETE CASCADE,
+        frame_index INTEGER NOT NULL,
+        video_time REAL,
+        category TEXT,
+        label TEXT,
+        direction TEXT,
+        proximity TEXT,
+        message TEXT NOT NULL,
+        announced INTEGER DEFAULT 0
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_events_timeline ON feedback_events (session_id, category, frame_index)",
+    "CREATE INDEX IF NOT EXISTS idx_events_frames ON feedback_events (session_id, frame_index)",
+    '''
+    CREATE TABLE IF NOT EXISTS frame_timings (
+        session_id INTEGER NOT NULL REFERENCES analysis_sessions (id) ON DELETE CASCADE,
+        frame_index INTEGER NOT NULL,
+        imgsz INTEGER NOT NULL,
+        inference_ms REAL,
+        frame_ms REAL,
+        deadline_missed INTEGER DEFAULT 0,
+        forced INTEGER DEFAULT 0
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_timings_frames ON frame_timings (session_id, frame_index)",
+    '''
+    CREATE TABLE IF NOT EXISTS hazard_stats (
+        session_id INTEGER NOT NULL REFERENCES analysis_sessions (id) ON DELETE CASCADE,
+        label TEXT NOT NULL,
+        frames_seen INTEGER NOT NULL,
+        detections INTEGER NOT NULL,
+        closest REAL,
+        closest_band TEXT,
+        closest_seconds REAL,
+        distance_seconds REAL,
+        nearby_seconds REAL,
+        very_close_seconds REAL,
+        alerts INTEGER DEFAULT 0,
+        PRIMARY KEY (session_id, label)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        token_hash TEXT NOT NULL UNIQUE,
+        username TEXT NOT NULL REFERENCES users (username) ON DELETE CASCADE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        expires_at TIMESTAMP NOT NULL,
+        last_seen TIMESTAMP,
+        revoked INTEGER DEFAULT 0
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_sessions_username ON sessions (username)",
+]
+
 def init_db():
-    """Initialize database with users table"""
-    conn = None
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT NOT NULL UNIQUE,
-                username TEXT NOT NULL UNIQUE,
-                password TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_login TIMESTAMP
-            )
-        ''')
-        
-        conn.commit()
-        print("✅ Database initialized successfully!")
-        
-    except sqlite3.Error as e:
-        st.error(f"❌ Database initialization error: {e}")
-        print(f"❌ Database error: {e}")
-    finally:
-        if conn:
-            conn.close()
+    """Initialize database tables (runs once per database file per process)"""
+    if DB_FILE in _schema_ready:
+        return
+    with _schema_lock:
+        if DB_FILE in _schema_ready:
+            return
+        try:
+            with get_connection() as conn:
+                for statement in SCHEMA:
+                    conn.execute(statement)
+            _schema_ready.add(DB_FILE)
+            print("✅ Database initialized successfully!")
+            
+        except sqlite3.Error as e:
+            st.error(f"❌ Database initialization error: {e}")
+            print(f"❌ Database error: {e}")
 
-def hash_password(password):
-    """Hash password using SHA-256"""
+# --- Password Hashing ---
+
+# Stored format: "pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>".
+# Rows written before salted hashing hold a bare SHA-256 hex digest and are
+# upgraded the next time their owner logs in.
+HASH_SCHEME = "pbkdf2_sha256"
+SALT_BYTES = 16
+MIN_ITERATIONS = 100_000
+HASH_WORKERS = 2           # concurrent hash computations (each uses one core)
+HASH_QUEUE = 16            # logins allowed to wait for a worker before we report busy
+HASH_WAIT_SECONDS = 10
+REHASH_MARGIN = 0.2        # rehash on login only when this far below the calibrated count (calibration jitters between restarts)
+
+try:
+    TARGET_HASH_MS = float(st.secrets["security"]["hash_target_ms"])
+except:
+    TARGET_HASH_MS = 100.0
+
+_hash_iterations = None
+_hash_lock = threading.Lock()
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="visionmate-kdf")
+_hash_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE)
+
+class HashingBusyError(Exception):
+    """Raised when too many password hashes are already queued"""
+
+def calibrate_iterations(target_ms=None, probe=20_000):
+    """Number of PBKDF2 rounds that takes about target_ms on this host"""
+    target_ms = target_ms or TARGET_HASH_MS
+    started = time.perf_counter()
+    hashlib.pbkdf2_hmac("sha256", b"calibration", b"0" * SALT_BYTES, probe)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    return max(MIN_ITERATIONS, int(probe * target_ms / max(elapsed_ms, 1e-3)))
+
+def get_iterations():
+    global _hash_iterations
+    if _hash_iterations is None:
+        with _hash_lock:
+            if _hash_iterations is None:
+                _hash_iterations = calibrate_iterations()
+                print(f"🔐 Password hashing calibrated: {_hash_iterations} iterations (~{TARGET_HASH_MS:.0f} ms)")
+    return _hash_iterations
+
+def legacy_hash_password(password):
+    """Unsalted SHA-256 used by accounts created before salted hashing"""
     return hashlib.sha256(password.encode('utf-8')).hexdigest()
 
+def hash_password(password, iterations=None, salt=None):
+    """Hash password with salted PBKDF2-SHA256"""
+    iterations = iterations or get_iterations()
+    salt = salt or os.urandom(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode('utf-8'), salt, iterations)
+    return f"{HASH_SCHEME}${iterations}${salt.hex()}${digest.hex()}"
+
+def verify_password(password, stored_hash):
+    """Return (matches, needs_rehash) for a stored hash of any supported version"""
+    if not stored_hash:
+        return False, False
+    if "$" not in stored_hash:
+        matches = hmac.compare_digest(legacy_hash_password(password), stored_hash)
+        return matches, matches
+
+    # A malformed row is a failed login, not an error
+    try:
+        scheme, iterations, salt_hex, _ = stored_hash.split("$")
+        iterations, salt = int(iterations), bytes.fromhex(salt_hex)
+    except ValueError:
+        print("⚠️ Malformed password hash in database")
+        return False, False
+    if scheme != HASH_SCHEME or iterations < 1 or not salt:
+        return False, False
+    candidate = hash_password(password, iterations, salt)
+    matches = hmac.compare_digest(candidate, stored_hash)
+    weak = iterations < MIN_ITERATIONS or iterations < get_iterations() * (1 - REHASH_MARGIN)
+    return matches, matches and weak
+
+def run_hashing(fn, *args):
+    """
+    Run a hashing call on the bounded KDF pool. Streamlit threads wait for the
+    result, but at most HASH_WORKERS hashes burn CPU at once.
+    """
+    if not _hash_slots.acquire(timeout=HASH_WAIT_SECONDS):
+        raise HashingBusyError("Too many sign-ins in progress. Please try again in a moment.")
+    try:
+        with tracing.span("db.hash", "db", iterations=get_iterations()):
+            return _hash_executor.submit(fn, *args).result()
+    finally:
+        _hash_slots.release()
+
+@tracing.traced("db.add_user", "db")
 def add_user(name, email, username, password):
     """Add a new user to the database"""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        
         # Hash the password
-        hashed_password = hash_password(password)
+        hashed_password = run_hashing(hash_password, password)
         
-        # Insert user into database
-        c.execute(
-            "INSERT INTO users (name, email, username, password) VALUES (?, ?, ?, ?)",
-            (name, email, username, hashed_password)
-        )
+        with get_connection() as conn:
+            # Insert user into database
+            conn.execute(
+                "INSERT INTO users (name, email, username, password) VALUES (?, ?, ?, ?)",
+                (name, email, username, hashed_password)
+            )
         
-        conn.commit()
         print(f"✅ User registered: {username}")
         return True
         
@@ -80,70 +338,101 @@ def add_user(name, email, username, password):
         print(f"❌ Database error: {e}")
         return f"Database error: {e}"
         
-    finally:
-        if conn:
-            conn.close()
+    except HashingBusyError as e:
+        print(f"❌ Hashing pool busy: {username}")
+        return str(e)
 
+@tracing.traced("db.check_user", "db")
 def check_user(username, password):
     """Check user credentials for login"""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
+        # Get user data (the connection is not held while hashing)
+        with get_connection() as conn:
+            user_data = conn.execute(
+                "SELECT name, password FROM users WHERE username = ?", 
+                (username,)
+            ).fetchone()
         
-        # Hash the input password
-        hashed_password = hash_password(password)
+        if not user_data:
+            print(f"❌ Username not found: {username}")
+            return False, "Username not found. Please check your username and try again."
         
-        # Get user data
-        c.execute(
-            "SELECT name, password FROM users WHERE username = ?", 
-            (username,)
-        )
-        user_data = c.fetchone()
+        name, stored_hash = user_data
         
-        if user_data:
-            name, stored_hash = user_data
-            
-            # Compare hashed passwords
-            if hashed_password == stored_hash:
-                # Update last login
-                c.execute(
-                    "UPDATE users SET last_login = ? WHERE username = ?",
-                    (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), username)
+        # Compare hashed passwords
+        matches, needs_rehash = run_hashing(verify_password, password, stored_hash)
+        if not matches:
+            print(f"❌ Incorrect password for: {username}")
+            return False, "Incorrect password. Please try again."
+        
+        new_hash = run_hashing(hash_password, password) if needs_rehash else None
+        
+        with get_connection() as conn:
+            # Update last login
+            conn.execute(
+                "UPDATE users SET last_login = ? WHERE username = ?",
+                (datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), username)
+            )
+            # Upgrade legacy or under-strength hashes transparently
+            if new_hash:
+                conn.execute(
+                    "UPDATE users SET password = ? WHERE username = ? AND password = ?",
+                    (new_hash, username, stored_hash)
                 )
-                conn.commit()
-                
-                print(f"✅ Login successful: {username}")
-                return True, name
-            else:
-                print(f"❌ Incorrect password for: {username}")
-                return False, "Incorrect password. Please try again."
-        else:
-            print(f"❌ Username not found: {username}")
-            return False, "Username not found. Please check your username and try again."
+                print(f"🔐 Password hash upgraded: {username}")
+        
+        print(f"✅ Login successful: {username}")
+        return True, name
             
     except sqlite3.Error as e:
         print(f"❌ Database error: {e}")
         return False, f"Database error: {e}"
         
-    finally:
-        if conn:
-            conn.close()
+    except HashingBusyError as e:
+        print(f"❌ Hashing pool busy: {username}")
+        return False, str(e)
+
+@tracing.traced("db.add_users_bulk", "db")
+def add_users_bulk(rows):
+    """
+    Insert pre-hashed users (name, email, username, password_hash) in one
+    transaction. A duplicate only skips its own row: returns
+    (inserted_count, [(row_index, reason), ...]).
+    """
+    inserted = 0
+    conflicts = []
+    try:
+        with get_connection() as conn:
+            for index, row in enumerate(rows):
+                try:
+                    conn.execute(
+                        "INSERT INTO users (name, email, username, password) VALUES (?, ?, ?, ?)",
+                        row
+                    )
+                    inserted += 1
+                except sqlite3.IntegrityError as e:
+                    error_msg = str(e).lower()
+                    if "username" in error_msg:
+                        conflicts.append((index, "username already exists"))
+                    elif "email" in error_msg:
+                        conflicts.append((index, "email already registered"))
+                    else:
+                        conflicts.append((index, f"integrity error: {e}"))
+    except sqlite3.Error as e:
+        print(f"❌ Bulk insert failed: {e}")
+        return 0, [(index, f"database error: {e}") for index in range(len(rows))]
+    return inserted, conflicts
 
 # The following functions are included for completeness but are not strictly used in the main app flow:
+@tracing.traced("db.get_user_info", "db")
 def get_user_info(username):
     """Get user information"""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        
-        c.execute(
-            "SELECT id, name, email, username, created_at, last_login FROM users WHERE username = ?",
-            (username,)
-        )
-        
-        user = c.fetchone()
+        with get_connection() as conn:
+            user = conn.execute(
+                "SELECT id, name, email, username, created_at, last_login FROM users WHERE username = ?",
+                (username,)
+            ).fetchone()
         
         if user:
             return {
@@ -159,24 +448,17 @@ def get_user_info(username):
     except sqlite3.Error as e:
         print(f"❌ Error getting user info: {e}")
         return None
-        
-    finally:
-        if conn:
-            conn.close()
 
 def get_all_users():
     """Get all users (for testing/admin)"""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        
-        c.execute(
-            "SELECT id, name, email, username, created_at, last_login FROM users ORDER BY created_at DESC"
-        )
+        with get_connection() as conn:
+            rows = conn.execute(
+                "SELECT id, name, email, username, created_at, last_login FROM users ORDER BY created_at DESC"
+            ).fetchall()
         
         users = []
-        for row in c.fetchall():
+        for row in rows:
             users.append({
                 "id": row[0],
                 "name": row[1],
@@ -191,20 +473,42 @@ def get_all_users():
     except sqlite3.Error as e:
         print(f"❌ Error getting users: {e}")
         return []
+
+def iter_users(batch_size=1000):
+    """
+    Stream all users in id order using keyset pagination, so exports of
+    any size run in bounded memory. Yields the same dicts as get_user_info().
+    """
+    last_id = 0
+    while True:
+        try:
+            with get_connection() as conn:
+                rows = conn.execute(
+                    "SELECT id, name, email, username, created_at, last_login FROM users WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"❌ Error exporting users: {e}")
+            return
         
-    finally:
-        if conn:
-            conn.close()
+        for row in rows:
+            yield {
+                "id": row[0],
+                "name": row[1],
+                "email": row[2],
+                "username": row[3],
+                "created_at": row[4],
+                "last_login": row[5]
+            }
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
 
 def delete_user(username):
     """Delete a user (for testing)"""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        
-        c.execute("DELETE FROM users WHERE username = ?", (username,))
-        conn.commit()
+        with get_connection() as conn:
+            c = conn.execute("DELETE FROM users WHERE username = ?", (username,))
         
         if c.rowcount > 0:
             print(f"✅ User deleted: {username}")
@@ -216,26 +520,384 @@ def delete_user(username):
     except sqlite3.Error as e:
         print(f"❌ Error deleting user: {e}")
         return False
-        
-    finally:
-        if conn:
-            conn.close()
 
 def reset_database():
     """Reset database (for testing)"""
-    conn = None
     try:
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        
-        c.execute("DROP TABLE IF EXISTS users")
-        conn.commit()
-        conn.close()
+        with get_connection() as conn:
+            conn.execute("DROP TABLE IF EXISTS sessions")
+            conn.execute("DROP TABLE IF EXISTS hazard_stats")
+            conn.execute("DROP TABLE IF EXISTS frame_timings")
+            conn.execute("DROP TABLE IF EXISTS feedback_events")
+            conn.execute("DROP TABLE IF EXISTS analysis_sessions")
+            conn.execute("DROP TABLE IF EXISTS users")
         
         print("✅ Database reset successfully!")
+        _schema_ready.discard(DB_FILE)
         init_db()
         return True
         
     except sqlite3.Error as e:
         print(f"❌ Error resetting database: {e}")
-        return False
\ No newline at end of file
+        return False
+
+# ==================== ANALYSIS SESSIONS & FEEDBACK EVENTS ====================
+
+HAZARD_CATEGORIES = ("extreme", "hazard", "stop_signal")
+
+EVENT_FLUSH_EVENTS = 200   # write buffered events after this many...
+EVENT_FLUSH_SECONDS = 2.0  # ...or after this long, whichever comes first
+
+# A single writer thread keeps event inserts off the frame loop and in order
+_event_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="visionmate-events")
+
+@tracing.traced("db.start_analysis_session", "db")
+def start_analysis_session(username, video_name, fps, total_frames):
+    """Create an analysis_sessions row and return its id (None on error)"""
+    try:
+        with get_connection() as conn:
+            c = conn.execute(
+                "INSERT INTO analysis_sessions (username, video_name, fps, total_frames) VALUES (?, ?, ?, ?)",
+                (username, video_name, fps, total_frames)
+            )
+        return c.lastrowid
+    except sqlite3.Error as e:
+        print(f"❌ Error starting analysis session: {e}")
+        return None
+
+@tracing.traced("db.update_analysis_session", "db")
+def update_analysis_session(session_id, frames_processed, processing_seconds, status="running"):
+    """Record progress; a final status ('completed'/'stopped') also stamps finished_at"""
+    try:
+        with get_connection() as conn:
+            conn.execute(
+                """UPDATE analysis_sessions
+                   SET frames_processed = ?, processing_seconds = ?, status = ?,
+                       finished_at = CASE WHEN ? = 'running' THEN NULL ELSE CURRENT_TIMESTAMP END
+                   WHERE id = ?""",
+                (frames_processed, processing_seconds, status, status, session_id)
+            )
+        return True
+    except sqlite3.Error as e:
+        print(f"❌ Error updating analysis session: {e}")
+        return False
+
+@tracing.traced("db.truncate_analysis_log", "db")
+def truncate_analysis_log(session_id, from_frame):
+    """Drop events and timings at or after from_frame (before resuming from a checkpoint)"""
+    try:
+        with get_connection() as conn:
+            conn.execute("DELETE FROM feedback_events WHERE session_id = ? AND frame_index >= ?", (session_id, from_frame))
+            conn.execute("DELETE FROM frame_timings WHERE session_id = ? AND frame_index >= ?", (session_id, from_frame))
+        return True
+    except sqlite3.Error as e:
+        print(f"❌ Error truncating analysis log: {e}")
+        return False
+
+def last_feedback_message(session_id, up_to_frame):
+    """Message of the last event logged at or before up_to_frame ("" if none)"""
+    try:
+        with get_connection() as conn:
+            row = conn.execute(
+                """SELECT message FROM feedback_events
+                   WHERE session_id = ? AND frame_index <= ?
+                   ORDER BY frame_index DESC, id DESC LIMIT 1""",
+                (session_id, up_to_frame)
+            ).fetchone()
+        return row[0] if row else ""
+    except sqlite3.Error as e:
+        print(f"❌ Error reading last feedback event: {e}")
+        return ""
+
+class BatchedLog:
+    """
+    Buffers rows in memory during analysis and writes them with executemany
+    in periodic transactions on a background writer thread.
+    Subclasses set INSERT_SQL and add a record() method.
+    """
+    INSERT_SQL = None
+
+    def __init__(self, session_id, flush_events=EVENT_FLUSH_EVENTS, flush_seconds=EVENT_FLUSH_SECONDS):
+        self.session_id = session_id
+        self.flush_events = flush_events
+        self.flush_seconds = flush_seconds
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._pending = []
+
+    def _append(self, row):
+        self._buffer.append(row)
+        if (len(self._buffer) >= self.flush_events
+                or time.monotonic() - self._last_flush >= self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        """Hand the buffered rows to the writer thread"""
+        self._last_flush = time.monotonic()
+        if not self._buffer or self.session_id is None:
+            self._buffer = []
+            return
+        batch, self._buffer = self._buffer, []
+        self._pending = [f for f in self._pending if not f.done()]
+        self._pending.append(_event_writer.submit(_write_batch, self.INSERT_SQL, batch))
+
+    def close(self):
+        """Flush and wait until every row is on disk"""
+        self.flush()
+        for future in self._pending:
+            future.result()
+        self._pending = []
+
+class FeedbackEventLog(BatchedLog):
+    """Feedback messages of one analysis session (one row per change)"""
+    INSERT_SQL = """INSERT INTO feedback_events
+                    (session_id, frame_index, video_time, category, label, direction, proximity, message, announced)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+    def record(self, frame_index, video_time, cue, announced=False):
+        self._append((
+            self.session_id, frame_index, video_time, cue.get("category"), cue.get("label"),
+            cue.get("direction"), cue.get("proximity"), cue["message"], int(announced)
+        ))
+
+class FrameTimingLog(BatchedLog):
+    """Per-frame input size and latency chosen by the resolution scheduler"""
+    INSERT_SQL = """INSERT INTO frame_timings
+                    (session_id, frame_index, imgsz, inference_ms, frame_ms, deadline_missed, forced)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)"""
+
+    def record(self, frame_index, imgsz, inference_ms, frame_ms, deadline_missed=False, forced=False):
+        self._append((self.session_id, frame_index, imgsz, round(inference_ms, 2), round(frame_ms, 2),
+                      int(deadline_missed), int(forced)))
+
+@tracing.traced("db.write_batch", "db")
+def _write_batch(sql, batch):
+    try:
+        with get_connection() as conn:
+            conn.executemany(sql, batch)
+    except sqlite3.Error as e:
+        print(f"❌ Error writing {len(batch)} analysis log rows: {e}")
+
+def get_frame_timings(session_id):
+    """Per input size: frames, mean/max inference and frame ms, deadline misses, hazard-forced frames"""
+    try:
+        with get_connection() as conn:
+            rows = conn.execute(
+                """SELECT imgsz, COUNT(*), AVG(inference_ms), MAX(frame_ms), SUM(deadline_missed), SUM(forced)
+                   FROM frame_timings WHERE session_id = ? GROUP BY imgsz ORDER BY imgsz""",
+                (session_id,)
+            ).fetchall()
+        return [
+            {"imgsz": r[0], "frames": r[1], "avg_inference_ms": r[2], "max_frame_ms": r[3],
+             "deadline_misses": r[4], "forced": r[5]}
+            for r in rows
+        ]
+    except sqlite3.Error as e:
+        print(f"❌ Error reading frame timings: {e}")
+        return []
+
+HAZARD_STATS_COLUMNS = ("label", "frames_seen", "detections", "closest", "closest_band", "closest_seconds",
+                        "distance_seconds", "nearby_seconds", "very_close_seconds", "alerts")
+
+@tracing.traced("db.save_hazard_stats", "db")
+def save_hazard_stats(session_id, rows):
+    """Store the per-class aggregates of an analysis (HazardStats.rows()), replacing earlier ones"""
+    try:
+        with get_connection() as conn:
+            conn.execute("DELETE FROM hazard_stats WHERE session_id = ?", (session_id,))
+            conn.executemany(
+                f"""INSERT INTO hazard_stats (session_id, {', '.join(HAZARD_STATS_COLUMNS)})
+                    VALUES (?, {', '.join('?' for _ in HAZARD_STATS_COLUMNS)})""",
+                [(session_id, *(row[key] for key in HAZARD_STATS_COLUMNS)) for row in rows]
+            )
+        return True
+    except sqlite3.Error as e:
+        print(f"❌ Error saving hazard statistics: {e}")
+        return False
+
+def get_hazard_stats(session_id):
+    """Per-class aggregates of one analysis, most frequent first"""
+    try:
+        with get_connection() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(HAZARD_STATS_COLUMNS)} FROM hazard_stats WHERE session_id = ? ORDER BY frames_seen DESC",
+                (session_id,)
+            ).fetchall()
+        return [dict(zip(HAZARD_STATS_COLUMNS, row)) for row in rows]
+    except sqlite3.Error as e:
+        print(f"❌ Error reading hazard statistics: {e}")
+        return []
+
+@tracing.traced("db.get_hazard_timeline", "db")
+def get_hazard_timeline(session_id, categories=HAZARD_CATEGORIES):
+    """Hazard events of one analysis in video order"""
+    placeholders = ", ".join("?" for _ in categories)
+    try:
+        with get_connection() as conn:
+            rows = conn.execute(
+                f"""SELECT frame_index, video_time, category, label, direction, proximity, message, announced
+                    FROM feedback_events
+                    WHERE session_id = ? AND category IN ({placeholders})
+                    ORDER BY frame_index""",
+                (session_id, *categories)
+            ).fetchall()
+        return [
+            {
+                "frame_index": row[0],
+                "video_time": row[1],
+                "category": row[2],
+                "label": row[3],
+                "direction": row[4],
+                "proximity": row[5],
+                "message": row[6],
+                "announced": bool(row[7])
+            }
+            for row in rows
+        ]
+    except sqlite3.Error as e:
+        print(f"❌ Error getting hazard timeline: {e}")
+        return []
+
+def get_analysis_sessions(username=None, video_name=None, limit=20):
+    """Most recent analyses for a user or a video"""
+    query = "SELECT id, username, video_name, fps, total_frames, frames_processed, processing_seconds, status, started_at, finished_at FROM analysis_sessions"
+    if username is not None:
+        query += " WHERE username = ?"
+        params = (username, limit)
+    elif video_name is not None:
+        query += " WHERE video_name = ?"
+        params = (video_name, limit)
+    else:
+        params = (limit,)
+    query += " ORDER BY started_at DESC, id DESC LIMIT ?"
+    try:
+        with get_connection() as conn:
+            rows = conn.execute(query, params).fetchall()
+        keys = ["id", "username", "video_name", "fps", "total_frames", "frames_processed",
+                "processing_seconds", "status", "started_at", "finished_at"]
+        return [dict(zip(keys, row)) for row in rows]
+    except sqlite3.Error as e:
+        print(f"❌ Error getting analysis sessions: {e}")
+        return []
+
+# ==================== SESSION RESUME TOKENS ====================
+
+# The resume token travels in the URL (?session=...), so it can leak through
+# browser history, bookmarks, screenshots and Referer headers. Streamlit gives
+# the app no way to set an HttpOnly cookie, so the exposure is limited instead:
+# tokens expire after SESSION_TTL_HOURS and are replaced on every resume, which
+# makes any copy taken from an older URL useless once the owner comes back.
+try:
+    SESSION_TTL_HOURS = float(st.secrets["security"]["session_ttl_hours"])
+except:
+    SESSION_TTL_HOURS = 12.0
+SECRET_FILE_NAME = ".visionmate_session_secret"
+_session_secret = None
+
+def get_session_secret():
+    """Signing key from secrets, or a random key stored next to the database"""
+    global _session_secret
+    if _session_secret is None:
+        try:
+            _session_secret = st.secrets["security"]["session_secret"].encode("utf-8")
+        except:
+            secret_path = os.path.join(os.path.dirname(os.path.abspath(DB_FILE)), SECRET_FILE_NAME)
+            if not os.path.exists(secret_path):
+                fd = os.open(secret_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(fd, "w") as f:
+                    f.write(os.urandom(32).hex())
+            with open(secret_path) as f:
+                _session_secret = f.read().strip().encode("utf-8")
+    return _session_secret
+
+def _sign(value):
+    return hmac.new(get_session_secret(), value.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+def _token_hash(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def _timestamp(moment):
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+def _insert_session(conn, username):
+    value = os.urandom(24).hex()
+    token = f"{value}.{_sign(value)}"
+    expires_at = datetime.datetime.now() + datetime.timedelta(hours=SESSION_TTL_HOURS)
+    conn.execute(
+        "INSERT INTO sessions (token_hash, username, expires_at) VALUES (?, ?, ?)",
+        (_token_hash(token), username, _timestamp(expires_at))
+    )
+    return token
+
+@tracing.traced("db.create_session", "db")
+def create_session(username):
+    """Issue a signed resume token for a logged-in user (None on error)"""
+    try:
+        with get_connection() as conn:
+            token = _insert_session(conn, username)
+        print(f"✅ Session created: {username}")
+        return token
+    except sqlite3.Error as e:
+        print(f"❌ Error creating session: {e}")
+        return None
+
+@tracing.traced("db.resume_session", "db")
+def resume_session(token):
+    """
+    Return {"username", "name", "token"} for a valid, unexpired, unrevoked
+    token, else None. The presented token is revoked and "token" is its
+    replacement, to be put back in the URL. Forged tokens are rejected by
+    their signature without touching the database.
+    """
+    if not token or "." not in token:
+        return None
+    value, signature = token.rsplit(".", 1)
+    if not hmac.compare_digest(_sign(value), signature):
+        print("❌ Session token signature mismatch")
+        return None
+
+    now = _timestamp(datetime.datetime.now())
+    try:
+        with get_connection() as conn:
+            row = conn.execute(
+                """SELECT s.id, u.username, u.name FROM sessions s
+                   JOIN users u ON u.username = s.username
+                   WHERE s.token_hash = ? AND s.revoked = 0 AND s.expires_at > ?""",
+                (_token_hash(token), now)
+            ).fetchone()
+            if not row:
+                return None
+            conn.execute("UPDATE sessions SET last_seen = ?, revoked = 1 WHERE id = ?", (now, row[0]))
+            conn.execute("UPDATE users SET last_login = ? WHERE username = ?", (now, row[1]))
+            new_token = _insert_session(conn, row[1])
+        print(f"✅ Session resumed: {row[1]}")
+        return {"username": row[1], "name": row[2], "token": new_token}
+    except sqlite3.Error as e:
+        print(f"❌ Error resuming session: {e}")
+        return None
+
+@tracing.traced("db.revoke_session", "db")
+def revoke_session(token):
+    """Invalidate a token (logout)"""
+    if not token:
+        return False
+    try:
+        with get_connection() as conn:
+            c = conn.execute("UPDATE sessions SET revoked = 1 WHERE token_hash = ?", (_token_hash(token),))
+        return c.rowcount > 0
+    except sqlite3.Error as e:
+        print(f"❌ Error revoking session: {e}")
+        return False
+
+def purge_expired_sessions():
+    """Delete expired and revoked sessions"""
+    try:
+        with get_connection() as conn:
+            c = conn.execute(
+                "DELETE FROM sessions WHERE revoked = 1 OR expires_at <= ?",
+                (_timestamp(datetime.datetime.now()),)
+            )
+        return c.rowcount
+    except sqlite3.Error as e:
+        print(f"❌ Error purging sessions: {e}")
+        return 0
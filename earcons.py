@@ -0,0 +1,92 @@
+# earcons.py - SYNTHESIZED STEREO HAZARD CUES
+import io
+import time
+import wave
+import functools
+import numpy as np
+import streamlit as st
+
+SAMPLE_RATE = 22050
+
+# Category (from vision_core.feedback_cue) -> (tone frequencies in Hz, pulse length in s).
+# Urgent categories are higher and use more, shorter pulses; "clear" has no earcon.
+CATEGORY_TONES = {
+    "extreme":        ([1320, 1320, 1320, 1320], 0.05),
+    "stop_signal":    ([880, 880, 880], 0.07),
+    "hazard":         ([988, 988], 0.08),
+    "turn":           ([523, 659, 784], 0.07),   # rising arpeggio
+    "bridge":         ([587, 523], 0.10),
+    "crosswalk_wait": ([659, 659], 0.10),
+    "crosswalk_go":   ([659, 880], 0.08),
+    "go":             ([784, 1047], 0.08),
+    "no_path":        ([330], 0.20),
+    "context":        ([440], 0.08),
+}
+
+# Stereo position of each feedback direction (-1 = hard left, 1 = hard right)
+DIRECTION_PAN = {"to the left": -0.85, "ahead": 0.0, "to the right": 0.85}
+
+# Closer objects repeat faster: seconds between earcons of the same situation
+PROXIMITY_INTERVAL = {"VERY CLOSE": 0.3, "nearby": 0.7, "in the distance": 1.5}
+
+@functools.lru_cache(maxsize=None)
+def render_earcon(category, direction):
+    """Render a cue to WAV bytes. Cached, so repeated cues cost nothing to build."""
+    frequencies, pulse = CATEGORY_TONES[category]
+    gap = pulse * 0.6
+    pulse_samples = int(pulse * SAMPLE_RATE)
+    gap_samples = int(gap * SAMPLE_RATE)
+
+    # Short raised-cosine ramps avoid clicks at pulse edges
+    t = np.arange(pulse_samples) / SAMPLE_RATE
+    ramp = min(int(0.005 * SAMPLE_RATE), pulse_samples // 2)
+    envelope = np.ones(pulse_samples)
+    envelope[:ramp] = 0.5 - 0.5 * np.cos(np.linspace(0, np.pi, ramp))
+    envelope[-ramp:] = envelope[:ramp][::-1]
+
+    tones = [np.sin(2 * np.pi * f * t) * envelope for f in frequencies]
+    silence = np.zeros(gap_samples)
+    mono = np.concatenate([part for tone in tones for part in (tone, silence)])
+
+    # Constant-power panning
+    pan = DIRECTION_PAN.get(direction, 0.0)
+    angle = (pan + 1) * np.pi / 4
+    stereo = np.stack([mono * np.cos(angle), mono * np.sin(angle)], axis=1)
+    pcm = (stereo * 0.8 * 32767).astype("<i2")
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+class EarconPlayer:
+    """
+    Plays earcons for per-frame feedback cues without blocking the analysis
+    loop, repeating each situation at a rate set by its proximity.
+    """
+
+    def __init__(self):
+        self.placeholder = st.empty()
+        self.last_key = None
+        self.last_played = 0.0
+
+    def update(self, cue):
+        """Play the cue's earcon if it is due. Returns True when a sound was started."""
+        if cue["category"] not in CATEGORY_TONES:
+            self.last_key = None
+            return False
+        key = (cue["category"], cue["label"], cue["direction"], cue["proximity"])
+        now = time.monotonic()
+        interval = PROXIMITY_INTERVAL.get(cue["proximity"], 1.0)
+        if key == self.last_key and now - self.last_played < interval:
+            return False
+
+        audio = render_earcon(cue["category"], cue["direction"])
+        self.placeholder.empty()  # a fresh element is needed for autoplay to fire again
+        self.placeholder.audio(audio, format="audio/wav", autoplay=True)
+        self.last_key = key
+        self.last_played = now
+        return True
@@ -0,0 +1,202 @@
+# feedback_replay.py - RECORD/REPLAY HARNESS FOR THE FEEDBACK LAYER
+#
+# Usage:
+#   python feedback_replay.py record walk.mp4 walk.npz                 (runs YOLO once)
+#   python feedback_replay.py replay walk.npz --golden walk.golden.json --update-golden
+#   python feedback_replay.py replay walk.npz --golden walk.golden.json   (exit 1 on any diff)
+#   python feedback_replay.py replay walk.npz --fn my_module:my_feedback --repeat 5
+#
+# A fixture holds the extract_yolov8_data() output of every frame plus the
+# frame size, fps and class names, so generate_feedback() (or any function
+# with the same signature) can be driven at full CPU speed without the model.
+import sys
+import json
+import time
+import argparse
+import importlib
+import numpy as np
+
+FIXTURE_VERSION = 1
+
+# --- Recording ---
+
+class FeedbackRecorder:
+    """Collects per-frame detection arrays; save() writes one compressed .npz"""
+
+    def __init__(self, names, frame_width, frame_height, fps):
+        self.names = {int(k): v for k, v in dict(names).items()}
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.fps = fps
+        self.chunks = []
+        self.offsets = [0]
+
+    def add(self, detections):
+        """Record one frame (None or an empty array means no detections)"""
+        if detections is not None and len(detections):
+            rows = np.asarray(detections, dtype=np.float32).reshape(-1, 6)
+            self.chunks.append(rows)
+            self.offsets.append(self.offsets[-1] + len(rows))
+        else:
+            self.offsets.append(self.offsets[-1])
+
+    @property
+    def frames(self):
+        return len(self.offsets) - 1
+
+    def save(self, path):
+        detections = np.concatenate(self.chunks) if self.chunks else np.zeros((0, 6), np.float32)
+        np.savez_compressed(
+            path,
+            version=FIXTURE_VERSION,
+            detections=detections,
+            offsets=np.asarray(self.offsets, dtype=np.int64),
+            frame_size=np.asarray([self.frame_width, self.frame_height], dtype=np.int64),
+            fps=np.float64(self.fps),
+            names=json.dumps(self.names),
+        )
+
+def record_video(video_path, fixture_path, model=None):
+    """Run the detector over a video once and save its detections as a fixture"""
+    import cv2
+    from vision_core import load_model, extract_yolov8_data
+
+    model = model or load_model()
+    cap = cv2.VideoCapture(video_path)
+    recorder = FeedbackRecorder(model.names, int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                                int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), cap.get(cv2.CAP_PROP_FPS) or 30.0)
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        results = model(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), verbose=False)[0]
+        _, detections = extract_yolov8_data(results)
+        recorder.add(detections)
+        if recorder.frames % 500 == 0:
+            print(f"   ... {recorder.frames} frames")
+    cap.release()
+    recorder.save(fixture_path)
+    return recorder.frames
+
+# --- Replay ---
+
+class ReplayResults:
+    """Stands in for the ultralytics Results object (feedback only reads .names)"""
+
+    def __init__(self, names):
+        self.names = names
+
+def load_fixture(path):
+    with np.load(path) as data:
+        if int(data["version"]) != FIXTURE_VERSION:
+            raise ValueError(f"{path}: unsupported fixture version {int(data['version'])}")
+        width, height = (int(v) for v in data["frame_size"])
+        return {
+            "detections": data["detections"],
+            "offsets": data["offsets"],
+            "frame_width": width,
+            "frame_height": height,
+            "fps": float(data["fps"]),
+            "names": {int(k): v for k, v in json.loads(str(data["names"])).items()},
+        }
+
+def iter_frames(fixture):
+    """Yield (results, detections) per frame exactly as extract_yolov8_data returned them"""
+    results = ReplayResults(fixture["names"])
+    detections, offsets = fixture["detections"], fixture["offsets"]
+    for start, end in zip(offsets[:-1], offsets[1:]):
+        yield results, (detections[start:end] if end > start else None)
+
+def replay(fixture, feedback_fn=None):
+    """Drive feedback_fn over every frame; returns (messages, seconds)"""
+    if feedback_fn is None:
+        from vision_core import generate_feedback as feedback_fn
+    width, height = fixture["frame_width"], fixture["frame_height"]
+    started = time.perf_counter()
+    messages = [feedback_fn(results, detections, width, height) for results, detections in iter_frames(fixture)]
+    return messages, time.perf_counter() - started
+
+# --- Golden Runs ---
+
+def to_runs(messages):
+    """Run-length encode per-frame messages as [first_frame, last_frame, message]"""
+    runs = []
+    for index, message in enumerate(messages):
+        if runs and runs[-1][2] == message:
+            runs[-1][1] = index
+        else:
+            runs.append([index, index, message])
+    return runs
+
+def from_runs(runs):
+    messages = []
+    for first, last, message in runs:
+        messages.extend([message] * (last - first + 1))
+    return messages
+
+def save_golden(path, messages):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"frames": len(messages), "runs": to_runs(messages)}, f, indent=1, ensure_ascii=False)
+
+def diff_messages(expected, actual):
+    """[(frame, expected, actual), ...] for every frame whose message changed"""
+    diffs = [(i, e, a) for i, (e, a) in enumerate(zip(expected, actual)) if e != a]
+    for i in range(min(len(expected), len(actual)), max(len(expected), len(actual))):
+        diffs.append((i, expected[i] if i < len(expected) else None, actual[i] if i < len(actual) else None))
+    return diffs
+
+def _load_function(spec):
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr or "generate_feedback")
+
+def main():
+    parser = argparse.ArgumentParser(description="Record/replay harness for the feedback layer")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="run YOLO over a video and save its detections")
+    rec.add_argument("video")
+    rec.add_argument("fixture")
+    rep = sub.add_parser("replay", help="drive the feedback function from a fixture")
+    rep.add_argument("fixture")
+    rep.add_argument("--golden", help="golden messages (JSON) to diff against")
+    rep.add_argument("--update-golden", action="store_true", help="write the golden file from this run")
+    rep.add_argument("--fn", default="vision_core:generate_feedback", help="module:function to replay")
+    rep.add_argument("--repeat", type=int, default=1, help="replay N times for a steadier rate")
+    rep.add_argument("--show", type=int, default=10, help="differences to print")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        print(f"🎬 Recording detections from {args.video}")
+        print(f"✅ Saved {record_video(args.video, args.fixture)} frames to {args.fixture}")
+        return
+
+    fixture = load_fixture(args.fixture)
+    feedback_fn = _load_function(args.fn)
+    frames = len(fixture["offsets"]) - 1
+    seconds = 0.0
+    for _ in range(args.repeat):
+        messages, elapsed = replay(fixture, feedback_fn)
+        seconds += elapsed
+    footage = frames / fixture["fps"]
+    print(f"⏱️ {frames} frames ({footage / 60:.1f} min of footage) x{args.repeat} in {seconds:.2f}s "
+          f"-> {frames * args.repeat / seconds:,.0f} messages/s")
+
+    if not args.golden:
+        return
+    if args.update_golden:
+        save_golden(args.golden, messages)
+        print(f"📝 Golden run written to {args.golden}")
+        return
+
+    with open(args.golden, encoding="utf-8") as f:
+        expected = from_runs(json.load(f)["runs"])
+    diffs = diff_messages(expected, messages)
+    if not diffs:
+        print(f"✅ All {frames} messages match {args.golden}")
+        return
+    print(f"❌ {len(diffs)} of {max(len(expected), frames)} frames differ from {args.golden}")
+    for frame, old, new in diffs[:args.show]:
+        print(f"   frame {frame} ({frame / fixture['fps']:.1f}s):\n      - {old}\n      + {new}")
+    sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+# frame_ring.py - SHARED-MEMORY FRAME RING FOR MULTI-PROCESS INFERENCE
+#
+# Usage: python frame_ring.py walk.mp4 [--workers 4] [--slots 10] [--imgsz 640]
+#                             [--model vision_core:load_model] [--record walk.npz]
+#
+# A decoder process writes each frame into a free slot of a fixed-shape ring in
+# shared memory; N worker processes read their slot in place (no pickling of
+# pixels), run the model plus extract_yolov8_data and hand the slot back. Only
+# the small detection arrays travel through queues, to a single consumer that
+# puts them back in frame order, so generate_feedback sees every frame exactly
+# once and in sequence. A full ring makes the decoder wait (backpressure).
+import os
+import sys
+import time
+import queue
+import argparse
+import importlib
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+
+DEFAULT_MODEL = "vision_core:load_model"
+RESULT_POLL_SECONDS = 1.0   # how often the consumer checks that the other processes are alive
+
+def default_workers():
+    # Leave a core for the decoder and one for the consumer
+    return max(1, (os.cpu_count() or 1) - 2)
+
+# --- Ring Buffer ---
+
+class FrameRing:
+    """Fixed-shape uint8 frame slots in one shared memory block"""
+
+    def __init__(self, slots, shape, name=None):
+        self.slots = slots
+        self.shape = tuple(shape)
+        size = slots * int(np.prod(self.shape))
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            # Spawned processes share the creator's resource tracker, so the
+            # block is unlinked once, by the creator
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf)
+
+    def spec(self):
+        """What another process needs to attach: (name, slots, shape)"""
+        return self.shm.name, self.slots, self.shape
+
+    @classmethod
+    def attach(cls, spec):
+        name, slots, shape = spec
+        return cls(slots, shape, name=name)
+
+    def close(self):
+        self.frames = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+# --- Processes ---
+
+def _load_function(spec):
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+def _limit_threads(threads):
+    """One process per core scales better than every process using every core"""
+    import cv2
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+def _decode(video_path, ring_spec, start_frame, free_slots, work, results, workers):
+    import cv2
+    _limit_threads(1)
+    ring = FrameRing.attach(ring_spec)
+    height, width = ring.shape[:2]
+    cap = cv2.VideoCapture(video_path)
+    count = 0
+    try:
+        if not cap.isOpened():
+            raise OSError(f"cannot open {video_path}")
+        if start_frame:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        while True:
+            slot = free_slots.get()  # waits while every slot is in use
+            ret, frame = cap.read()
+            if not ret:
+                free_slots.put(slot)
+                break
+            if frame.shape != ring.shape:
+                frame = cv2.resize(frame, (width, height))
+            ring.frames[slot] = frame
+            work.put((start_frame + count, slot))
+            count += 1
+        results.put(("end", count))
+    except Exception as e:
+        results.put(("error", f"decoder: {e}"))
+    finally:
+        cap.release()
+        for _ in range(workers):
+            work.put(None)
+        ring.close()
+
+def _infer(ring_spec, model_spec, imgsz, threads, free_slots, work, results):
+    import cv2
+    from vision_core import extract_yolov8_data
+
+    _limit_threads(threads)
+    ring = FrameRing.attach(ring_spec)
+    try:
+        model = _load_function(model_spec)()
+        results.put(("names", dict(model.names)))
+        kwargs = {"verbose": False}
+        if imgsz:
+            kwargs["imgsz"] = imgsz
+        while True:
+            item = work.get()
+            if item is None:
+                break
+            frame_index, slot = item
+            try:
+                # The colour conversion reads the slot in place; after it the slot can be reused
+                img = cv2.cvtColor(ring.frames[slot], cv2.COLOR_BGR2RGB)
+                free_slots.put(slot)
+                slot = None
+                started = time.perf_counter()
+                _, detections = extract_yolov8_data(model(img, **kwargs)[0])
+                results.put(("frame", frame_index, detections, (time.perf_counter() - started) * 1000, None))
+            except Exception as e:
+                # Still report the frame, so the ordered consumer never waits for it
+                if slot is not None:
+                    free_slots.put(slot)
+                results.put(("frame", frame_index, None, 0.0, str(e)))
+    except Exception as e:
+        results.put(("error", f"worker: {e}"))
+    finally:
+        ring.close()
+
+# --- Ordered Consumer ---
+
+class ParallelAnalyzer:
+    """
+    Iterate over (frame_index, detections, inference_ms, error) in frame order
+    while decoding and inference run in other processes. frame_index counts
+    from 0 at the start of the video; start_frame resumes part-way through.
+    """
+
+    def __init__(self, video_path, workers=None, slots=None, model_spec=DEFAULT_MODEL, imgsz=None, start_frame=0):
+        import cv2
+
+        cap = cv2.VideoCapture(video_path)
+        width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        if not width or not height:
+            raise OSError(f"cannot open {video_path}")
+
+        self.frame_width, self.frame_height = width, height
+        self.workers = workers or default_workers()
+        self.slots = slots or 2 * self.workers + 2
+        self.names = None
+        self.ring = FrameRing(self.slots, (height, width, 3))
+
+        # Spawned processes import only what they need (no forked torch or Streamlit state)
+        ctx = mp.get_context("spawn")
+        self._free_slots, self._work, self._results = ctx.Queue(), ctx.Queue(), ctx.Queue()
+        for slot in range(self.slots):
+            self._free_slots.put(slot)
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self._processes = [ctx.Process(target=_decode, name="visionmate-decode", daemon=True,
+                                       args=(video_path, self.ring.spec(), start_frame, self._free_slots,
+                                             self._work, self._results, self.workers))]
+        self._processes += [
+            ctx.Process(target=_infer, name=f"visionmate-infer-{n}", daemon=True,
+                        args=(self.ring.spec(), model_spec, imgsz, threads, self._free_slots, self._work, self._results))
+            for n in range(self.workers)
+        ]
+        for p in self._processes:
+            p.start()
+        self.start_frame = start_frame
+        self._next = start_frame
+        self._pending = {}
+        self._end = None
+
+    @property
+    def frames_done(self):
+        """Frames yielded so far"""
+        return self._next - self.start_frame
+
+    def _receive(self):
+        while True:
+            try:
+                return self._results.get(timeout=RESULT_POLL_SECONDS)
+            except queue.Empty:
+                dead = [p.name for p in self._processes if p.exitcode not in (None, 0)]
+                if dead:
+                    raise RuntimeError(f"{', '.join(dead)} exited unexpectedly")
+
+    def __iter__(self):
+        while self._end is None or self._next < self._end:
+            if self._next in self._pending:
+                yield self._pending.pop(self._next)
+                self._next += 1
+                continue
+            message = self._receive()
+            if message[0] == "frame":
+                _, frame_index, detections, inference_ms, error = message
+                self._pending[frame_index] = (frame_index, detections, inference_ms, error)
+            elif message[0] == "names":
+                self.names = self.names or {int(k): v for k, v in message[1].items()}
+            elif message[0] == "end":
+                self._end = self.start_frame + message[1]
+            else:
+                raise RuntimeError(message[1])
+        self.close()
+
+    def close(self):
+        """Stop the processes (early if iteration was abandoned) and free the ring"""
+        finished = self._end is not None and self._next >= self._end
+        for p in self._processes:
+            if finished:
+                p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring.unlink()
+            self.ring = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-process YOLO analysis through a shared-memory frame ring")
+    parser.add_argument("video")
+    parser.add_argument("--workers", type=int, default=None, help=f"inference processes (default {default_workers()})")
+    parser.add_argument("--slots", type=int, default=None, help="frames in the ring (default 2 x workers + 2)")
+    parser.add_argument("--imgsz", type=int, default=None)
+    parser.add_argument("--model", default=DEFAULT_MODEL, help="module:function returning a YOLO-like model")
+    parser.add_argument("--record", help="save the detections as a feedback_replay fixture")
+    args = parser.parse_args()
+
+    from vision_core import generate_feedback
+    from feedback_replay import FeedbackRecorder, ReplayResults
+
+    analyzer = ParallelAnalyzer(args.video, args.workers, args.slots, args.model, args.imgsz)
+    print(f"🔧 {analyzer.workers} workers, {analyzer.slots} slots of {analyzer.frame_width}x{analyzer.frame_height} "
+          f"({analyzer.ring.shm.size / 1e6:.0f} MB shared)")
+    recorder, results, errors = None, None, 0
+    started = time.perf_counter()
+    with analyzer:
+        for frame_index, detections, inference_ms, error in analyzer:
+            if results is None:
+                results = ReplayResults(analyzer.names)
+                if args.record:
+                    recorder = FeedbackRecorder(analyzer.names, analyzer.frame_width, analyzer.frame_height, analyzer.fps)
+            if error:
+                # No detections for this frame: it is not "Path clear", so it gets no feedback
+                errors += 1
+                print(f"⚠️ Frame {frame_index}: {error}")
+                continue
+            generate_feedback(results, detections, analyzer.frame_width, analyzer.frame_height)
+            if recorder is not None:
+                recorder.add(detections)
+            if (frame_index + 1) % 500 == 0:
+                print(f"   ... {frame_index + 1} frames")
+    elapsed = time.perf_counter() - started
+    frames = analyzer.frames_done
+    print(f"⏱️ {frames} frames in {elapsed:.1f}s -> {frames / elapsed:.1f} fps (video {analyzer.fps:.0f} fps)")
+    if recorder is not None and errors:
+        print(f"⚠️ Fixture not saved: {errors} frames have no detections to replay")
+    elif recorder is not None:
+        recorder.save(args.record)
+        print(f"💾 Detections saved to {args.record}")
+    if errors:
+        print(f"❌ {errors} frames failed")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# hazard_stats.py - INCREMENTAL PER-VIDEO HAZARD STATISTICS
+#
+# HazardStats is updated once per analysed frame with that frame's detections
+# and feedback cue. Everything is kept in small NumPy arrays indexed by class
+# id, so an update costs the same on frame 10 as on frame 100,000 and nothing
+# has to be re-read when the video ends. Frames replayed after a voice seek
+# back are counted once. summary() turns the counters into
+# a short spoken sentence and a written report; rows() is what the database stores.
+import numpy as np
+
+# Proximity bands, using feedback_cue's thresholds on the bottom edge of a box
+BANDS = ("in the distance", "nearby", "VERY CLOSE")
+BAND_EDGES = np.array([0.6, 0.8])
+ALERT_CATEGORIES = ("extreme", "hazard", "stop_signal")
+
+def plural(count, word):
+    return f"{count} {word}{'s' if count != 1 else ''}"
+
+def format_time(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes}:{seconds:02d}"
+
+class HazardStats:
+    """Per-class occurrence, closest approach, time per proximity band and alert counts"""
+
+    def __init__(self, names, fps, frame_height):
+        self.names = {int(k): v for k, v in dict(names).items()}
+        self.class_ids = {label: cls for cls, label in self.names.items()}
+        self.fps = fps
+        self.frame_height = frame_height
+        classes = max(self.names) + 1 if self.names else 1
+        self.frames = 0                                             # distinct source frames counted
+        self.covered = np.zeros(1024, dtype=bool)                   # by frame index, grown as needed
+        self.frames_seen = np.zeros(classes, dtype=np.int64)        # frames with at least one instance
+        self.detections = np.zeros(classes, dtype=np.int64)         # instances over all frames
+        self.band_frames = np.zeros((classes, len(BANDS)), dtype=np.int64)  # frames by the closest instance's band
+        self.closest = np.full(classes, -1.0)                       # largest bottom edge / frame height
+        self.closest_frame = np.full(classes, -1, dtype=np.int64)
+        self.alerts = np.zeros(classes, dtype=np.int64)
+        self._frame_closest = np.empty(classes)
+
+    def update(self, frame_index, detections, cue=None, new_alert=False):
+        """Add one frame (detections as from extract_yolov8_data; new_alert when its hazard cue just started)"""
+        if frame_index >= len(self.covered):
+            self.covered = np.concatenate([self.covered, np.zeros(max(frame_index + 1, len(self.covered)), dtype=bool)])
+        if self.covered[frame_index]:
+            return  # replayed after a seek back
+        self.covered[frame_index] = True
+        self.frames += 1
+        if new_alert and cue and cue.get("category") in ALERT_CATEGORIES and cue.get("label") in self.class_ids:
+            self.alerts[self.class_ids[cue["label"]]] += 1
+        if detections is None or len(detections) == 0:
+            return
+
+        classes = detections[:, 5].astype(np.int64)
+        bottoms = detections[:, 3] / self.frame_height
+        self.detections += np.bincount(classes, minlength=len(self.detections))
+
+        # Closest instance of each class in this frame
+        frame_closest = self._frame_closest
+        frame_closest.fill(-1.0)
+        np.maximum.at(frame_closest, classes, bottoms)
+        present = frame_closest >= 0
+        self.frames_seen[present] += 1
+        self.band_frames[present, np.searchsorted(BAND_EDGES, frame_closest[present], side="left")] += 1
+
+        closer = frame_closest > self.closest
+        self.closest[closer] = frame_closest[closer]
+        self.closest_frame[closer] = frame_index
+
+    # --- Results ---
+
+    def rows(self):
+        """One dict per class that was seen, most frequent first"""
+        rows = []
+        for cls in np.flatnonzero(self.frames_seen):
+            rows.append({
+                "label": self.names.get(int(cls), str(cls)),
+                "frames_seen": int(self.frames_seen[cls]),
+                "detections": int(self.detections[cls]),
+                "closest": round(float(self.closest[cls]), 3),
+                "closest_band": BANDS[int(np.searchsorted(BAND_EDGES, self.closest[cls], side="left"))],
+                "closest_seconds": round(float(self.closest_frame[cls]) / self.fps, 2),
+                "distance_seconds": round(float(self.band_frames[cls, 0]) / self.fps, 2),
+                "nearby_seconds": round(float(self.band_frames[cls, 1]) / self.fps, 2),
+                "very_close_seconds": round(float(self.band_frames[cls, 2]) / self.fps, 2),
+                "alerts": int(self.alerts[cls]),
+            })
+        return sorted(rows, key=lambda row: row["frames_seen"], reverse=True)
+
+    def summary(self):
+        """(spoken, written) end-of-run summary"""
+        rows = self.rows()
+        duration = self.frames / self.fps  # covered frames, so seeks neither add nor drop time
+        if not rows:
+            return (f"Analysis complete. {format_time(duration)} of video analysed. No objects were detected.",
+                    f"Analysed {format_time(duration)} of video ({self.frames} frames): no objects detected.")
+
+        alerts = int(self.alerts.sum())
+        spoken = [f"Analysis complete. {format_time(duration)} of video analysed."]
+        if alerts:
+            alerted = [row for row in rows if row["alerts"]]
+            alerted.sort(key=lambda row: row["alerts"], reverse=True)
+            spoken.append(f"{plural(alerts, 'hazard alert')}, most for "
+                          + " and ".join(row["label"] for row in alerted[:2]) + ".")
+        else:
+            spoken.append("No hazard alerts.")
+        closest = max(rows, key=lambda row: row["closest"])
+        spoken.append(f"Closest approach: {closest['label']} {closest['closest_band']} "
+                      f"at {format_time(closest['closest_seconds'])}.")
+        spoken.append(f"Most frequent: {rows[0]['label']}, in {rows[0]['frames_seen'] / self.frames:.0%} of frames.")
+
+        written = [f"Analysed {format_time(duration)} of video ({self.frames} frames), {plural(alerts, 'hazard alert')}.", ""]
+        for row in rows:
+            written.append(
+                f"- **{row['label']}**: {row['frames_seen'] / self.frames:.0%} of frames, "
+                f"closest {row['closest_band']} at {format_time(row['closest_seconds'])}, "
+                f"{row['nearby_seconds']:.0f}s nearby, {row['very_close_seconds']:.0f}s very close, "
+                f"{plural(row['alerts'], 'alert')}"
+            )
+        return " ".join(spoken), "\n".join(written)
@@ -0,0 +1,191 @@
+# intents.py - VOICE INTENT REGISTRY AND ROUTER
+import re
+import difflib
+import functools
+from collections import deque
+
+# --- Intent Registry ---
+
+# Phrases per language and intent. Misrecognitions that Google/Vosk commonly
+# produce for our commands are listed alongside the real phrases.
+PHRASES = {
+    "en": {
+        "register": ["register", "registration", "sign up", "signup", "registrar", "rejister"],
+        "login": ["login", "log in", "sign in", "signin", "log on", "logan"],
+        "analyze_video": ["analyze video", "analyse video", "analyze the video", "analyse the video",
+                          "analyzed video", "upload video", "process file", "process video"],
+        "logout": ["logout", "log out", "sign out", "log off"],
+        "cancel": ["cancel", "back", "go back", "stop"],
+        "next_scene": ["next scene", "skip scene", "skip ahead", "next part"],
+        "previous_scene": ["go back", "back", "previous scene", "last scene", "rewind"],
+        "skip_to_crossing": ["skip to crossing", "skip to the crossing", "find crossing", "find the crossing",
+                             "next crossing", "skip to crosswalk", "go to crossing"],
+    },
+}
+
+# Which intents each voice state accepts. Per-state phrases resolve words that
+# mean different things in different places ("stop" logs out from home).
+STATE_INTENTS = {
+    "welcome": ["register", "login"],
+    "reg_name": ["cancel"],
+    "reg_email": ["cancel"],
+    "reg_user": ["cancel"],
+    "reg_pass": ["cancel"],
+    "login_user": ["cancel"],
+    "login_pass": ["cancel"],
+    "home": ["analyze_video", "logout"],
+    "video": ["next_scene", "previous_scene", "skip_to_crossing"],
+}
+STATE_PHRASES = {
+    "home": {"logout": ["stop", "exit"]},
+}
+
+# Dictation states (names, emails, passwords) only match exact phrases so that
+# a name that merely sounds like "cancel" is not treated as a command.
+FUZZY_STATES = {"welcome", "home"}
+FUZZY_CUTOFF = 0.8
+MIN_CONFIDENCE = 0.5
+
+def register_phrases(intent, phrases, state=None, lang="en"):
+    """Add phrases for an intent globally, or only within one state"""
+    if state is None:
+        PHRASES.setdefault(lang, {}).setdefault(intent, []).extend(phrases)
+    else:
+        STATE_PHRASES.setdefault(state, {}).setdefault(intent, []).extend(phrases)
+        if intent not in STATE_INTENTS.setdefault(state, []):
+            STATE_INTENTS[state].append(intent)
+    get_router.cache_clear()
+
+def normalize(text):
+    """Lowercase, drop punctuation and pad with spaces so patterns match whole words"""
+    return " " + " ".join(re.sub(r"[^a-z0-9' ]+", " ", text.lower()).split()) + " "
+
+# --- Compiled Matcher ---
+
+class IntentRouter:
+    """
+    All phrases of one state compiled into a single Aho-Corasick automaton,
+    so each hypothesis is scanned once regardless of how many phrases exist.
+    """
+
+    def __init__(self, phrase_intents, fuzzy=False):
+        self.phrase_intents = phrase_intents
+        self.fuzzy = fuzzy
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        # Keyed by the normalised pattern, so the automaton reports intents directly
+        patterns = {normalize(phrase): intent for phrase, intent in phrase_intents.items()}
+        for pattern, intent in patterns.items():
+            self._add(pattern, intent)
+        self._build_failure_links()
+
+    def _add(self, pattern, intent):
+        node = 0
+        for ch in pattern:
+            if ch not in self._goto[node]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+                self._goto[node][ch] = len(self._goto) - 1
+            node = self._goto[node][ch]
+        self._out[node].append(intent)
+
+    def _build_failure_links(self):
+        pending = deque(self._goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for ch, child in self._goto[node].items():
+                pending.append(child)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def scan(self, text):
+        """Intents whose phrases occur in text, as {intent: match_score}"""
+        text = normalize(text)
+        found = {}
+        node = 0
+        for ch in text:
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for intent in self._out[node]:
+                found[intent] = 1.0
+
+        if not found and self.fuzzy:
+            found = self._fuzzy_scan(text.split())
+        return found
+
+    def _fuzzy_scan(self, words):
+        found = {}
+        for phrase, intent in self.phrase_intents.items():
+            size = len(phrase.split())
+            for start in range(max(1, len(words) - size + 1)):
+                candidate = " ".join(words[start:start + size])
+                score = difflib.SequenceMatcher(None, phrase, candidate).ratio()
+                if score >= FUZZY_CUTOFF and score > found.get(intent, 0.0):
+                    found[intent] = score
+        return found
+
+    def route(self, hypotheses):
+        """
+        Score recognizer hypotheses and return (intent, confidence).
+        hypotheses may be a plain string, a recognition result dict or a
+        list of (text, confidence) alternatives.
+        """
+        if not hypotheses:
+            return None, 0.0
+        if isinstance(hypotheses, str):
+            hypotheses = [(hypotheses, 1.0)]
+        elif isinstance(hypotheses, dict):
+            hypotheses = hypotheses.get("alternatives") or [(hypotheses.get("text", ""), 1.0)]
+
+        scores = {}
+        total_weight = 0.0
+        for rank, (text, confidence) in enumerate(hypotheses):
+            matches = self.scan(text)
+            if confidence > 0:
+                weight = confidence
+            elif matches:
+                weight = 1.0 / (rank + 2)
+            else:
+                # Backends (Google n-best) leave lower ranks unscored; one that
+                # matches nothing is no evidence and must not dilute the others
+                continue
+            total_weight += weight
+            for intent, match in matches.items():
+                scores[intent] = scores.get(intent, 0.0) + weight * match
+
+        if not scores:
+            return None, 0.0
+        intent = max(scores, key=scores.get)
+        return intent, scores[intent] / total_weight
+
+@functools.lru_cache(maxsize=None)
+def get_router(state, lang="en"):
+    phrases = PHRASES.get(lang, {})
+    phrase_intents = {}
+    for intent in STATE_INTENTS.get(state, []):
+        for phrase in phrases.get(intent, []):
+            phrase_intents[" ".join(phrase.lower().split())] = intent
+    # State-specific phrases win over shared ones
+    for intent, extra in STATE_PHRASES.get(state, {}).items():
+        for phrase in extra:
+            phrase_intents[" ".join(phrase.lower().split())] = intent
+    return IntentRouter(phrase_intents, fuzzy=state in FUZZY_STATES)
+
+# --- Public Helpers ---
+
+def route(state, hypotheses, lang="en"):
+    """Resolve what the user asked for in a given state: (intent, confidence)"""
+    intent, confidence = get_router(state, lang).route(hypotheses)
+    if confidence < MIN_CONFIDENCE:
+        return None, confidence
+    return intent, confidence
+
+def state_phrases(state, lang="en"):
+    """Every phrase a state accepts, e.g. as an offline recognizer grammar"""
+    return list(get_router(state, lang).phrase_intents)
@@ -0,0 +1,162 @@
+# load_test_db.py - CONCURRENT LOAD TEST FOR THE DATABASE LAYER
+#
+# Usage: python load_test_db.py [--workers 16] [--duration 30] [--mix register=10,login=60,lookup=30]
+#                               [--seed-users 1000] [--hash-ms 100]
+#
+# Runs against a temporary database (visionmate.db is never touched) and
+# reports per-operation latency percentiles, throughput and lock errors.
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import contextlib
+import database as db
+
+PASSWORD = "loadtest1"
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - {"register", "login", "lookup"}
+    if unknown:
+        raise ValueError(f"unknown operations in mix: {', '.join(sorted(unknown))}")
+    return mix
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+class Stats:
+    """Thread-safe latency and error collection per operation"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.lock_errors = {}
+
+    def record(self, op, seconds, error=None):
+        with self.lock:
+            self.latencies.setdefault(op, []).append(seconds * 1000)
+            if error:
+                self.errors[op] = self.errors.get(op, 0) + 1
+                if "locked" in error.lower() or "busy" in error.lower():
+                    self.lock_errors[op] = self.lock_errors.get(op, 0) + 1
+
+def seed_users(count):
+    """Insert users directly with one shared hash so seeding is fast"""
+    hashed = db.hash_password(PASSWORD)
+    rows = [("Seed User", f"seed{i}@example.com", f"seed{i}", hashed) for i in range(count)]
+    for start in range(0, len(rows), 1000):
+        db.add_users_bulk(rows[start:start + 1000])
+    return [f"seed{i}" for i in range(count)]
+
+def run_worker(worker_id, deadline, mix, usernames, usernames_lock, stats):
+    rng = random.Random(worker_id)
+    ops, weights = list(mix), list(mix.values())
+    serial = 0
+    while time.perf_counter() < deadline:
+        op = rng.choices(ops, weights)[0]
+        started = time.perf_counter()
+        error = None
+
+        if op == "register":
+            serial += 1
+            username = f"load{worker_id}x{serial}"
+            result = db.add_user("Load User", f"{username}@example.com", username, PASSWORD)
+            if result is True:
+                with usernames_lock:
+                    usernames.append(username)
+            else:
+                error = str(result)
+
+        elif op == "login":
+            with usernames_lock:
+                username = rng.choice(usernames)
+            ok, message = db.check_user(username, PASSWORD)
+            if not ok:
+                error = message
+
+        else:
+            with usernames_lock:
+                username = rng.choice(usernames)
+            if db.get_user_info(username) is None:
+                error = "lookup failed (see log for database error)"
+
+        stats.record(op, time.perf_counter() - started, error)
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for database.py")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--mix", default="register=10,login=60,lookup=30")
+    parser.add_argument("--seed-users", type=int, default=1000)
+    parser.add_argument("--hash-ms", type=float, default=None,
+                        help="override the password hashing budget (e.g. 1 to load only SQLite)")
+    parser.add_argument("--pool-size", type=int, default=db.POOL_SIZE)
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+    if args.seed_users < 1:
+        # login and lookup pick an existing account
+        parser.error("--seed-users must be at least 1")
+
+    if args.hash_ms is not None:
+        db.TARGET_HASH_MS = args.hash_ms
+        db.MIN_ITERATIONS = 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(os.path.join(tmp, "loadtest.db"), pool_size=args.pool_size)
+        stats = Stats()
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.init_db()
+            usernames = seed_users(args.seed_users)
+        usernames_lock = threading.Lock()
+
+        print(f"🔧 {args.workers} workers, {args.duration:.0f}s, mix {args.mix}, "
+              f"{args.seed_users} seeded users, {db.get_iterations()} hash iterations")
+
+        deadline = time.perf_counter() + args.duration
+        workers = [
+            threading.Thread(target=run_worker, args=(n, deadline, mix, usernames, usernames_lock, stats))
+            for n in range(args.workers)
+        ]
+        started = time.perf_counter()
+        # The database module logs every call; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+        elapsed = time.perf_counter() - started
+        db.get_pool().close_all()
+
+    print("\n" + "=" * 86)
+    print(f"{'operation':<10}{'count':>8}{'ops/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'max ms':>9}{'errors':>8}{'locked':>8}")
+    print("=" * 86)
+    total = 0
+    for op in mix:
+        latencies = stats.latencies.get(op, [])
+        if not latencies:
+            continue
+        total += len(latencies)
+        print(f"{op:<10}{len(latencies):>8}{len(latencies) / elapsed:>9.1f}"
+              f"{percentile(latencies, 50):>9.1f}{percentile(latencies, 95):>9.1f}"
+              f"{percentile(latencies, 99):>9.1f}{max(latencies):>9.1f}"
+              f"{stats.errors.get(op, 0):>8}{stats.lock_errors.get(op, 0):>8}")
+    print("-" * 86)
+    print(f"{'total':<10}{total:>8}{total / elapsed:>9.1f}")
+
+    if sum(stats.lock_errors.values()):
+        print("\n⚠️ Lock contention errors occurred")
+        sys.exit(1)
+    print("\n✅ No lock contention errors")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# memory_budget.py - MEMORY BUDGETS FOR THE UPLOAD & ANALYSIS PATH
+import os
+import sys
+import time
+import tempfile
+import streamlit as st
+
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+# Budgets come from secrets ([limits] section) with these defaults
+def _limit(key, default):
+    try:
+        return type(default)(st.secrets["limits"][key])
+    except Exception:
+        return default
+
+UPLOAD_BUDGET_MB = _limit("upload_mb", 500)            # largest accepted upload
+UPLOAD_CHUNK_BYTES = 1024 * 1024                       # uploads are copied to disk in 1 MB chunks
+ANALYSIS_RUN_FRAMES = _limit("analysis_run_frames", 1800)
+ANALYSIS_RSS_GROWTH_MB = _limit("analysis_rss_growth_mb", 200)
+STALE_VIDEO_HOURS = _limit("stale_video_hours", 6)
+RSS_SAMPLE_FRAMES = 30                                 # sample RSS once per this many frames
+
+# Uploaded videos live here so abandoned ones can be found and removed
+VIDEO_DIR = os.path.join(tempfile.gettempdir(), "visionmate_videos")
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds UPLOAD_BUDGET_MB"""
+
+# --- Resident Memory ---
+
+def rss_mb():
+    """Current resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    """Highest resident set size so far in MB (0 when the platform can't tell)"""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+class RssTracker:
+    """
+    RSS samples across one analysis run. over_budget() tells the caller to end
+    the run early so Streamlit can release the media it has been holding.
+    """
+
+    def __init__(self, growth_budget_mb=None):
+        self.growth_budget_mb = growth_budget_mb or ANALYSIS_RSS_GROWTH_MB
+        self.start_mb = rss_mb()
+        self.current_mb = self.start_mb
+        self.peak_mb = self.start_mb
+        self.samples = 0
+
+    def sample(self):
+        self.current_mb = rss_mb()
+        self.peak_mb = max(self.peak_mb, self.current_mb)
+        self.samples += 1
+        return self.current_mb
+
+    @property
+    def growth_mb(self):
+        return self.current_mb - self.start_mb
+
+    def over_budget(self):
+        return self.growth_mb > self.growth_budget_mb
+
+    def summary(self):
+        return f"RSS {self.current_mb:.0f} MB (start {self.start_mb:.0f}, peak {self.peak_mb:.0f}, {self.growth_mb:+.0f} MB)"
+
+# --- Uploaded Videos ---
+
+def save_upload(uploaded_file, budget_mb=None):
+    """
+    Copy an uploaded file to VIDEO_DIR in fixed-size chunks instead of
+    materialising a second in-memory copy. Returns the temp file path.
+    """
+    budget_bytes = (budget_mb or UPLOAD_BUDGET_MB) * 1024 * 1024
+    size = getattr(uploaded_file, "size", None)
+    if size is not None and size > budget_bytes:
+        raise UploadTooLarge(f"Video is {size / (1024 * 1024):.0f} MB; the limit is {budget_bytes // (1024 * 1024)} MB")
+
+    os.makedirs(VIDEO_DIR, exist_ok=True)
+    suffix = os.path.splitext(uploaded_file.name)[1]
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="upload_", dir=VIDEO_DIR)
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = uploaded_file.read(UPLOAD_CHUNK_BYTES)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > budget_bytes:
+                    raise UploadTooLarge(f"Video exceeds the {budget_bytes // (1024 * 1024)} MB limit")
+                out.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+def touch_video(path):
+    """Mark a video as in use so cleanup_stale_videos() leaves it alone"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def cleanup_stale_videos(max_age_hours=None):
+    """Delete uploads untouched for max_age_hours (sessions that died mid-analysis)"""
+    cutoff = time.time() - (max_age_hours or STALE_VIDEO_HOURS) * 3600
+    removed = 0
+    if not os.path.isdir(VIDEO_DIR):
+        return removed
+    for entry in os.scandir(VIDEO_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except OSError:
+            pass  # removed concurrently or still locked (Windows)
+    if removed:
+        print(f"🧹 Removed {removed} stale uploaded video(s)")
+    return removed
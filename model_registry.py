@@ -0,0 +1,339 @@
+# model_registry.py - VERSIONED MODEL WEIGHTS & HOT RELOAD
+#
+# Usage:
+#   python model_registry.py list
+#   python model_registry.py register runs/detect/train7/weights/best.pt --version v2 --notes "more crosswalks"
+#   python model_registry.py activate v2        (running analyses switch at the next frame)
+#   python model_registry.py evaluate v2 data.yaml
+#   python model_registry.py verify
+#
+# Weights live in fine_tuned_weights/ and are described by registry.json:
+#   {"active": "v2", "models": {"v2": {"path", "sha256", "size", "registered_at", "notes",
+#                                      "metrics": {...}, "latency_ms": {...}}}}
+# Without a registry.json the original fine_tuned_weights/best.pt is used as "default".
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import hashlib
+import argparse
+import datetime
+import threading
+import numpy as np
+
+REGISTRY_DIR = "fine_tuned_weights"
+REGISTRY_FILE = os.path.join(REGISTRY_DIR, "registry.json")
+DEFAULT_WEIGHTS = os.path.join(REGISTRY_DIR, "best.pt")
+SHARED_DIR = os.path.join(REGISTRY_DIR, "shared")   # prepared copies that every process memory-maps
+RELOAD_CHECK_SECONDS = 2.0    # how often a running app looks for a new active version
+LATENCY_WINDOW = 500          # inference timings kept per version
+LATENCY_SAVE_EVERY = 1000     # frames between latency summaries written to the registry
+
+_registry_lock = threading.Lock()
+
+# --- Registry File ---
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_registry():
+    if not os.path.exists(REGISTRY_FILE):
+        models = {}
+        if os.path.exists(DEFAULT_WEIGHTS):
+            models["default"] = {"path": DEFAULT_WEIGHTS, "sha256": None, "notes": "original best.pt"}
+        return {"active": "default" if models else None, "models": models}
+    with open(REGISTRY_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_registry(registry):
+    """Atomic replace, so readers never see a half-written file"""
+    os.makedirs(REGISTRY_DIR, exist_ok=True)
+    # A unique temp file per writer: the app and the batch daemon may save at the same time
+    fd, tmp_path = tempfile.mkstemp(prefix="registry_", suffix=".tmp", dir=REGISTRY_DIR)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(registry, f, indent=2)
+        os.replace(tmp_path, REGISTRY_FILE)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def update_registry(fn):
+    """Read-modify-write the registry (serialised within this process)"""
+    with _registry_lock:
+        registry = load_registry()
+        result = fn(registry)
+        for entry in registry["models"].values():
+            if entry.get("sha256") is None and os.path.exists(entry["path"]):
+                entry["sha256"] = file_sha256(entry["path"])
+                entry["size"] = os.path.getsize(entry["path"])
+        save_registry(registry)
+        return result
+
+def register_model(path, version=None, notes="", metrics=None):
+    """Copy weights into the registry under a version name and record their hash"""
+    sha256 = file_sha256(path)
+
+    def add(registry):
+        name = version or f"v{len(registry['models']) + 1}"
+        if name in registry["models"]:
+            raise ValueError(f"version {name} already exists")
+        for other, entry in registry["models"].items():
+            if entry.get("sha256") == sha256:
+                raise ValueError(f"identical weights are already registered as {other}")
+        dest = os.path.join(REGISTRY_DIR, f"{name}.pt")
+        if os.path.abspath(path) != os.path.abspath(dest):
+            shutil.copyfile(path, dest)
+        registry["models"][name] = {
+            "path": dest, "sha256": sha256, "size": os.path.getsize(dest),
+            "registered_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "notes": notes, "metrics": metrics or {}, "latency_ms": {},
+        }
+        if registry.get("active") is None:
+            registry["active"] = name
+        return name
+    return update_registry(add)
+
+def activate(version):
+    def set_active(registry):
+        if version not in registry["models"]:
+            raise KeyError(f"unknown model version {version}")
+        registry["active"] = version
+    update_registry(set_active)
+
+def verify_entry(entry):
+    """False if the weights on disk no longer match the registered hash"""
+    return entry.get("sha256") is None or file_sha256(entry["path"]) == entry["sha256"]
+
+def record_metadata(version, key, values):
+    """Merge values into models[version][key] (e.g. "metrics" or "latency_ms")"""
+    def merge(registry):
+        if version in registry["models"]:
+            registry["models"][version].setdefault(key, {}).update(values)
+    update_registry(merge)
+
+# --- Loading ---
+
+def shared_weights_path(entry):
+    return os.path.join(SHARED_DIR, f"{(entry.get('sha256') or file_sha256(entry['path']))[:16]}.pt")
+
+def _publish_shared(module, path):
+    """Write the prepared network once; when several processes race, all of them map the first copy"""
+    import torch
+
+    os.makedirs(SHARED_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=SHARED_DIR)
+    os.close(fd)
+    try:
+        torch.save(module, tmp_path)
+        try:
+            os.link(tmp_path, path)  # atomic create-if-absent
+        except FileExistsError:
+            pass
+        except OSError:
+            os.replace(tmp_path, path)  # filesystem without hard links
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def load_weights(entry):
+    """
+    Load a YOLO model for a registry entry. The first load writes a fused
+    float32 copy of the network to fine_tuned_weights/shared/; every process
+    (the app, frame_ring and batch_daemon workers) then memory-maps that file
+    read-only, so they share its page-cache pages instead of each holding a
+    private copy of the weights.
+    """
+    import torch
+    from ultralytics import YOLO
+
+    if not verify_entry(entry):
+        raise ValueError(f"{entry['path']} does not match its registered sha256")
+    model = YOLO(entry["path"])
+    shared_path = shared_weights_path(entry)
+    try:
+        if not os.path.exists(shared_path):
+            # Fused and converted up front, so predict() has nothing left to rewrite in the mapped tensors
+            model.model.fuse(verbose=False)
+            _publish_shared(model.model.float().eval(), shared_path)
+        model.model = torch.load(shared_path, map_location="cpu", mmap=True, weights_only=False)
+    except (TypeError, OSError, RuntimeError) as e:
+        # torch < 2.1 cannot mmap; the private copy still works
+        print(f"⚠️ Could not memory-map {shared_path}, using a private copy: {e}")
+    model.model.eval()
+    return model
+
+class ModelHandle:
+    """
+    Callable stand-in for the active YOLO model. Each call uses whichever model
+    is current at that moment, so a newly activated version takes over between
+    frames; it is loaded on a background thread and swapped in with a single
+    reference assignment. Inference latency is tracked per version.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loading = None
+        self._last_check = 0.0
+        self._registry_mtime = None
+        self._latencies = {}
+        self._frames = {}
+        registry = load_registry()
+        if registry["active"] is None:
+            raise FileNotFoundError(f"no model weights found in {REGISTRY_DIR}")
+        self._current = (registry["active"], load_weights(registry["models"][registry["active"]]))
+        self._registry_mtime = self._mtime()
+        print(f"🧠 Model {registry['active']} loaded")
+
+    @staticmethod
+    def _mtime():
+        try:
+            return os.path.getmtime(REGISTRY_FILE)
+        except OSError:
+            return None
+
+    @property
+    def version(self):
+        return self._current[0]
+
+    @property
+    def names(self):
+        return self._current[1].names
+
+    def __call__(self, *args, **kwargs):
+        self._check_for_update()
+        version, model = self._current
+        started = time.perf_counter()
+        result = model(*args, **kwargs)
+        self._record_latency(version, (time.perf_counter() - started) * 1000)
+        return result
+
+    # --- Hot Reload ---
+
+    def _check_for_update(self):
+        now = time.monotonic()
+        if now - self._last_check < RELOAD_CHECK_SECONDS:
+            return
+        self._last_check = now
+        mtime = self._mtime()
+        if mtime == self._registry_mtime:
+            return
+        self._registry_mtime = mtime
+        try:
+            registry = load_registry()
+            active, models = registry["active"], dict(registry["models"])
+        except (ValueError, OSError, KeyError, TypeError) as e:
+            # Hand-edited or unreadable registry: keep running on the current model
+            print(f"⚠️ Could not read {REGISTRY_FILE}, keeping model {self._current[0]}: {e}")
+            return
+        with self._lock:
+            if active == self._current[0] or active == self._loading or active not in models:
+                return
+            self._loading = active
+        threading.Thread(target=self._load_and_swap, args=(active, models[active]),
+                         name="visionmate-model-reload", daemon=True).start()
+
+    def _load_and_swap(self, version, entry):
+        try:
+            model = load_weights(entry)
+            self._current = (version, model)
+            print(f"🔄 Switched to model {version}")
+        except Exception as e:
+            print(f"⚠️ Could not load model {version}, keeping {self._current[0]}: {e}")
+        finally:
+            with self._lock:
+                self._loading = None
+
+    # --- Latency Metadata ---
+
+    def _record_latency(self, version, ms):
+        with self._lock:
+            window = self._latencies.setdefault(version, [])
+            window.append(ms)
+            if len(window) > LATENCY_WINDOW:
+                del window[0]
+            self._frames[version] = self._frames.get(version, 0) + 1
+            save = self._frames[version] % LATENCY_SAVE_EVERY == 0
+            summary = self.latency_summary(version) if save else None
+        if save:
+            threading.Thread(target=record_metadata, args=(version, "latency_ms", summary), daemon=True).start()
+
+    def latency_summary(self, version):
+        window = np.array(self._latencies.get(version, []))
+        if window.size == 0:
+            return {}
+        return {
+            "p50": round(float(np.percentile(window, 50)), 1),
+            "p95": round(float(np.percentile(window, 95)), 1),
+            "frames": self._frames.get(version, 0),
+            "measured_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+
+# --- Accuracy ---
+
+def evaluate(version, data_yaml):
+    """Run ultralytics validation and store mAP/precision/recall for comparison"""
+    entry = load_registry()["models"][version]
+    results = load_weights(entry).val(data=data_yaml, verbose=False)
+    metrics = {
+        "mAP50": round(float(results.box.map50), 4),
+        "mAP50-95": round(float(results.box.map), 4),
+        "precision": round(float(results.box.mp), 4),
+        "recall": round(float(results.box.mr), 4),
+        "dataset": os.path.basename(data_yaml),
+    }
+    record_metadata(version, "metrics", metrics)
+    return metrics
+
+def main():
+    parser = argparse.ArgumentParser(description="VisionMate model registry")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list")
+    sub.add_parser("verify")
+    reg = sub.add_parser("register")
+    reg.add_argument("path")
+    reg.add_argument("--version")
+    reg.add_argument("--notes", default="")
+    act = sub.add_parser("activate")
+    act.add_argument("version")
+    ev = sub.add_parser("evaluate")
+    ev.add_argument("version")
+    ev.add_argument("data")
+    args = parser.parse_args()
+
+    try:
+        run_command(args)
+    except (ValueError, KeyError, FileNotFoundError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+def run_command(args):
+    if args.command == "register":
+        print(f"✅ Registered {register_model(args.path, args.version, args.notes)}")
+    elif args.command == "activate":
+        activate(args.version)
+        print(f"✅ {args.version} is now active")
+    elif args.command == "evaluate":
+        print(f"✅ {args.version}: {evaluate(args.version, args.data)}")
+    elif args.command == "verify":
+        bad = [name for name, entry in load_registry()["models"].items() if not verify_entry(entry)]
+        print("❌ Hash mismatch: " + ", ".join(bad) if bad else "✅ All weights match their hashes")
+        sys.exit(1 if bad else 0)
+    else:
+        registry = load_registry()
+        print(f"{'':2}{'version':<10}{'size MB':>9}{'mAP50':>8}{'p50 ms':>8}{'p95 ms':>8}  sha256        notes")
+        for name, entry in registry["models"].items():
+            size = entry.get("size") or (os.path.getsize(entry["path"]) if os.path.exists(entry["path"]) else 0)
+            metrics, latency = entry.get("metrics", {}), entry.get("latency_ms", {})
+            print(f"{'*' if name == registry['active'] else ' ':2}{name:<10}{size / 1e6:>9.1f}"
+                  f"{metrics.get('mAP50', '-'):>8}{latency.get('p50', '-'):>8}{latency.get('p95', '-'):>8}"
+                  f"  {(entry.get('sha256') or '-')[:12]:<12}  {entry.get('notes', '')}")
+
+if __name__ == "__main__":
+    main()
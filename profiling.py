@@ -0,0 +1,261 @@
+# profiling.py - ANALYSIS LOOP PROFILING & SLOW-FRAME SNAPSHOTS
+#
+# Whole-run profiles are switched on with the "Profile Analysis" checkbox or
+# VISIONMATE_PROFILE:
+#   VISIONMATE_PROFILE=sample   stack sampling of the analysis thread (low overhead)
+#   VISIONMATE_PROFILE=cprofile deterministic cProfile (exact call counts, slower)
+#
+# Independently, a low-rate stack sampler runs during every analysis. When a
+# frame takes SLOW_FRAME_FACTOR x the recent median (and at least
+# SLOW_FRAME_MIN_MS), the stacks sampled during that frame are saved with the
+# frame image and its detections in profiles/<time>_frame<N>/.
+# The profiles/ folder is pruned to PROFILE_DIR_MB.
+#
+# Sampled stacks are written in the collapsed format ("outer;inner;leaf count")
+# read by speedscope.app and flamegraph.pl. cProfile output opens with
+# `python -m pstats run.prof` or snakeviz.
+import os
+import sys
+import json
+import time
+import shutil
+import cProfile
+import pstats
+import datetime
+import threading
+from collections import Counter, deque
+import cv2
+import numpy as np
+import streamlit as st
+
+def _setting(key, default):
+    try:
+        return type(default)(st.secrets["profiling"][key])
+    except Exception:
+        return default
+
+PROFILE_DIR = "profiles"
+PROFILE_DIR_MB = _setting("max_dir_mb", 200)             # oldest captures are removed beyond this
+SNAPSHOTS_ENABLED = _setting("slow_frame_snapshots", True)
+SLOW_FRAME_FACTOR = _setting("slow_frame_factor", 4.0)   # x the median of recent frames
+SLOW_FRAME_MIN_MS = _setting("slow_frame_min_ms", 100.0)
+SNAPSHOT_COOLDOWN_SECONDS = 10.0   # at most one snapshot per this long, so bursts don't flood the disk
+MEDIAN_WINDOW_FRAMES = 300
+WARMUP_FRAMES = 30                 # no snapshots until the median means something
+SAMPLE_INTERVAL_SECONDS = 0.01     # sampler period while a whole-run profile is recorded
+SNAPSHOT_SAMPLE_INTERVAL_SECONDS = 0.02
+SAMPLE_HISTORY_SECONDS = 30.0      # sampled stacks kept for slow-frame snapshots
+
+ENV_MODE = os.environ.get("VISIONMATE_PROFILE", "").strip().lower()
+MODES = ("sample", "cprofile")
+
+def profile_mode(ui_enabled=False):
+    """'sample', 'cprofile' or None; the environment wins over the UI checkbox"""
+    if ENV_MODE in MODES:
+        return ENV_MODE
+    if ENV_MODE in ("1", "true", "yes") or ui_enabled:
+        return "sample"
+    return None
+
+# --- Stack Sampling ---
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+class StackSampler:
+    """
+    Background thread that records the stack of one thread every `interval`
+    seconds. Recent samples are kept with their timestamps (for slow-frame
+    snapshots); with keep_totals every sample also counts towards a whole-run
+    profile.
+    """
+
+    def __init__(self, thread_id, interval, keep_totals=False):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.keep_totals = keep_totals
+        self.totals = Counter()
+        self.samples = 0
+        self._recent = deque(maxlen=max(1, int(SAMPLE_HISTORY_SECONDS / interval)))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="visionmate-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_frames = sys._current_frames
+        while not self._stop.wait(self.interval):
+            frame = own_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            stack = ";".join(reversed(labels))
+            self._recent.append((time.perf_counter(), stack))
+            self.samples += 1
+            if self.keep_totals:
+                self.totals[stack] += 1
+
+    def between(self, started, ended):
+        """Collapsed stacks sampled in [started, ended] (perf_counter seconds)"""
+        return Counter(stack for t, stack in list(self._recent) if started <= t <= ended)
+
+def format_collapsed(stacks):
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+# --- Capture Folder ---
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def prune_captures(profile_dir=PROFILE_DIR, max_mb=PROFILE_DIR_MB):
+    """Delete the oldest captures until the folder fits in max_mb (best effort, never raises)"""
+    if not os.path.isdir(profile_dir):
+        return
+    try:
+        entries = []
+        for entry in os.scandir(profile_dir):
+            try:
+                entries.append((entry.stat().st_mtime, entry, _dir_size(entry.path) if entry.is_dir() else entry.stat().st_size))
+            except OSError:
+                pass  # removed while we were looking (another session pruning)
+        entries.sort(key=lambda item: item[0])
+        total = sum(size for _, _, size in entries)
+        for _, entry, size in entries:
+            if total <= max_mb * 1024 * 1024:
+                break
+            if entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+            total -= size
+    except OSError as e:
+        print(f"⚠️ Could not prune {profile_dir}: {e}")
+
+def _stamp():
+    return datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+
+# --- Analysis Profiler ---
+
+class AnalysisProfiler:
+    """
+    Profiles one analysis run: start() before the frame loop, frame_done()
+    after every frame, stop() in the loop's finally block.
+    """
+
+    def __init__(self, mode=None, snapshots=SNAPSHOTS_ENABLED, profile_dir=PROFILE_DIR):
+        self.mode = mode
+        self.snapshots = snapshots
+        self.profile_dir = profile_dir
+        self.sampler = None
+        self.profile = None
+        self.snapshot_paths = []
+        self.frames = 0
+        self._started = False
+        self._frame_ms = deque(maxlen=MEDIAN_WINDOW_FRAMES)
+        self._median_ms = None
+        self._last_snapshot = -SNAPSHOT_COOLDOWN_SECONDS
+
+    def start(self):
+        self._started = True
+        if self.mode == "cprofile":
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        if self.mode == "sample" or self.snapshots:
+            interval = SAMPLE_INTERVAL_SECONDS if self.mode == "sample" else SNAPSHOT_SAMPLE_INTERVAL_SECONDS
+            self.sampler = StackSampler(threading.get_ident(), interval, keep_totals=self.mode == "sample").start()
+        return self
+
+    def threshold_ms(self):
+        if self._median_ms is None:
+            return None
+        return max(SLOW_FRAME_MIN_MS, SLOW_FRAME_FACTOR * self._median_ms)
+
+    def frame_done(self, frame_index, frame_started, frame_ms, frame_rgb=None, detections=None, names=None, **details):
+        """Record one frame's time; snapshot it if it is unusually slow"""
+        self.frames += 1
+        self._frame_ms.append(frame_ms)
+        if self.frames % WARMUP_FRAMES == 0:
+            self._median_ms = float(np.median(self._frame_ms))
+        threshold = self.threshold_ms()
+        if not self.snapshots or threshold is None or frame_ms <= threshold:
+            return None
+        now = time.perf_counter()
+        if now - self._last_snapshot < SNAPSHOT_COOLDOWN_SECONDS:
+            return None
+        self._last_snapshot = now
+        return self._snapshot(frame_index, frame_started, frame_ms, threshold, frame_rgb, detections, names, details)
+
+    def _snapshot(self, frame_index, frame_started, frame_ms, threshold, frame_rgb, detections, names, details):
+        path = os.path.join(self.profile_dir, f"{_stamp()}_frame{frame_index}")
+        try:
+            os.makedirs(path, exist_ok=True)
+            stacks = self.sampler.between(frame_started, frame_started + frame_ms / 1000) if self.sampler else Counter()
+            with open(os.path.join(path, "stacks.txt"), "w", encoding="utf-8") as f:
+                f.write(format_collapsed(stacks))
+            if frame_rgb is not None:
+                cv2.imwrite(os.path.join(path, "frame.jpg"), cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR))
+            rows = [] if detections is None else [
+                {"box": [round(float(v), 1) for v in row[:4]], "confidence": round(float(row[4]), 3),
+                 "class": int(row[5]), "label": (names or {}).get(int(row[5]))}
+                for row in detections
+            ]
+            with open(os.path.join(path, "detections.json"), "w", encoding="utf-8") as f:
+                json.dump({"frame_index": frame_index, "frame_ms": round(frame_ms, 1),
+                           "median_ms": round(self._median_ms, 1), "threshold_ms": round(threshold, 1),
+                           "samples": sum(stacks.values()), "detections": rows, **details},
+                          f, indent=1, default=str)
+            prune_captures(self.profile_dir)
+            self.snapshot_paths.append(path)
+            print(f"🐢 Frame {frame_index} took {frame_ms:.0f} ms (median {self._median_ms:.0f} ms): saved {path}")
+            return path
+        except OSError as e:
+            print(f"⚠️ Could not save slow-frame snapshot: {e}")
+            return None
+
+    def stop(self):
+        """Stop profiling and write the whole-run profile (if one was recorded); returns its path"""
+        if self.profile is not None:
+            self.profile.disable()
+        if self.sampler is not None:
+            self.sampler.stop()
+        if self.mode is None or not self._started or not self.frames:
+            return None
+        # Runs in the analysis loop's finally block: a disk problem must not break the teardown
+        base = os.path.join(self.profile_dir, f"{_stamp()}_run")
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            if self.profile is not None:
+                self.profile.dump_stats(base + ".prof")
+                with open(base + ".txt", "w", encoding="utf-8") as f:
+                    pstats.Stats(self.profile, stream=f).sort_stats("cumulative").print_stats(40)
+                path = base + ".prof"
+            else:
+                path = base + ".stacks.txt"
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(format_collapsed(self.sampler.totals))
+        except OSError as e:
+            print(f"⚠️ Could not save the {self.mode} profile: {e}")
+            return None
+        prune_captures(self.profile_dir)
+        print(f"🔬 {self.mode} profile of {self.frames} frames saved to {path}")
+        return path
@@ -0,0 +1,97 @@
+# resolution_scheduler.py - DEADLINE-AWARE INPUT RESOLUTION
+import streamlit as st
+
+IMGSZ_LADDER = (320, 416, 512, 640)  # YOLO input sizes, smallest to largest (multiples of 32)
+HEADROOM = 0.9                       # only step up if the larger size is predicted to use <= 90% of the budget
+UPGRADE_AFTER_FRAMES = 15            # consecutive frames that must fit before stepping up
+HAZARD_HOLD_FRAMES = 30              # frames kept at full resolution after a nearby hazard
+EMA_ALPHA = 0.2
+
+# Cues that force full resolution while the object is close
+URGENT_CATEGORIES = ("extreme", "hazard", "stop_signal")
+URGENT_PROXIMITY = ("VERY CLOSE", "nearby")
+
+try:
+    TARGET_FPS = float(st.secrets["analysis"]["target_fps"])
+except Exception:
+    TARGET_FPS = 10.0
+
+class ResolutionScheduler:
+    """
+    Picks the model input size for each frame from IMGSZ_LADDER so frame
+    processing fits the 1 / target_fps deadline. Latency is learned as an
+    exponential moving average and other sizes are predicted by scaling with
+    pixel count. A nearby hazard pins the largest size for
+    HAZARD_HOLD_FRAMES frames. Every frame is analysed; only the size changes.
+    """
+
+    def __init__(self, target_fps=None, ladder=IMGSZ_LADDER):
+        self.ladder = tuple(sorted(ladder))
+        self.budget_ms = 1000.0 / (target_fps or TARGET_FPS)
+        self.level = len(self.ladder) - 1  # start at full resolution and learn downwards
+        self.inference_ms = {}  # imgsz -> EMA of inference latency
+        self.overhead_ms = 0.0  # EMA of the rest of the frame (decode, display, feedback)
+        self.hold = 0
+        self.streak = 0
+        self.frames = 0
+        self.misses = 0
+        self.frames_by_size = {}
+
+    def next_size(self):
+        """(imgsz, forced) for the next frame"""
+        if self.hold > 0:
+            return self.ladder[-1], True
+        return self.ladder[self.level], False
+
+    def predict_ms(self, imgsz, measured=None):
+        """
+        Expected frame time at imgsz. Scaled by pixel count from the size in
+        use (or `measured`), whose estimate is fresh; estimates for other sizes
+        may date from a busier moment.
+        """
+        measured = measured or self.ladder[self.level]
+        inference = self.inference_ms.get(measured)
+        if inference is None:
+            return self.overhead_ms
+        return inference * (imgsz / measured) ** 2 + self.overhead_ms
+
+    def observe(self, imgsz, inference_ms, frame_ms, cue=None):
+        """Record one processed frame; returns True if it missed the deadline"""
+        self.frames += 1
+        self.frames_by_size[imgsz] = self.frames_by_size.get(imgsz, 0) + 1
+        previous = self.inference_ms.get(imgsz)
+        self.inference_ms[imgsz] = inference_ms if previous is None else previous + EMA_ALPHA * (inference_ms - previous)
+        overhead = max(0.0, frame_ms - inference_ms)
+        self.overhead_ms = overhead if self.frames == 1 else self.overhead_ms + EMA_ALPHA * (overhead - self.overhead_ms)
+
+        missed = frame_ms > self.budget_ms
+        self.misses += missed
+
+        if cue and cue.get("category") in URGENT_CATEGORIES and cue.get("proximity") in URGENT_PROXIMITY:
+            self.hold = HAZARD_HOLD_FRAMES
+        elif self.hold > 0:
+            self.hold -= 1
+
+        self._adapt()
+        return missed
+
+    def _adapt(self):
+        # Too slow: drop straight to the largest size predicted to fit
+        measured = self.ladder[self.level]
+        if self.predict_ms(measured) > self.budget_ms:
+            self.streak = 0
+            while self.level > 0 and self.predict_ms(self.ladder[self.level], measured) > self.budget_ms:
+                self.level -= 1
+            return
+        # Fast enough: step up one size once the next one has fitted for a while
+        if self.level + 1 < len(self.ladder) and self.predict_ms(self.ladder[self.level + 1]) <= self.budget_ms * HEADROOM:
+            self.streak += 1
+            if self.streak >= UPGRADE_AFTER_FRAMES:
+                self.level += 1
+                self.streak = 0
+        else:
+            self.streak = 0
+
+    def summary(self):
+        sizes = ", ".join(f"{size}px x{count}" for size, count in sorted(self.frames_by_size.items()))
+        return f"{sizes}; {self.misses}/{self.frames} frames over the {self.budget_ms:.0f} ms deadline"
@@ -0,0 +1,254 @@
+# roi_inference.py - WALKING-CORRIDOR REGION-OF-INTEREST INFERENCE
+#
+# feedback_cue() cares most about the corridor in front of the user: objects
+# centred between 0.35 and 0.65 of the width are "ahead" and objects reaching
+# below 0.6 of the height are "nearby". CorridorDetector runs the model twice
+# per frame on different regions instead of once on the whole frame:
+#   - the full frame at half the requested input size, for context at the edges, and
+#   - the corridor crop (with a margin) at the largest input size that keeps
+#     both passes within PIXEL_BUDGET of one full-frame pass at the requested
+#     size. For a 16:9 video that is about 0.65 x imgsz on the crop, i.e. about
+#     1.3 x the corridor pixels of full-frame inference.
+# Both passes see the current frame, so no detections are reused across frames.
+#
+# EXPERIMENTAL: fewer input pixels does not mean faster. The two passes are two
+# model calls, each with its own pre/post-processing. They cannot share one
+# batch, because ultralytics letterboxes a batch to a single input shape. At
+# small scheduler sizes the full-frame pass drops to MIN_IMGSZ (160 px at
+# imgsz 320). Neither speed nor hazard recall has been measured on real walks
+# yet, so the app keeps this mode off by default until compare() shows a gain.
+# The boxes are merged in full-frame coordinates and returned as one ultralytics
+# Results, so extract_yolov8_data(), plot() and feedback_cue() work unchanged.
+#
+# Compare against plain full-frame inference at the same input size on a video:
+#   python roi_inference.py walk.mp4 [--frames 300] [--imgsz 640]
+# Input pixels per frame of both modes, without running the model:
+#   python roi_inference.py --cost [--width 1280 --height 720]
+import sys
+import time
+import math
+import argparse
+import numpy as np
+
+# Corridor in frame fractions: feedback_cue's "ahead" band plus a margin, from
+# above its "nearby" line to the bottom of the frame
+CORRIDOR_X = (0.35 - 0.10, 0.65 + 0.10)
+CORRIDOR_Y = (0.6 - 0.25, 1.0)
+PIXEL_BUDGET = 0.85         # both passes together vs. one full-frame pass at the requested size
+FULL_FRAME_SCALE = 0.5      # full-frame context pass at this fraction of the requested size
+STRIDE = 32                 # model stride; input sides are multiples of it
+MIN_IMGSZ = 160
+NMS_IOU = 0.5               # same-class boxes overlapping this much are one object
+CONTAINED_FRACTION = 0.7    # a corridor box cut by the crop edge is dropped if this much lies inside a full-frame box
+EDGE_PIXELS = 2
+
+def corridor_box(frame_width, frame_height):
+    """(x0, y0, x1, y1) of the corridor crop in pixels"""
+    return (int(frame_width * CORRIDOR_X[0]), int(frame_height * CORRIDOR_Y[0]),
+            int(frame_width * CORRIDOR_X[1]), int(frame_height * CORRIDOR_Y[1]))
+
+def input_pixels(width, height, imgsz):
+    """Pixels the model processes for a width x height image (long side imgsz, short side padded to the stride)"""
+    short = min(width, height) / max(width, height) * imgsz
+    return imgsz * math.ceil(short / STRIDE) * STRIDE
+
+def pass_sizes(frame_width, frame_height, imgsz):
+    """(corridor imgsz, full-frame imgsz) that fit PIXEL_BUDGET of a full-frame pass at imgsz"""
+    full_imgsz = max(MIN_IMGSZ, int(imgsz * FULL_FRAME_SCALE) // STRIDE * STRIDE)
+    budget = PIXEL_BUDGET * input_pixels(frame_width, frame_height, imgsz) \
+        - input_pixels(frame_width, frame_height, full_imgsz)
+    x0, y0, x1, y1 = corridor_box(frame_width, frame_height)
+    corridor_imgsz = imgsz
+    while corridor_imgsz > MIN_IMGSZ and input_pixels(x1 - x0, y1 - y0, corridor_imgsz) > budget:
+        corridor_imgsz -= STRIDE
+    return corridor_imgsz, full_imgsz
+
+# --- Merging ---
+
+def _iou(box, boxes):
+    x0 = np.maximum(box[0], boxes[:, 0])
+    y0 = np.maximum(box[1], boxes[:, 1])
+    x1 = np.minimum(box[2], boxes[:, 2])
+    y1 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9), inter / max(area, 1e-9)
+
+def nms(detections, iou=NMS_IOU):
+    """Greedy per-class non-maximum suppression; keeps rows in the given priority order"""
+    keep = []
+    suppressed = np.zeros(len(detections), dtype=bool)
+    for i in range(len(detections)):
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        rest = np.arange(i + 1, len(detections))
+        same = rest[(detections[rest, 5] == detections[i, 5]) & ~suppressed[rest]]
+        if len(same):
+            overlap, _ = _iou(detections[i], detections[same])
+            suppressed[same[overlap > iou]] = True
+    return detections[keep]
+
+def merge_detections(corridor, full, crop, frame_width, frame_height):
+    """
+    Corridor detections (crop coordinates) + full-frame detections -> one
+    (N, 6) array in full-frame coordinates. Corridor boxes win duplicates
+    (higher resolution), except where the crop edge cut an object in half:
+    then the full-frame box has its true extent.
+    """
+    x0, y0, x1, y1 = crop
+    corridor = np.asarray(corridor, dtype=np.float32).reshape(-1, 6).copy()
+    full = np.asarray(full, dtype=np.float32).reshape(-1, 6)
+    corridor[:, [0, 2]] += x0
+    corridor[:, [1, 3]] += y0
+
+    if len(corridor) and len(full):
+        # Crop edges that are not also frame edges can truncate a box
+        cut = ((x0 > 0) & (corridor[:, 0] <= x0 + EDGE_PIXELS)) | ((x1 < frame_width) & (corridor[:, 2] >= x1 - EDGE_PIXELS)) \
+            | ((y0 > 0) & (corridor[:, 1] <= y0 + EDGE_PIXELS)) | ((y1 < frame_height) & (corridor[:, 3] >= y1 - EDGE_PIXELS))
+        keep = np.ones(len(corridor), dtype=bool)
+        for i in np.flatnonzero(cut):
+            same = full[full[:, 5] == corridor[i, 5]]
+            if len(same) and (_iou(corridor[i], same)[1] >= CONTAINED_FRACTION).any():
+                keep[i] = False
+        corridor = corridor[keep]
+
+    ordered = np.concatenate([corridor[np.argsort(-corridor[:, 4])], full[np.argsort(-full[:, 4])]])
+    return nms(ordered) if len(ordered) else ordered
+
+def _detections(results):
+    if not results or results.boxes is None or len(results.boxes) == 0:
+        return np.zeros((0, 6), dtype=np.float32)
+    return results.boxes.data[:, :6].cpu().numpy()
+
+# --- Detector ---
+
+class CorridorDetector:
+    """
+    Called like the YOLO model (detector(img, imgsz=...) -> [Results]).
+    imgsz is the size a plain full-frame pass would use; pass_sizes() splits
+    its pixel budget between the corridor and the full frame.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    @property
+    def names(self):
+        return self.model.names
+
+    def __call__(self, img, imgsz=640, **kwargs):
+        from ultralytics.engine.results import Results
+        import torch
+
+        kwargs.setdefault("verbose", False)
+        height, width = img.shape[:2]
+        crop = corridor_box(width, height)
+        x0, y0, x1, y1 = crop
+        corridor_imgsz, full_imgsz = pass_sizes(width, height, imgsz)
+        corridor = _detections(self.model(np.ascontiguousarray(img[y0:y1, x0:x1]), imgsz=corridor_imgsz, **kwargs)[0])
+        full = _detections(self.model(img, imgsz=full_imgsz, **kwargs)[0])
+
+        merged = merge_detections(corridor, full, crop, width, height)
+        return [Results(img, path=None, names=self.names, boxes=torch.from_numpy(merged))]
+
+# --- Comparison ---
+
+def _corridor_hazards(detections, names, frame_width, frame_height):
+    """Nearby or very close stop/critical objects centred in the corridor"""
+    from vision_core import feedback_cue
+    from feedback_replay import ReplayResults
+
+    rows = []
+    for row in detections:
+        cue = feedback_cue(ReplayResults(names), row[None, :], frame_width, frame_height)
+        if cue["category"] in ("extreme", "hazard") and cue["direction"] == "ahead":
+            rows.append(row)
+    return np.array(rows).reshape(-1, 6)
+
+def compare(video_path, frames, imgsz):
+    """
+    Plain full-frame inference at imgsz (the baseline) against corridor mode at
+    the same imgsz: time per frame, and which nearby corridor hazards each finds
+    that the other does not.
+    """
+    import cv2
+    from vision_core import load_model
+
+    model = load_model()
+    detector = CorridorDetector(model)
+    modes = {"full": lambda img: model(img, imgsz=imgsz, verbose=False)[0],
+             "corridor": lambda img: detector(img, imgsz=imgsz)[0]}
+    timings = {mode: [] for mode in modes}
+    found = {mode: 0 for mode in modes}
+    only = {mode: 0 for mode in modes}
+    pixels = {}
+
+    cap = cv2.VideoCapture(video_path)
+    for _ in range(frames):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        height, width = img.shape[:2]
+        hazards = {}
+        for mode, run in modes.items():
+            started = time.perf_counter()
+            results = run(img)
+            timings[mode].append((time.perf_counter() - started) * 1000)
+            hazards[mode] = _corridor_hazards(_detections(results), model.names, width, height)
+            found[mode] += len(hazards[mode])
+        for mode, other in (("full", "corridor"), ("corridor", "full")):
+            for row in hazards[mode]:
+                same = hazards[other][hazards[other][:, 5] == row[5]]
+                if not len(same) or not (_iou(row, same)[0] >= NMS_IOU).any():
+                    only[mode] += 1
+        pixels = _pixel_costs(width, height, imgsz)
+    cap.release()
+
+    baseline_ms = np.mean(timings["full"])
+    print(f"{'mode':<10}{'ms/frame':>10}{'vs full':>9}{'input px':>10}{'hazards':>9}{'only this mode':>16}")
+    for mode in modes:
+        ms = np.mean(timings[mode])
+        print(f"{mode:<10}{ms:>10.1f}{ms / baseline_ms:>8.2f}x{pixels[mode]:>10,}{found[mode]:>9}{only[mode]:>16}")
+
+def _pixel_costs(width, height, imgsz):
+    corridor_imgsz, full_imgsz = pass_sizes(width, height, imgsz)
+    x0, y0, x1, y1 = corridor_box(width, height)
+    return {"full": input_pixels(width, height, imgsz),
+            "corridor": input_pixels(x1 - x0, y1 - y0, corridor_imgsz) + input_pixels(width, height, full_imgsz)}
+
+def print_costs(width, height):
+    """Input pixels per frame of both modes for each scheduler size (no model needed)"""
+    print(f"{'imgsz':>6}{'corridor/full sz':>18}{'full px':>10}{'corridor px':>13}{'ratio':>7}{'corridor density':>18}")
+    for imgsz in range(320, 641, 64):
+        corridor_imgsz, full_imgsz = pass_sizes(width, height, imgsz)
+        costs = _pixel_costs(width, height, imgsz)
+        x0, _, x1, _ = corridor_box(width, height)
+        # Model pixels per source pixel across the corridor, relative to full-frame inference
+        density = (corridor_imgsz / max(x1 - x0, 1)) / (imgsz / width)
+        print(f"{imgsz:>6}{corridor_imgsz:>10}/{full_imgsz:<7}{costs['full']:>10,}{costs['corridor']:>13,}"
+              f"{costs['corridor'] / costs['full']:>7.2f}{density:>17.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare corridor ROI inference with full-frame inference")
+    parser.add_argument("video", nargs="?")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--cost", action="store_true", help="print input pixels per frame without running the model")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    args = parser.parse_args()
+    if args.cost:
+        print_costs(args.width, args.height)
+        return
+    if not args.video:
+        parser.error("a video is required unless --cost is given")
+    if args.imgsz % 32:
+        print("❌ --imgsz must be a multiple of 32")
+        sys.exit(1)
+    compare(args.video, args.frames, args.imgsz)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# scene_index.py - SCENE BOUNDARY INDEX FOR VOICE NAVIGATION
+#
+# A fast pre-pass samples a few downscaled frames per second, compares their
+# colour histograms and records where the picture changes abruptly. The index
+# is saved next to the video (<video>.scenes.json). When a model is given, one
+# keyframe per scene is run through it at a low input size, so "skip to
+# crossing" can jump to scenes ahead that analysis has not reached yet; scenes
+# are also tagged with the objects seen during analysis.
+import os
+import json
+import bisect
+import cv2
+import numpy as np
+
+INDEX_VERSION = 2
+SAMPLES_PER_SECOND = 4        # frames compared per second of video
+THUMB_SIZE = (64, 36)         # downscaled frame size for histograms
+HIST_BITS = 3                 # bits per colour channel -> 8 x 8 x 8 = 512 bins
+BOUNDARY_THRESHOLD = 0.35     # histogram distance (0..1) that marks a cut
+MIN_SCENE_SECONDS = 1.5       # cuts closer together than this are merged
+BATCH_FRAMES = 64             # thumbnails histogrammed together
+BACK_RESTART_SECONDS = 3.0    # "go back" restarts the current scene if we are this far into it
+KEYFRAME_IMGSZ = 320          # detection input size for scene keyframes
+KEYFRAME_CONFIDENCE = 0.35
+
+# Spoken skip targets -> object labels that identify them
+SKIP_TARGETS = {
+    "crossing": ("crosswalk",),
+}
+
+def index_path(video_path):
+    return video_path + ".scenes.json"
+
+def batch_histograms(thumbs):
+    """Normalised colour histograms for a (N, H, W, 3) uint8 batch, in one bincount"""
+    shift = 8 - HIST_BITS
+    q = (thumbs >> shift).astype(np.int32)
+    codes = (q[..., 0] << (2 * HIST_BITS)) | (q[..., 1] << HIST_BITS) | q[..., 2]
+    bins = 1 << (3 * HIST_BITS)
+    codes = codes.reshape(len(thumbs), -1) + (np.arange(len(thumbs)) * bins)[:, None]
+    counts = np.bincount(codes.ravel(), minlength=len(thumbs) * bins).reshape(len(thumbs), bins)
+    return counts / counts.sum(axis=1, keepdims=True)
+
+def detect_boundaries(histograms, frame_indices, fps):
+    """Frame indices where consecutive samples differ by more than BOUNDARY_THRESHOLD"""
+    if len(histograms) < 2:
+        return []
+    # Half the L1 distance between normalised histograms lies in 0..1
+    distances = 0.5 * np.abs(np.diff(histograms, axis=0)).sum(axis=1)
+    min_gap = MIN_SCENE_SECONDS * fps
+    boundaries = []
+    for i in np.flatnonzero(distances > BOUNDARY_THRESHOLD):
+        frame = int(frame_indices[i + 1])
+        if not boundaries or frame - boundaries[-1] >= min_gap:
+            boundaries.append(frame)
+    return boundaries
+
+class SceneIndex:
+    """Scene start frames plus labels seen in each scene"""
+
+    def __init__(self, starts, total_frames, fps, labels=None, path=None):
+        self.starts = starts
+        self.total_frames = total_frames
+        self.fps = fps
+        self.labels = labels or [[] for _ in starts]
+        self.path = path
+        self._dirty = False
+
+    # --- Building & Storage ---
+
+    @classmethod
+    def build(cls, video_path, model=None):
+        """Histogram pre-pass over the video; only sampled frames are decoded"""
+        cap = cv2.VideoCapture(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        step = max(1, int(round(fps / SAMPLES_PER_SECOND)))
+
+        thumbs, sampled, histograms = [], [], []
+        frame_index = 0
+        while True:
+            if frame_index % step == 0:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                thumbs.append(cv2.resize(frame, THUMB_SIZE, interpolation=cv2.INTER_AREA))
+                sampled.append(frame_index)
+                if len(thumbs) == BATCH_FRAMES:
+                    histograms.append(batch_histograms(np.stack(thumbs)))
+                    thumbs = []
+            elif not cap.grab():  # advance without decoding to a full image
+                break
+            frame_index += 1
+        cap.release()
+        if thumbs:
+            histograms.append(batch_histograms(np.stack(thumbs)))
+
+        total_frames = total_frames or frame_index
+        histograms = np.concatenate(histograms) if histograms else np.zeros((0, 1))
+        starts = [0] + detect_boundaries(histograms, sampled, fps)
+        index = cls(starts, total_frames, fps, path=index_path(video_path))
+        if model is not None:
+            index.tag_keyframes(video_path, model)
+        return index
+
+    @classmethod
+    def load_or_build(cls, video_path, model=None):
+        path = index_path(video_path)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                return cls([s["start_frame"] for s in data["scenes"]], data["total_frames"], data["fps"],
+                           [s["labels"] for s in data["scenes"]], path)
+        index = cls.build(video_path, model)
+        index.save()
+        return index
+
+    def save(self):
+        scenes = [
+            {"start_frame": start, "end_frame": end - 1, "labels": labels}
+            for start, end, labels in zip(self.starts, self.starts[1:] + [self.total_frames], self.labels)
+        ]
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "fps": self.fps, "total_frames": self.total_frames,
+                       "scenes": scenes}, f)
+        self._dirty = False
+
+    def save_if_changed(self):
+        if self._dirty:
+            self.save()
+
+    # --- Tagging ---
+
+    def scene_of(self, frame_index):
+        return max(0, bisect.bisect_right(self.starts, frame_index) - 1)
+
+    def tag(self, frame_index, label):
+        """Remember that label was seen in the scene containing frame_index"""
+        if not label:
+            return
+        labels = self.labels[self.scene_of(frame_index)]
+        if label not in labels:
+            labels.append(label)
+            self._dirty = True
+
+    def tag_keyframes(self, video_path, model, imgsz=KEYFRAME_IMGSZ):
+        """Tag every scene with the objects detected in its middle frame"""
+        cap = cv2.VideoCapture(video_path)
+        for start, end in zip(self.starts, self.starts[1:] + [self.total_frames]):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, (start + end) // 2)
+            ret, frame = cap.read()
+            if not ret:
+                continue
+            img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            results = model(img, imgsz=imgsz, conf=KEYFRAME_CONFIDENCE, verbose=False)[0]
+            if results.boxes is None:
+                continue
+            for cls in np.unique(results.boxes.cls.cpu().numpy()):
+                self.tag(start, results.names[int(cls)])
+        cap.release()
+
+    # --- Seeking ---
+
+    def next_scene(self, frame_index):
+        """Start frame of the following scene, or None at the last scene"""
+        scene = self.scene_of(frame_index)
+        return self.starts[scene + 1] if scene + 1 < len(self.starts) else None
+
+    def previous_scene(self, frame_index):
+        """Restart the current scene, or the previous one if we just entered it"""
+        scene = self.scene_of(frame_index)
+        if frame_index - self.starts[scene] > BACK_RESTART_SECONDS * self.fps or scene == 0:
+            return self.starts[scene]
+        return self.starts[scene - 1]
+
+    def find(self, target, frame_index):
+        """Start frame of the next scene tagged with a SKIP_TARGETS label, or None"""
+        wanted = SKIP_TARGETS.get(target, (target,))
+        current = self.scene_of(frame_index)
+        # Search forward first, then wrap around to earlier scenes
+        for scene in list(range(current + 1, len(self.starts))) + list(range(0, current)):
+            if any(label in wanted for label in self.labels[scene]):
+                return self.starts[scene]
+        return None
+
+def remove_index(video_path):
+    try:
+        os.remove(index_path(video_path))
+    except OSError:
+        pass
@@ -0,0 +1,367 @@
+# simulate_voice_flow.py - HEADLESS LOAD TEST FOR THE VOICE STATES
+#
+# Usage: python simulate_voice_flow.py [--users 200] [--concurrency 16] [--noise 0.1]
+#                                      [--hash-ms 100] [--seed 0]
+#
+# Every simulated user walks the real state specs (voice_auth.AUTH_FLOW and the
+# home state in app.py) through app.main(): register, log in, log out.
+# Streamlit, speech synthesis, the microphone and the fixed pauses are replaced
+# in-process, so no browser, network or sound device is needed. Runs against a
+# temporary database (visionmate.db is never touched).
+#
+# Reports two numbers per state:
+#   ms      wall-clock cost of one script run (routing, validation, password
+#           hashing, database writes) - what limits how many users a server holds
+#   user s  simulated time the user spends in the state (prompts, answers and
+#           pauses) - what the user experiences
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import contextlib
+
+# --- Headless Streamlit ---
+
+class RerunRequested(Exception):
+    """Raised by st.rerun(); the driver starts the next script run"""
+
+class SessionState(dict):
+    """dict with attribute access, like st.session_state"""
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+    def __delattr__(self, key):
+        del self[key]
+
+class _Element:
+    """Accepts any UI call (st.empty().markdown(...), with st.spinner(...), ...)"""
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def __getattr__(self, name):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class HeadlessStreamlit:
+    """
+    Stand-in for the streamlit module. Each thread is one browser session with
+    its own session_state and query_params; UI calls are accepted and dropped.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self.secrets = {}  # every st.secrets lookup falls back to the module default
+
+    def new_session(self, **state):
+        self._local.session_state = SessionState(state)
+        self._local.query_params = {}
+
+    @property
+    def session_state(self):
+        return self._local.session_state
+
+    @property
+    def query_params(self):
+        return self._local.query_params
+
+    def rerun(self):
+        raise RerunRequested()
+
+    def cache_resource(self, fn=None, **kwargs):
+        return fn if fn is not None else (lambda f: f)
+
+    def __getattr__(self, name):
+        return _Element()
+
+# Installed before the app modules are imported, so `import streamlit as st`
+# in every module resolves to the headless version
+st = HeadlessStreamlit()
+st.new_session()
+sys.modules["streamlit"] = st
+
+import database as db
+import tracing
+
+# --- Virtual Time ---
+
+class VirtualClock:
+    """
+    time.time()/time.sleep() for the voice modules. Sleeping only advances the
+    calling thread's clock, so a 6 second pause costs nothing but is still
+    counted towards what the user would experience.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def start(self):
+        self._local.now = time.time()
+        self._local.elapsed = 0.0
+
+    def time(self):
+        return self._local.now
+
+    def sleep(self, seconds):
+        self._local.now += seconds
+        self._local.elapsed += seconds
+
+    @property
+    def elapsed(self):
+        return self._local.elapsed
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+clock = VirtualClock()
+
+def virtual_pause(seconds, reason="pause"):
+    clock.sleep(seconds)
+
+# --- Simulated Users ---
+
+# Answers that fail a state's validation or match no command
+BAD_ANSWERS = {
+    "welcome": "banana",
+    "home": "banana",
+    "reg_name": "4 2",
+    "reg_email": "not an email",
+    "reg_pass": "abc",
+}
+
+_current = threading.local()
+
+class SimulatedUser:
+    """Answers whatever the current state asks; registers, logs in, logs out"""
+
+    def __init__(self, number, rng, noise):
+        self.number = number
+        self.rng = rng
+        self.noise = noise
+        self.username = f"sim{number}"
+        self.registered = False
+        self.reached_home = False
+        self.done = False
+        self.transcript = []
+
+    def answer(self, state):
+        if self.rng.random() < self.noise:
+            # Silence, or a wrong answer where the state can tell
+            return self.rng.choice([None, BAD_ANSWERS.get(state)])
+        n = self.number
+        if state == "welcome":
+            return "login" if self.registered else "register"
+        if state == "reg_name":
+            return "sim user"
+        if state == "reg_email":
+            return f"sim {n} at example dot com"
+        if state in ("reg_user", "login_user"):
+            return f"sim {n}"
+        if state == "reg_pass":
+            self.registered = True
+            return f"secret {n}"
+        if state == "login_pass":
+            return f"secret {n}"
+        if state == "home":
+            self.reached_home = True
+            self.done = True
+            return "logout"
+        raise RuntimeError(f"simulated user has no answer for state {state}")
+
+# --- Audio Stand-ins ---
+# Same timing as audio_utils: prompts last max(3, words * 0.5) seconds, every
+# transcript is read back ("You said ...") followed by a one second pause.
+
+def sim_play_audio(text, interruptible=False):
+    _current.user.transcript.append(f"🔊 {text}")
+    clock.sleep(max(3, len(text.split()) * 0.5))
+    return False
+
+def sim_listen_for_command(commands=None, timeout=25):
+    user = _current.user
+    text = user.answer(st.session_state.state)
+    user.transcript.append(f"🎤 {text}")
+    if not text:
+        clock.sleep(timeout)
+        sim_play_audio("I did not hear any speech. Please speak louder and closer to your microphone.")
+        clock.sleep(3)
+        return None
+    clock.sleep(len(text.split()) * 0.4)  # speaking
+    sim_play_audio(f"You said {text}")
+    clock.sleep(1)
+    return {"text": text, "confidence": 1.0, "alternatives": [(text, 1.0)], "backend": "script", "latency_ms": 0.0}
+
+def sim_listen_for_voice(timeout=25, commands=None):
+    result = sim_listen_for_command(commands, timeout=timeout)
+    return result["text"] if result else ""
+
+def install_stand_ins():
+    import voice_flow
+    import voice_auth
+
+    voice_flow.play_audio = sim_play_audio
+    voice_flow.listen_for_command = sim_listen_for_command
+    voice_flow.listen_for_voice = sim_listen_for_voice
+    voice_flow.prefetch_speech = lambda texts: None
+    voice_flow.time = clock
+    voice_auth.time = clock
+    tracing.pause = virtual_pause
+
+# --- Driver ---
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+class Stats:
+    """Thread-safe per-state latency collection"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wall_ms = {}
+        self.user_s = {}
+        self.flow_s = []
+        self.failures = []
+
+    def record(self, state, wall_seconds, user_seconds):
+        with self.lock:
+            self.wall_ms.setdefault(state, []).append(wall_seconds * 1000)
+            self.user_s.setdefault(state, []).append(user_seconds)
+
+    def finish(self, user, error=None):
+        with self.lock:
+            if error:
+                self.failures.append((user, error))
+            else:
+                self.flow_s.append(clock.elapsed)
+
+MAX_RUNS_PER_USER = 200
+
+def run_user(app, user, stats):
+    """Rerun the app script for one user until they have logged out"""
+    _current.user = user
+    clock.start()
+    st.new_session(state="welcome", tmp={}, trace_session=f"sim{user.number}", resume_checked=True)
+
+    for _ in range(MAX_RUNS_PER_USER):
+        state = st.session_state.state
+        started, user_started = time.perf_counter(), clock.elapsed
+        try:
+            app.main()
+        except RerunRequested:
+            pass
+        except Exception as e:
+            return stats.finish(user, f"{state}: {type(e).__name__}: {e}")
+        stats.record(state, time.perf_counter() - started, clock.elapsed - user_started)
+        if user.done:
+            break
+
+    if not user.reached_home:
+        return stats.finish(user, f"never reached home (stuck in {st.session_state.state})")
+    if st.session_state.state != "welcome" or "session" in st.query_params:
+        return stats.finish(user, "logout did not end the session")
+    if db.get_user_info(user.username) is None:
+        return stats.finish(user, "account missing after registration")
+    stats.finish(user)
+
+def run_worker(app, numbers, numbers_lock, seed, noise, stats):
+    while True:
+        with numbers_lock:
+            number = next(numbers, None)
+        if number is None:
+            return
+        run_user(app, SimulatedUser(number, random.Random(seed * 1_000_003 + number), noise), stats)
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless load test for the voice authentication states")
+    parser.add_argument("--users", type=int, default=200, help="simulated users in total")
+    parser.add_argument("--concurrency", type=int, default=16, help="users active at the same time")
+    parser.add_argument("--noise", type=float, default=0.1,
+                        help="chance that an answer is silence or invalid (exercises the retry paths)")
+    parser.add_argument("--hash-ms", type=float, default=None,
+                        help="override the password hashing budget (e.g. 1 to load only the state machine)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--show-failures", type=int, default=3, help="failed transcripts to print")
+    args = parser.parse_args()
+
+    if args.hash_ms is not None:
+        db.TARGET_HASH_MS = args.hash_ms
+        db.MIN_ITERATIONS = 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configure(os.path.join(tmp, "simulation.db"))
+        stats = Stats()
+        # Importing app runs its page setup (and db.init_db) in the headless session
+        with contextlib.redirect_stdout(io.StringIO()):
+            import app
+            install_stand_ins()
+            iterations = db.get_iterations()
+
+        print(f"🔧 {args.users} users, {args.concurrency} concurrent, noise {args.noise:.0%}, "
+              f"{iterations} hash iterations")
+
+        numbers, numbers_lock = iter(range(args.users)), threading.Lock()
+        workers = [
+            threading.Thread(target=run_worker, args=(app, numbers, numbers_lock, args.seed, args.noise, stats))
+            for _ in range(args.concurrency)
+        ]
+        started = time.perf_counter()
+        # The voice and database modules log every step; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+        elapsed = time.perf_counter() - started
+        db.get_pool().close_all()
+
+    print("\n" + "=" * 78)
+    print(f"{'state':<12}{'runs':>8}{'runs/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'user s':>9}")
+    print("=" * 78)
+    total = 0
+    for state in ["welcome", "reg_name", "reg_email", "reg_user", "reg_pass", "login_user", "login_pass", "home"]:
+        wall = stats.wall_ms.get(state, [])
+        if not wall:
+            continue
+        total += len(wall)
+        user_s = stats.user_s[state]
+        print(f"{state:<12}{len(wall):>8}{len(wall) / elapsed:>9.1f}{percentile(wall, 50):>9.1f}"
+              f"{percentile(wall, 95):>9.1f}{percentile(wall, 99):>9.1f}{max(wall):>9.1f}"
+              f"{sum(user_s) / len(user_s):>9.1f}")
+    print("-" * 78)
+    print(f"{'total':<12}{total:>8}{total / elapsed:>9.1f}")
+
+    completed = len(stats.flow_s)
+    print(f"\n👥 {completed}/{args.users} users registered, logged in and out in {elapsed:.2f}s "
+          f"-> {completed / elapsed:.1f} users/s")
+    if completed:
+        print(f"🕒 Simulated time per user: p50 {percentile(stats.flow_s, 50):.0f}s, "
+              f"max {max(stats.flow_s):.0f}s ({sum(stats.flow_s) / elapsed:,.0f}x real time)")
+
+    if stats.failures:
+        print(f"\n❌ {len(stats.failures)} users failed")
+        for user, error in stats.failures[:args.show_failures]:
+            print(f"   {user.username}: {error}")
+            for line in user.transcript[-6:]:
+                print(f"      {line}")
+        sys.exit(1)
+    print("\n✅ Every simulated user completed the flow")
+
+if __name__ == "__main__":
+    main()
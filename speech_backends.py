@@ -0,0 +1,111 @@
+# speech_backends.py - SPEECH-TO-TEXT BACKENDS
+import os
+import json
+import math
+import time
+import threading
+import speech_recognition as sr
+import tracing
+
+# Vosk is optional: without it every state falls back to Google dictation
+try:
+    import vosk
+    vosk.SetLogLevel(-1)
+except ImportError:
+    vosk = None
+
+VOSK_MODEL_PATH = os.environ.get("VISIONMATE_VOSK_MODEL", "vosk_model")
+VOSK_SAMPLE_RATE = 16000
+MAX_ALTERNATIVES = 5
+
+_google = sr.Recognizer()
+_vosk_model = None
+_grammar_recognizers = {}
+_vosk_lock = threading.Lock()
+
+def make_result(alternatives, backend, started):
+    """
+    Common result format for every backend:
+    {"text", "confidence", "alternatives": [(text, confidence), ...], "backend", "latency_ms"}
+    """
+    alternatives = [(text.strip(), float(conf)) for text, conf in alternatives if text and text.strip()]
+    alternatives.sort(key=lambda alt: alt[1], reverse=True)
+    if not alternatives:
+        raise sr.UnknownValueError()
+    return {
+        "text": alternatives[0][0],
+        "confidence": alternatives[0][1],
+        "alternatives": alternatives,
+        "backend": backend,
+        "latency_ms": (time.perf_counter() - started) * 1000,
+    }
+
+# --- Offline Grammar Backend (Vosk) ---
+
+def offline_available():
+    return vosk is not None and os.path.isdir(VOSK_MODEL_PATH)
+
+def _get_vosk_model():
+    global _vosk_model
+    if _vosk_model is None:
+        _vosk_model = vosk.Model(VOSK_MODEL_PATH)
+    return _vosk_model
+
+def _get_grammar_recognizer(phrases):
+    """One compiled recognizer per vocabulary, reused across calls"""
+    key = tuple(sorted(set(p.lower() for p in phrases)))
+    if key not in _grammar_recognizers:
+        grammar = json.dumps(list(key) + ["[unk]"])
+        rec = vosk.KaldiRecognizer(_get_vosk_model(), VOSK_SAMPLE_RATE, grammar)
+        rec.SetMaxAlternatives(MAX_ALTERNATIVES)
+        _grammar_recognizers[key] = rec
+    return _grammar_recognizers[key]
+
+@tracing.traced("stt.vosk", "stt")
+def recognize_offline(audio, phrases):
+    """Decode audio against a fixed list of command phrases"""
+    started = time.perf_counter()
+    pcm = audio.get_raw_data(convert_rate=VOSK_SAMPLE_RATE, convert_width=2)
+    with _vosk_lock:
+        rec = _get_grammar_recognizer(phrases)
+        rec.AcceptWaveform(pcm)
+        decoded = json.loads(rec.FinalResult())
+        rec.Reset()
+
+    alternatives = [
+        (alt.get("text", "").replace("[unk]", ""), alt.get("confidence", 0.0))
+        for alt in decoded.get("alternatives", [])
+    ]
+    # Vosk reports log-likelihood style scores; normalise them to 0..1 over the n-best
+    if alternatives:
+        best = max(conf for _, conf in alternatives)
+        total = sum(math.exp(conf - best) for _, conf in alternatives)
+        alternatives = [(text, math.exp(conf - best) / total) for text, conf in alternatives]
+    return make_result(alternatives, "vosk", started)
+
+# --- Online Dictation Backend (Google) ---
+
+@tracing.traced("stt.google", "stt")
+def recognize_online(audio):
+    """Open dictation through Google Web Speech, with its n-best list"""
+    started = time.perf_counter()
+    response = _google.recognize_google(audio, show_all=True)
+    if not response:
+        raise sr.UnknownValueError()
+    alternatives = [
+        (alt.get("transcript", ""), alt.get("confidence", 0.0))
+        for alt in response.get("alternative", [])
+    ]
+    # Google only scores its first hypothesis
+    if alternatives and alternatives[0][1] == 0.0:
+        alternatives[0] = (alternatives[0][0], 1.0)
+    return make_result(alternatives, "google", started)
+
+def recognize(audio, commands=None):
+    """
+    Command states pass their phrase list and are decoded offline when a
+    Vosk model is installed; free-form fields (names, emails, passwords) use dictation.
+    """
+    if commands and offline_available():
+        return recognize_offline(audio, commands)
+    return recognize_online(audio)
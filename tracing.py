@@ -0,0 +1,161 @@
+# tracing.py - LIGHTWEIGHT TIMELINE TRACING
+#
+# Enable with VISIONMATE_TRACE=<file>:
+#   VISIONMATE_TRACE=trace.jsonl streamlit run app.py   (one span per line)
+#   VISIONMATE_TRACE=trace.json  streamlit run app.py   (Chrome trace, streamed)
+#   VISIONMATE_TRACE=1           -> visionmate_trace.jsonl
+#
+# Open Chrome traces in chrome://tracing or https://ui.perfetto.dev.
+# Convert a JSONL trace with: python tracing.py trace.jsonl trace.json
+#
+# When VISIONMATE_TRACE is unset, span() returns a shared no-op object and
+# traced() returns the function unchanged, so instrumentation costs one check.
+import os
+import sys
+import json
+import time
+import itertools
+import threading
+from functools import wraps
+
+_setting = os.environ.get("VISIONMATE_TRACE", "").strip()
+ENABLED = bool(_setting) and _setting.lower() not in ("0", "false", "no")
+TRACE_FILE = "visionmate_trace.jsonl" if _setting.lower() in ("1", "true", "yes") else _setting
+CHROME_FORMAT = TRACE_FILE.endswith(".json")
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_span_ids = itertools.count(1)
+_out = None
+
+def _now_us():
+    return time.time_ns() // 1000
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+        _local.tags = {}
+    return _local.stack
+
+def _write(event):
+    global _out
+    line = json.dumps(event, default=str)
+    with _write_lock:
+        if _out is None:
+            new_file = not os.path.exists(TRACE_FILE) or os.path.getsize(TRACE_FILE) == 0
+            _out = open(TRACE_FILE, "a", encoding="utf-8")
+            if CHROME_FORMAT and new_file:
+                # The JSON array format allows the closing bracket to be missing,
+                # so the file stays viewable while the app is still running
+                _out.write("[\n")
+            print(f"🧭 Tracing to {TRACE_FILE}")
+        _out.write(line + (",\n" if CHROME_FORMAT else "\n"))
+        _out.flush()
+
+def set_context(**tags):
+    """Tags (state name, session ID, ...) added to every span on this thread"""
+    if ENABLED:
+        _stack()
+        _local.tags.update(tags)
+
+# --- Spans ---
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def tag(self, **tags):
+        pass
+
+_NOOP = _NoopSpan()
+
+class Span:
+    """One timed operation, written as a Chrome "complete" event on exit"""
+
+    def __init__(self, name, category, tags):
+        self.name = name
+        self.category = category
+        self.tags = tags
+        self.span_id = next(_span_ids)
+
+    def tag(self, **tags):
+        self.tags.update(tags)
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent_id = stack[-1] if stack else None
+        stack.append(self.span_id)
+        self.started = _now_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = _now_us() - self.started
+        _stack().pop()
+        args = dict(_local.tags, **self.tags)
+        args["span_id"] = self.span_id
+        if self.parent_id is not None:
+            args["parent_id"] = self.parent_id
+        if exc_type is not None:
+            # Also st.rerun()/st.stop(), which Streamlit implements as exceptions
+            args["raised"] = exc_type.__name__
+        _write({
+            "name": self.name, "cat": self.category, "ph": "X",
+            "ts": self.started, "dur": duration,
+            "pid": os.getpid(), "tid": threading.get_ident(), "args": args,
+        })
+        return False
+
+def span(name, category="app", **tags):
+    """Context manager timing the enclosed block"""
+    if not ENABLED:
+        return _NOOP
+    return Span(name, category, tags)
+
+def traced(name=None, category="app"):
+    """Decorator wrapping every call in a span (no-op when tracing is off)"""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+        span_name = name or f"{fn.__module__}.{fn.__name__}"
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with Span(span_name, category, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def record(name, category, started_s, duration_s, **tags):
+    """Write a span for an interval that was measured elsewhere (wall-clock seconds)"""
+    if not ENABLED:
+        return
+    args = dict(getattr(_local, "tags", {}), **tags)
+    _write({
+        "name": name, "cat": category, "ph": "X",
+        "ts": int(started_s * 1_000_000), "dur": int(duration_s * 1_000_000),
+        "pid": os.getpid(), "tid": threading.get_ident(), "args": args,
+    })
+
+def pause(seconds, reason="pause"):
+    """time.sleep() that shows up on the timeline"""
+    with span("sleep", "sleep", seconds=seconds, reason=reason):
+        time.sleep(seconds)
+
+# --- Conversion ---
+
+def jsonl_to_chrome(src, dest):
+    """Convert a JSONL trace into a Chrome trace JSON file"""
+    with open(src, encoding="utf-8") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    with open(dest, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return len(events)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python tracing.py trace.jsonl trace.json")
+        sys.exit(1)
+    print(f"✅ Wrote {jsonl_to_chrome(sys.argv[1], sys.argv[2])} events to {sys.argv[2]}")
@@ -0,0 +1,144 @@
+# user_admin.py - BULK USER PROVISIONING & EXPORT
+#
+# Usage:
+#   python user_admin.py import users.csv      (columns: name,email,username,password)
+#   python user_admin.py import users.jsonl    (one {"name", "email", "username", "password"} per line)
+#   python user_admin.py export users.jsonl    (or .csv; passwords are never exported)
+import os
+import sys
+import csv
+import json
+from concurrent.futures import ThreadPoolExecutor
+import database as db
+from voice_auth import validate_name, validate_email, validate_password
+
+IMPORT_CHUNK_SIZE = 500
+EXPORT_FIELDS = ["id", "name", "email", "username", "created_at", "last_login"]
+
+def read_user_rows(path):
+    """Yield (line_number, row_dict) from a CSV or JSONL file"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            for line_number, line in enumerate(f, start=1):
+                if line.strip():
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError as e:
+                        row = {"_error": f"invalid JSON: {e.msg}"}
+                    if not isinstance(row, dict):
+                        row = {"_error": "not a JSON object"}
+                    yield line_number, row
+        else:
+            # Header is line 1, so data starts at line 2
+            for line_number, row in enumerate(csv.DictReader(f), start=2):
+                yield line_number, row
+
+def _field(row, key):
+    """A column as text; JSONL values may be numbers"""
+    value = row.get(key)
+    return "" if value is None else str(value)
+
+def normalize_user(row):
+    """
+    Apply the same clean-up as the voice registration flow and validate.
+    Returns ((name, email, username, password), None) or (None, reason).
+    """
+    if not isinstance(row, dict):
+        return None, "not a JSON object"
+    if "_error" in row:
+        return None, row["_error"]
+    name = _field(row, "name").strip()
+    email = _field(row, "email").strip().lower()
+    # Voice registration and login strip spaces and lowercase these two
+    username = _field(row, "username").replace(" ", "").lower()
+    password = _field(row, "password").replace(" ", "").lower()
+
+    if not validate_name(name):
+        return None, "invalid name"
+    if not validate_email(email):
+        return None, "invalid email"
+    if not username:
+        return None, "missing username"
+    if not validate_password(password):
+        return None, "password too weak or too short"
+    return (name, email, username, password), None
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def bulk_import_users(path, chunk_size=IMPORT_CHUNK_SIZE, workers=None):
+    """
+    Import users from CSV/JSONL. Passwords are hashed in parallel and rows are
+    inserted one transaction per chunk. Bad or duplicate rows are reported
+    individually instead of aborting the import.
+    Returns {"inserted": int, "rejected": [(line_number, username, reason), ...]}.
+    """
+    db.init_db()
+    report = {"inserted": 0, "rejected": []}
+    iterations = db.get_iterations()
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for chunk in _chunks(read_user_rows(path), chunk_size):
+            valid = []
+            for line_number, row in chunk:
+                user, reason = normalize_user(row)
+                if user is None:
+                    report["rejected"].append((line_number, row.get("username"), reason))
+                else:
+                    valid.append((line_number, user))
+
+            # PBKDF2 releases the GIL, so threads hash on all cores
+            hashes = pool.map(lambda item: db.hash_password(item[1][3], iterations), valid)
+            rows = [(name, email, username, hashed)
+                    for (_, (name, email, username, _)), hashed in zip(valid, hashes)]
+
+            inserted, conflicts = db.add_users_bulk(rows)
+            report["inserted"] += inserted
+            for index, reason in conflicts:
+                line_number, user = valid[index]
+                report["rejected"].append((line_number, user[2], reason))
+
+            print(f"   ... {report['inserted']} inserted, {len(report['rejected'])} rejected")
+
+    return report
+
+def export_users(path, batch_size=1000):
+    """Stream every user to CSV/JSONL without loading the table into memory"""
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            for user in db.iter_users(batch_size):
+                f.write(json.dumps(user) + "\n")
+                count += 1
+        else:
+            writer = csv.DictWriter(f, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            for user in db.iter_users(batch_size):
+                writer.writerow(user)
+                count += 1
+    return count
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] not in ("import", "export"):
+        print("Usage: python user_admin.py import|export <file.csv|file.jsonl>")
+        sys.exit(1)
+
+    command, path = sys.argv[1], sys.argv[2]
+    if command == "import":
+        print(f"\n📥 Importing users from {path}")
+        report = bulk_import_users(path)
+        print(f"\n✅ Inserted: {report['inserted']}")
+        if report["rejected"]:
+            print(f"⚠️ Rejected: {len(report['rejected'])}")
+            for line_number, username, reason in report["rejected"]:
+                print(f"   line {line_number}: {username or '-'} -> {reason}")
+    else:
+        print(f"\n📤 Exporting users to {path}")
+        print(f"✅ Exported {export_users(path)} users")
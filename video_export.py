@@ -0,0 +1,140 @@
+# video_export.py - ANNOTATED VIDEO & SUBTITLE EXPORT
+import os
+import queue
+import datetime
+import threading
+import cv2
+
+EXPORT_DIR = "exports"
+EXPORT_QUEUE_FRAMES = 64  # frames buffered for the writer thread (~64 x frame size in RAM)
+MAX_PAD_SECONDS = 1.0     # longer source gaps are treated as seeks, not padded
+_SEEK = object()          # queue marker: the next frame follows a voice seek
+
+def _timestamp(seconds, separator):
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+def format_webvtt(cues, fps):
+    """cues: [[first_frame, last_frame, message], ...] -> WebVTT text"""
+    lines = ["WEBVTT", ""]
+    for number, (first, last, message) in enumerate(cues, start=1):
+        lines += [str(number), f"{_timestamp(first / fps, '.')} --> {_timestamp((last + 1) / fps, '.')}", message, ""]
+    return "\n".join(lines)
+
+def format_srt(cues, fps):
+    lines = []
+    for number, (first, last, message) in enumerate(cues, start=1):
+        lines += [str(number), f"{_timestamp(first / fps, ',')} --> {_timestamp((last + 1) / fps, ',')}", message, ""]
+    return "\n".join(lines)
+
+class AnalysisExporter:
+    """
+    Writes the annotated frames of one analysis to an MP4 plus WebVTT/SRT
+    subtitles of the feedback messages. add() only enqueues; colour conversion,
+    encoding and disk writes happen on a background thread. The queue is
+    bounded, so a slow disk makes analysis wait instead of buffering frames
+    without limit. A seek starts a new segment of the output instead of
+    filling the skipped span; segments lists (output_frame, source_frame) for
+    each of them.
+    """
+
+    def __init__(self, video_name, fps, frame_size, export_dir=EXPORT_DIR, queue_frames=EXPORT_QUEUE_FRAMES):
+        os.makedirs(export_dir, exist_ok=True)
+        stem = os.path.splitext(os.path.basename(video_name))[0]
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.base_path = os.path.join(export_dir, f"{stem}_annotated_{stamp}")
+        self.video_path = self.base_path + ".mp4"
+        self.fps = fps
+        self.frame_size = frame_size  # (width, height)
+        self.cues = []
+        self.frames_written = 0
+        self.segments = []
+        self.error = None
+        self._queue = queue.Queue(maxsize=queue_frames)
+        self._thread = threading.Thread(target=self._run, name="visionmate-export", daemon=True)
+        self._thread.start()
+
+    def add(self, frame_index, frame_rgb, message):
+        """Queue one annotated RGB frame (blocks while the writer is EXPORT_QUEUE_FRAMES behind)"""
+        if self.error is None:
+            self._queue.put((frame_index, frame_rgb, message))
+
+    def seek(self):
+        """The next frame added comes from a seek (voice navigation), not from the frame after the last"""
+        if self.error is None:
+            self._queue.put(_SEEK)
+
+    def close(self):
+        """Flush queued frames, finish the video and write the subtitle files"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+        self._thread.join()
+        with open(self.base_path + ".vtt", "w", encoding="utf-8") as f:
+            f.write(format_webvtt(self.cues, self.fps))
+        with open(self.base_path + ".srt", "w", encoding="utf-8") as f:
+            f.write(format_srt(self.cues, self.fps))
+        if self.error:
+            print(f"⚠️ Export stopped early: {self.error}")
+        print(f"💾 Exported {self.frames_written} frames in {len(self.segments)} segment(s) to {self.video_path}")
+        return {"video": self.video_path, "vtt": self.base_path + ".vtt", "srt": self.base_path + ".srt",
+                "segments": self.segments}
+
+    def _add_cue(self, frame_index, message):
+        if self.cues and self.cues[-1][2] == message:
+            self.cues[-1][1] = frame_index
+        else:
+            self.cues.append([frame_index, frame_index, message])
+
+    def _run(self):
+        writer = None
+        last_frame = None
+        new_segment = True
+        max_pad = int(MAX_PAD_SECONDS * self.fps)
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                if item is _SEEK:
+                    new_segment = True
+                    continue
+                frame_index, frame_rgb, message = item
+                if writer is None:
+                    writer = cv2.VideoWriter(self.video_path, cv2.VideoWriter_fourcc(*"mp4v"), self.fps, self.frame_size)
+                    if not writer.isOpened():
+                        raise OSError(f"cannot open {self.video_path} for writing")
+                frame = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR)
+                if frame.shape[1::-1] != tuple(self.frame_size):
+                    frame = cv2.resize(frame, self.frame_size)
+                # Source frame that would continue the current segment
+                expected = self.segments[-1][1] + self.frames_written - self.segments[-1][0] if self.segments else None
+                if not new_segment and expected is not None and not 0 <= frame_index - expected <= max_pad:
+                    new_segment = True  # a jump nobody announced
+                if new_segment:
+                    self.segments.append((self.frames_written, frame_index))
+                    new_segment = False
+                else:
+                    # Small gaps (dropped frames) are filled with the previous frame so
+                    # the video timeline (and subtitle timestamps) stay frame-accurate
+                    for _ in range(frame_index - expected):
+                        writer.write(last_frame)
+                        self.frames_written += 1
+                writer.write(frame)
+                self.frames_written += 1
+                last_frame = frame
+                # Cues follow the output timeline (voice seeks can jump within the source)
+                self._add_cue(self.frames_written - 1, message)
+        except Exception as e:
+            self.error = str(e)
+            # Unblock producers waiting on a full queue
+            while True:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    break
+        finally:
+            if writer is not None:
+                writer.release()
@@ -1,20 +1,22 @@
 # vision_core.py
 import streamlit as st
 import numpy as np
-from ultralytics import YOLO
 from audio_utils import play_audio
 
 # --- Model Loading and Detection Extraction ---
 
 @st.cache_resource
 def load_model():
-    # 1. Load the model using the correct standard name: best.pt
-    MODEL_PATH = "fine_tuned_weights/best.pt"
-    
-    # Load the specialized YOLOv8 model
-    model = YOLO(MODEL_PATH) 
-    
-    return model
+    """
+    The active model from the registry (fine_tuned_weights/best.pt until
+    another version is registered). The returned handle is called like a YOLO
+    model and switches to a newly activated version between frames.
+    """
+    # Imported here so the feedback logic can be used (replays, benchmarks)
+    # without loading torch
+    from model_registry import ModelHandle
+
+    return ModelHandle()
 
 def extract_yolov8_data(results):
     """
@@ -37,15 +39,32 @@ def extract_yolov8_data(results):
 
 # --- Core Feedback Generation Logic ---
 
+def _cue(category, message, top_detection=None):
+    """Structured form of a feedback decision (used for earcons and logging)"""
+    return {
+        "category": category,
+        "message": message,
+        "label": top_detection["label"] if top_detection else None,
+        "direction": top_detection["direction"] if top_detection else None,
+        "proximity": top_detection["proximity"] if top_detection else None,
+    }
+
 def generate_feedback(results, detections, frame_width, frame_height):
     """
     Analyzes YOLO results to generate prioritized, actionable, and detailed audio feedback,
     including critical hazard warnings and comprehensive navigational cues.
     """
+    return feedback_cue(results, detections, frame_width, frame_height)["message"]
+
+def feedback_cue(results, detections, frame_width, frame_height):
+    """
+    Same decision as generate_feedback(), returned as a dict with the message,
+    its category and the direction/proximity of the object that triggered it.
+    """
     labels = results.names
     
     if detections is None or len(detections) == 0:
-        return "Path clear. Proceeding."
+        return _cue("clear", "Path clear. Proceeding.", None)
 
     # 1. Define Priority Categories (Updated for Navigational Path)
     CRITICAL_HAZARDS = [
@@ -115,7 +134,7 @@ def generate_feedback(results, detections, frame_width, frame_height):
 
     # 2. Select the Top Priority Hazard/Object
     if not prioritized_detections:
-        return "Path clear. Proceeding."
+        return _cue("clear", "Path clear. Proceeding.", None)
 
     prioritized_detections.sort(key=lambda x: x['score'], reverse=True)
     top_detection = prioritized_detections[0]
@@ -125,13 +144,13 @@ def generate_feedback(results, detections, frame_width, frame_height):
     # --- A. IMMEDIATE STOP / TRAFFIC CONTROL LOGIC (Highest Priority) ---
     
     if top_detection['label'] in TRAFFIC_CONTROL or top_detection['label'] == "red_light":
-        return f"🛑 STOP! Traffic signal is RED {top_detection['direction']}."
+        return _cue("stop_signal", f"🛑 STOP! Traffic signal is RED {top_detection['direction']}.", top_detection)
 
     if top_detection['is_critical'] and top_detection['proximity'] == "VERY CLOSE":
-        return f"🚨 EXTREME WARNING! {top_detection['label']} {top_detection['direction']}! STOP NOW!"
+        return _cue("extreme", f"🚨 EXTREME WARNING! {top_detection['label']} {top_detection['direction']}! STOP NOW!", top_detection)
         
     if top_detection['requires_stop'] and top_detection['proximity'] in ["VERY CLOSE", "nearby"]:
-        return f"HAZARD ALERT: {top_detection['label']} {top_detection['direction']} and {top_detection['proximity']}."
+        return _cue("hazard", f"HAZARD ALERT: {top_detection['label']} {top_detection['direction']} and {top_detection['proximity']}.", top_detection)
 
     # --- B. PATH CONFIRMATION AND TURN GUIDANCE (Focusing on Sequence) ---
 
@@ -141,34 +160,34 @@ def generate_feedback(results, detections, frame_width, frame_height):
         
         # Check if the path is clear ahead to suggest approaching the turn
         if not has_red_signal and not top_detection['requires_stop']:
-            return f"Navigation: Approach the turn. An {top_detection['label']} is {top_detection['direction']}. Prepare to turn {turn_direction}."
+            return _cue("turn", f"Navigation: Approach the turn. An {top_detection['label']} is {top_detection['direction']}. Prepare to turn {turn_direction}.", top_detection)
 
     # 2. Bridge Guidance
     if top_detection['label'] == "bridge":
         if top_detection['proximity'] == "VERY CLOSE":
-             return f"Structural update: Entering bridge now. Maintain steady path."
+             return _cue("bridge", f"Structural update: Entering bridge now. Maintain steady path.", top_detection)
         elif top_detection['proximity'] == "nearby":
-             return f"Attention! Approaching bridge {top_detection['direction']}."
+             return _cue("bridge", f"Attention! Approaching bridge {top_detection['direction']}.", top_detection)
         
     # 3. Crosswalk Guidance
     if top_detection['label'] == "crosswalk":
         if has_green_signal:
-            return f"Navigation update: Clear to proceed. Crosswalk {top_detection['direction']}."
+            return _cue("crosswalk_go", f"Navigation update: Clear to proceed. Crosswalk {top_detection['direction']}.", top_detection)
         else:
-            return f"Crosswalk detected. Wait for signal or verbal confirmation."
+            return _cue("crosswalk_wait", f"Crosswalk detected. Wait for signal or verbal confirmation.", top_detection)
 
     # 4. Path Confirmation
     if not has_sidewalk_or_blind_road:
         # If we can't detect the path, warn the user
-        return "Guidance Note: Path (sidewalk/blind road) not detected. Proceed with caution."
+        return _cue("no_path", "Guidance Note: Path (sidewalk/blind road) not detected. Proceed with caution.", top_detection)
 
     # --- C. PROCEED / ALL CLEAR LOGIC (Lowest Priority) ---
     
     if has_green_signal:
-        return "Proceed. Green light ahead."
+        return _cue("go", "Proceed. Green light ahead.", top_detection)
         
     # Announce the highest score item if it's not critical but provides context (e.g., 'tree')
     if top_detection['proximity'] == "nearby":
-         return f"Path context: A {top_detection['label']} is {top_detection['direction']}."
+         return _cue("context", f"Path context: A {top_detection['label']} is {top_detection['direction']}.", top_detection)
          
-    return "Path clear. Proceeding safely."
\ No newline at end of file
+    return _cue("clear", "Path clear. Proceeding safely.", top_detection)
\ No newline at end of file
@@ -0,0 +1,144 @@
+# voice_flow.py - DECLARATIVE VOICE STATE MACHINE
+import time
+import streamlit as st
+from audio_utils import play_audio, listen_for_voice, listen_for_command, prefetch_speech
+from intents import route, state_phrases
+import tracing
+
+# State name -> state spec. Modules declare their states as data and register
+# them here; run_state() interprets the spec.
+#
+# State spec keys:
+#   "ui"        list of (css_class, template) boxes shown on entry
+#   "prompt"    template spoken on entry (interruptible, so users can barge in)
+#   "listen"    "command" (offline grammar from the intent registry) or "dictation"
+#   "intents"   {intent: transition} for recognised commands
+#   "no_match"  transition when a command state hears something else
+#   "no_input"  transition when nothing was recognised
+# Dictation states additionally use:
+#   "clean"     callable normalising the transcript (default: strip)
+#   "validate"  callable returning True for acceptable values
+#   "invalid"   transition when validation fails
+#   "store"     key in st.session_state.tmp that receives the value
+#   "accepted"  transition after storing (or "action": callable(value) -> transition)
+#
+# Transition keys (all optional):
+#   "ui"     (css_class, template) box to show     "say"    template to speak
+#   "run"    callable() for side effects           "tmp"    "reset" | "new_flow"
+#   "next"   state to enter (default: stay)        "pause"  seconds to wait before rerun
+#   "rerun"  False to return instead of st.rerun()
+#
+# Templates are formatted with st.session_state.tmp, plus "value" (the cleaned
+# answer) and "<key>_title" variants of every text value.
+FLOW = {}
+
+def register_states(states):
+    FLOW.update(states)
+
+# --- Template Rendering ---
+
+def _context(value=None):
+    context = dict(st.session_state.tmp)
+    if value is not None:
+        context["value"] = value
+    for key, item in list(context.items()):
+        if isinstance(item, str):
+            context[f"{key}_title"] = item.title()
+    return context
+
+def literal(text):
+    """Escape runtime text (database messages, user input) for use as a template"""
+    return str(text).replace("{", "{{").replace("}", "}}")
+
+class _Blanks(dict):
+    def __missing__(self, key):
+        return ""
+
+def render(template, context):
+    """Fill a template; values we do not have yet are left blank"""
+    return template.format_map(_Blanks(context))
+
+def render_complete(template, context):
+    """Fill a template; None if it needs values we do not have yet"""
+    try:
+        return template.format_map(context)
+    except (KeyError, IndexError):
+        return None
+
+# --- Prefetching ---
+
+def likely_prompts(name, context):
+    """Texts the user is likely to hear next from this state, renderable now"""
+    spec = FLOW[name]
+    transitions = list(spec.get("intents", {}).values())
+    transitions += [spec.get(key) for key in ("no_match", "no_input", "invalid", "accepted")]
+    texts = []
+    for transition in filter(None, transitions):
+        if transition.get("say"):
+            texts.append(render_complete(transition["say"], context))
+        target = FLOW.get(transition.get("next"))
+        if target and target.get("prompt"):
+            texts.append(render_complete(target["prompt"], context))
+    return [text for text in texts if text]
+
+# --- Interpreter ---
+
+def apply_transition(transition, value=None):
+    context = _context(value)
+    if transition.get("ui"):
+        css_class, template = transition["ui"]
+        st.markdown(f'<div class="{css_class}">{render(template, context)}</div>', unsafe_allow_html=True)
+    if transition.get("run"):
+        transition["run"]()
+    if transition.get("say"):
+        play_audio(render(transition["say"], context))
+    if transition.get("tmp") == "reset":
+        st.session_state.tmp = {}
+    elif transition.get("tmp") == "new_flow":
+        st.session_state.tmp = {"flow_started": time.time()}
+    if transition.get("next"):
+        st.session_state.state = transition["next"]
+    if transition.get("pause"):
+        tracing.pause(transition["pause"], "transition")
+    if transition.get("rerun", True):
+        st.rerun()
+
+def run_state(name):
+    """Render, prompt, listen and transition for one voice state"""
+    tracing.set_context(state=name)
+    with tracing.span(f"state.{name}", "state"):
+        _run_state(name)
+
+def _run_state(name):
+    spec = FLOW[name]
+    context = _context()
+    for css_class, template in spec.get("ui", []):
+        st.markdown(f'<div class="{css_class}">{render(template, context)}</div>', unsafe_allow_html=True)
+
+    if spec.get("prompt"):
+        play_audio(render(spec["prompt"], context), interruptible=True)
+
+    # Synthesize the likely next prompts while the user is answering
+    prefetch_speech(likely_prompts(name, context))
+
+    if spec.get("listen") == "command":
+        heard = listen_for_command(commands=state_phrases(name))
+    else:
+        heard = listen_for_voice()
+    if not heard:
+        return apply_transition(spec.get("no_input", {}))
+
+    intent, _ = route(name, heard)
+    if intent in spec.get("intents", {}):
+        return apply_transition(spec["intents"][intent])
+    if spec.get("listen") == "command":
+        return apply_transition(spec.get("no_match", {}))
+
+    value = spec.get("clean", str.strip)(heard)
+    if spec.get("validate") and not spec["validate"](value):
+        return apply_transition(spec["invalid"], value)
+    if spec.get("store"):
+        st.session_state.tmp[spec["store"]] = value
+    if spec.get("action"):
+        return apply_transition(spec["action"](value), value)
+    return apply_transition(spec["accepted"], value)
@@ -0,0 +1,243 @@
+# voice_listener.py - PERSISTENT BACKGROUND MICROPHONE LISTENER
+import time
+import threading
+import queue
+import collections
+import numpy as np
+import speech_recognition as sr
+import tracing
+
+# numpy sample types for the widths produced by sr.Microphone / sr.AudioFile
+SAMPLE_DTYPES = {1: np.uint8, 2: "<i2", 4: "<i4"}
+ECHO_PERCENTILE = 90  # echo level of a prompt: loud enough to ignore the silence before playback starts
+
+def chunk_energy(chunk, sample_width):
+    """Root-mean-square energy of a raw PCM chunk"""
+    samples = np.frombuffer(chunk, dtype=SAMPLE_DTYPES[sample_width]).astype(np.float64)
+    if sample_width == 1:
+        samples -= 128.0  # 8-bit WAV is unsigned
+    if samples.size == 0:
+        return 0.0
+    return float(np.sqrt(np.mean(samples * samples)))
+
+class BackgroundListener:
+    """
+    Keeps one audio source open on a daemon thread, tracks a rolling ambient
+    noise estimate and pushes every detected utterance (sr.AudioData) onto a queue.
+
+    source_factory returns an sr.AudioSource; pass e.g.
+    lambda: sr.AudioFile("fixture.wav") to drive the listener from a recording.
+    """
+
+    def __init__(self, source_factory=sr.Microphone, energy_ratio=2.0, energy_floor=100,
+                 calibration_seconds=0.5, ambient_alpha=0.05, pause_threshold=0.8,
+                 pre_roll_seconds=0.3, min_phrase_seconds=0.3, phrase_time_limit=20,
+                 max_pending=8, echo_probe_seconds=1.2, barge_in_ratio=2.5, barge_in_min_seconds=0.25,
+                 echo_tail_seconds=0.5, clock=time.monotonic):
+        self.source_factory = source_factory
+        self.energy_ratio = energy_ratio
+        self.energy_floor = energy_floor
+        self.calibration_seconds = calibration_seconds
+        self.ambient_alpha = ambient_alpha
+        self.pause_threshold = pause_threshold
+        self.pre_roll_seconds = pre_roll_seconds
+        self.min_phrase_seconds = min_phrase_seconds
+        self.phrase_time_limit = phrase_time_limit
+        self.echo_probe_seconds = echo_probe_seconds
+        self.barge_in_ratio = barge_in_ratio
+        self.barge_in_min_seconds = barge_in_min_seconds
+        self.echo_tail_seconds = echo_tail_seconds
+        self.clock = clock  # replaceable so recorded fixtures can run on stream time
+
+        self.ambient_energy = None
+        self.error = None
+        self.utterances = queue.Queue(maxsize=max_pending)
+        self._queue_lock = threading.Lock()  # producer puts vs. discard_before's drain and requeue
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # Prompt playback state used for barge-in and echo gating
+        self.prompt_text = None
+        self.prompt_started_at = 0.0
+        self.prompt_until = 0.0
+        self.speech_started = threading.Event()
+
+    # --- Public API ---
+
+    @property
+    def energy_threshold(self):
+        if self.ambient_energy is None:
+            return self.energy_floor
+        return max(self.energy_floor, self.ambient_energy * self.energy_ratio)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return self
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="visionmate-listener", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=2):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def get_utterance(self, timeout=None):
+        """Next captured utterance, or None if nothing was heard within timeout"""
+        try:
+            return self.utterances.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def clear(self):
+        """Drop every pending utterance"""
+        self.discard_before(float("inf"))
+
+    def discard_before(self, timestamp):
+        """Drop utterances that started before timestamp (on the listener clock)"""
+        with self._queue_lock:
+            kept = []
+            while True:
+                try:
+                    audio = self.utterances.get_nowait()
+                except queue.Empty:
+                    break
+                if audio.started_at >= timestamp:
+                    kept.append(audio)
+            for audio in kept:
+                self.utterances.put_nowait(audio)
+
+    # --- Barge-in ---
+
+    def begin_prompt(self, text, duration):
+        """Announce that a prompt is playing so its echo is not taken for speech"""
+        now = self.clock()
+        self.prompt_text = text
+        self.prompt_started_at = now
+        self.prompt_until = now + duration + self.echo_tail_seconds
+        self.speech_started.clear()
+
+    def end_prompt(self):
+        """The prompt was cut off early: stop gating after the echo tail"""
+        self.prompt_until = min(self.prompt_until, self.clock() + self.echo_tail_seconds)
+
+    def prompt_active(self):
+        return self.clock() < self.prompt_until
+
+    def wait_for_speech(self, timeout):
+        """Block until the user starts talking over the prompt, or timeout passes"""
+        return self.speech_started.wait(timeout)
+
+    # --- Capture Loop ---
+
+    def _run(self):
+        try:
+            with self.source_factory() as source:
+                self._capture(source)
+        except Exception as e:
+            self.error = e
+            print(f"❌ Background listener stopped: {e}")
+
+    def _capture(self, source):
+        rate, width, chunk_size = source.SAMPLE_RATE, source.SAMPLE_WIDTH, source.CHUNK
+        chunk_seconds = chunk_size / rate
+        pre_roll = collections.deque(maxlen=max(1, int(self.pre_roll_seconds / chunk_seconds)))
+
+        calibration = []
+        calibration_chunks = int(self.calibration_seconds / chunk_seconds)
+        frames = []
+        speech_seconds = 0.0
+        silence_seconds = 0.0
+        loud_seconds = 0.0
+        onset = 0.0
+        onset_prompt = None
+        echo_prompt_started = None
+        echo_energies = []
+        calibration_started = time.time()
+
+        while not self._stop_event.is_set():
+            chunk = source.stream.read(chunk_size)
+            if not chunk:
+                break  # end of a recorded fixture
+            energy = chunk_energy(chunk, width)
+
+            # Seed the ambient estimate before any speech can be detected
+            if len(calibration) < calibration_chunks:
+                calibration.append(energy)
+                self.ambient_energy = float(np.mean(calibration))
+                pre_roll.append(chunk)
+                if len(calibration) == calibration_chunks:
+                    tracing.record("listener.calibrate", "voice", calibration_started,
+                                   time.time() - calibration_started, ambient_energy=self.ambient_energy)
+                continue
+
+            # While a prompt plays, learn its echo level first and then only
+            # accept speech clearly louder than the loudspeaker. The browser
+            # fetches and starts the audio some time after begin_prompt(), so
+            # the probe spans the start of playback and takes a high percentile.
+            threshold = self.energy_threshold
+            prompt_active = self.prompt_active()
+            if prompt_active:
+                if echo_prompt_started != self.prompt_started_at:
+                    echo_prompt_started, echo_energies = self.prompt_started_at, []
+                if self.clock() - self.prompt_started_at < self.echo_probe_seconds:
+                    echo_energies.append(energy)
+                    pre_roll.append(chunk)
+                    continue
+                if echo_energies:
+                    threshold = max(threshold, float(np.percentile(echo_energies, ECHO_PERCENTILE)) * self.barge_in_ratio)
+
+            if not frames:
+                if energy > threshold:
+                    frames = list(pre_roll) + [chunk]
+                    speech_seconds, silence_seconds = chunk_seconds, 0.0
+                    loud_seconds = chunk_seconds
+                    onset = self.clock()
+                    onset_prompt = self.prompt_text if prompt_active else None
+                    if not prompt_active or loud_seconds >= self.barge_in_min_seconds:
+                        self.speech_started.set()
+                else:
+                    if not prompt_active:
+                        self._update_ambient(energy)
+                    pre_roll.append(chunk)
+                continue
+
+            frames.append(chunk)
+            speech_seconds += chunk_seconds
+            silence_seconds = 0.0 if energy > threshold else silence_seconds + chunk_seconds
+            loud_seconds = loud_seconds + chunk_seconds if energy > threshold else 0.0
+            # Barge-in needs sustained speech: a click or an echo spike does not cut the prompt off
+            if loud_seconds >= self.barge_in_min_seconds:
+                self.speech_started.set()
+
+            if silence_seconds >= self.pause_threshold or speech_seconds >= self.phrase_time_limit:
+                self._emit(frames, speech_seconds - silence_seconds, rate, width, onset, onset_prompt)
+                frames = []
+                pre_roll.clear()
+
+        if frames:
+            self._emit(frames, speech_seconds - silence_seconds, rate, width, onset, onset_prompt)
+
+    def _update_ambient(self, energy):
+        if self.ambient_energy is None:
+            self.ambient_energy = energy
+        else:
+            self.ambient_energy += self.ambient_alpha * (energy - self.ambient_energy)
+
+    def _emit(self, frames, voiced_seconds, rate, width, onset, prompt_text):
+        if voiced_seconds < self.min_phrase_seconds:
+            return  # clicks and bumps, not speech
+        audio = sr.AudioData(b"".join(frames), rate, width)
+        audio.started_at = onset
+        audio.prompt_text = prompt_text  # set when the user barged in over a prompt
+        with self._queue_lock:
+            if self.utterances.full():
+                try:
+                    self.utterances.get_nowait()  # keep the most recent speech
+                except queue.Empty:
+                    pass
+            self.utterances.put_nowait(audio)